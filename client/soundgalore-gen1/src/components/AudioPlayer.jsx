@@ -205,6 +205,10 @@ export default function AudioPlayer({post, isActive, onPlay}) {
                     ref={imageRef}
                     src={imageUrl}
                     alt={post?.title || "Post image"}
+                    width={post?.image_width || undefined}
+                    height={post?.image_height || undefined}
+                    loading="lazy"
+                    decoding="async"
                     style={{maxWidth: "100%", height: "auto"}}
                 />
             </div>
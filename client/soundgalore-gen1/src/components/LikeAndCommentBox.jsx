@@ -1,11 +1,28 @@
 import { useEffect, useRef, useState } from "react";
 import CommentBody from "../components/CommentBody";
 import UserBadge from "../components/UserBadge";
+import { subscribeToPost } from "../liveEvents";
+
+// Apply `update` to the comment with `commentId`, wherever it sits in the threads.
+const updateComment = (comments, commentId, update) =>
+    comments.map((comment) => {
+        if (comment.id === commentId) {
+            return update(comment);
+        }
+
+        if (comment.replies) {
+            return { ...comment, replies: updateComment(comment.replies, commentId, update) };
+        }
+
+        return comment;
+    });
 
 export default function LikeAndCommentBox({ post }) {
     const [postLiked, setPostLiked] = useState(false);
     const [postLikeCount, setPostLikeCount] = useState(0);
     const [comments, setComments] = useState([]);
+    const [commentCount, setCommentCount] = useState(0);
+    const [nextCommentsCursor, setNextCommentsCursor] = useState(null);
     const [showCommentBox, setShowCommentBox] = useState(false);
     const [commentText, setCommentText] = useState("");
     const [commentsModalOpen, setCommentsModalOpen] = useState(false);
@@ -36,6 +53,8 @@ export default function LikeAndCommentBox({ post }) {
                 const data = await res.json();
 
                 setComments(data.comments || []);
+                setCommentCount(data.post_comment_count ?? (data.comments || []).length);
+                setNextCommentsCursor(data.next_cursor || null);
                 setPostLiked(data.post_liked_by_current_user);
                 setPostLikeCount(data.post_like_count);
             } catch (err) {
@@ -49,6 +68,34 @@ export default function LikeAndCommentBox({ post }) {
         }
     }, [post?.id]);
 
+    useEffect(() => {
+        if (!post?.id) return;
+
+        return subscribeToPost(post.id, (type, data) => {
+            if (type === "post_likes") {
+                setPostLikeCount(data.like_count);
+            } else if (type === "comment_created" || type === "comment_deleted") {
+                setCommentCount(data.comment_count);
+            }
+
+            if (type === "comment_deleted") {
+                const removeComment = (list) =>
+                    list
+                        .filter((comment) => comment.id !== data.comment_id)
+                        .map((comment) => ({
+                            ...comment,
+                            reply_count:
+                                comment.id === data.parent_id
+                                    ? comment.reply_count - 1
+                                    : comment.reply_count,
+                            ...(comment.replies && { replies: removeComment(comment.replies) }),
+                        }));
+
+                setComments(removeComment);
+            }
+        });
+    }, [post?.id]);
+
     useEffect(() => {
         if (!commentsModalOpen) return;
 
@@ -87,6 +134,32 @@ export default function LikeAndCommentBox({ post }) {
         }
     };
 
+    const loadMoreComments = async () => {
+        if (!nextCommentsCursor) return;
+
+        try {
+            const res = await fetch(
+                `/api/posts/${post.id}/comments?cursor=${encodeURIComponent(nextCommentsCursor)}`,
+                {
+                    method: "GET",
+                    credentials: "include",
+                }
+            );
+
+            if (!res.ok) {
+                throw new Error(`HTTP ${res.status}`);
+            }
+
+            const data = await res.json();
+
+            setComments((prev) => [...prev, ...(data.comments || [])]);
+            setNextCommentsCursor(data.next_cursor || null);
+        } catch (err) {
+            setError("Could not load more comments.");
+            console.error("Failed to load more comments: ", err);
+        }
+    };
+
     const handlePostLike = async () => {
         try {
             const res = await fetch(`/api/posts/${post.id}/like`, {
@@ -136,6 +209,7 @@ export default function LikeAndCommentBox({ post }) {
             const newComment = await res.json();
 
             setComments((prev) => [newComment, ...prev]);
+            setCommentCount((prev) => prev + 1);
             setCommentText("");
             setShowCommentBox(false);
             setCommentsModalOpen(true);
@@ -163,15 +237,11 @@ export default function LikeAndCommentBox({ post }) {
             const data = await res.json();
 
             setComments((prev) =>
-                prev.map((comment) =>
-                    comment.id === commentId
-                        ? {
-                              ...comment,
-                              liked_by_current_user: data.liked,
-                              like_count: data.like_count,
-                          }
-                        : comment
-                )
+                updateComment(prev, commentId, (comment) => ({
+                    ...comment,
+                    liked_by_current_user: data.liked,
+                    like_count: data.like_count,
+                }))
             );
         } catch (err) {
             setError("Could not like comment.");
@@ -179,6 +249,38 @@ export default function LikeAndCommentBox({ post }) {
         }
     };
 
+    const loadReplies = async (comment) => {
+        // Threads arrive with a preview of their replies and a cursor past it;
+        // deeper replies haven't been fetched at all yet.
+        const cursor = comment.replies ? comment.replies_cursor : null;
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+
+        try {
+            const res = await fetch(`/api/comments/${comment.id}/replies${query}`, {
+                method: "GET",
+                credentials: "include",
+            });
+
+            if (!res.ok) {
+                throw new Error(`HTTP ${res.status}`);
+            }
+
+            const data = await res.json();
+
+            setComments((prev) =>
+                updateComment(prev, comment.id, (current) => ({
+                    ...current,
+                    reply_count: data.reply_count,
+                    replies: [...(current.replies || []), ...(data.replies || [])],
+                    replies_cursor: data.next_cursor || null,
+                }))
+            );
+        } catch (err) {
+            setError("Could not load replies.");
+            console.error("Failed to load replies: ", err);
+        }
+    };
+
     const renderComment = (comment) => (
         <div className="comment" key={comment.id}>
             <UserBadge
@@ -199,6 +301,35 @@ export default function LikeAndCommentBox({ post }) {
         </div>
     );
 
+    const renderThread = (comment) => {
+        const replies = comment.replies || [];
+        const canExpand = comment.replies
+            ? Boolean(comment.replies_cursor)
+            : (comment.reply_count ?? 0) > 0;
+
+        return (
+            <div className="comment-thread" key={comment.id}>
+                {renderComment(comment)}
+
+                {(replies.length > 0 || canExpand) && (
+                    <div className="comment-replies">
+                        {replies.map(renderThread)}
+
+                        {canExpand && (
+                            <button
+                                type="button"
+                                className="comment-see-more"
+                                onClick={() => loadReplies(comment)}
+                            >
+                                View replies ({comment.reply_count - replies.length})
+                            </button>
+                        )}
+                    </div>
+                )}
+            </div>
+        );
+    };
+
     return (
         <div className="LikeAndCommentBox">
             <div className="like-comment-actions">
@@ -265,7 +396,7 @@ export default function LikeAndCommentBox({ post }) {
                     className="see-more-comments-button"
                     onClick={() => setCommentsModalOpen(true)}
                 >
-                    See comments {comments.length}
+                    See comments {commentCount}
                 </button>
             )}
 
@@ -297,8 +428,18 @@ export default function LikeAndCommentBox({ post }) {
                         </div>
 
                         <div className="comments-modal-list">
-                            {sortedComments.map(renderComment)}
+                            {sortedComments.map(renderThread)}
                         </div>
+
+                        {nextCommentsCursor && (
+                            <button
+                                type="button"
+                                className="see-more-comments-button"
+                                onClick={loadMoreComments}
+                            >
+                                Load more comments
+                            </button>
+                        )}
                     </section>
                 </div>
             )}
@@ -27,6 +27,8 @@ export default function UserBadge({
                     className="user-badge-image"
                     src={profileImageUrl}
                     alt={`${displayName}'s profile`}
+                    loading="lazy"
+                    decoding="async"
                 />
 
                 <div className="user-badge-text">
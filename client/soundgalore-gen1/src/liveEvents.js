@@ -0,0 +1,81 @@
+// Live updates from GET /api/events (Server-Sent Events).
+//
+// A page opens one stream with openLiveEvents() and handles the feed-level
+// events itself; post counters are handed on to whichever components called
+// subscribeToPost() for that post, so the page holds a single connection.
+
+// Matches EVENTS_MAX_POSTS on the server.
+export const MAX_LIVE_POSTS = 100;
+
+// How long to wait before reopening a stream the server refused (e.g. 503).
+const REOPEN_DELAY_MS = 10000;
+
+const FEED_EVENTS = ["post_created", "post_deleted", "followed", "unfollowed", "resync"];
+const POST_EVENTS = ["post_likes", "comment_created", "comment_deleted", "post_deleted"];
+
+const postListeners = new Map();
+
+export function subscribeToPost(postId, listener) {
+    if (!postListeners.has(postId)) {
+        postListeners.set(postId, new Set());
+    }
+
+    postListeners.get(postId).add(listener);
+
+    return () => {
+        const listeners = postListeners.get(postId);
+
+        listeners.delete(listener);
+
+        if (listeners.size === 0) {
+            postListeners.delete(postId);
+        }
+    };
+}
+
+function dispatchPostEvent(type, data) {
+    const listeners = postListeners.get(data.post_id);
+
+    if (!listeners) return;
+
+    listeners.forEach((listener) => listener(type, data));
+}
+
+// Opens the stream for `postIds` and calls onFeedEvent(type, data) for feed
+// events. Returns a function that closes it.
+export function openLiveEvents(postIds, onFeedEvent) {
+    const query = postIds.slice(-MAX_LIVE_POSTS).join(",");
+    let source = null;
+    let reopenTimer = null;
+    let closed = false;
+
+    const open = () => {
+        source = new EventSource(`/api/events?posts=${encodeURIComponent(query)}`, {
+            withCredentials: true,
+        });
+
+        FEED_EVENTS.forEach((type) => {
+            source.addEventListener(type, (e) => onFeedEvent(type, JSON.parse(e.data || "{}")));
+        });
+
+        POST_EVENTS.forEach((type) => {
+            source.addEventListener(type, (e) => dispatchPostEvent(type, JSON.parse(e.data)));
+        });
+
+        source.onerror = () => {
+            // The browser reconnects by itself unless the server answered with
+            // an error status; then it gives up and we try again later.
+            if (closed || source.readyState !== EventSource.CLOSED) return;
+
+            reopenTimer = setTimeout(open, REOPEN_DELAY_MS);
+        };
+    };
+
+    open();
+
+    return () => {
+        closed = true;
+        clearTimeout(reopenTimer);
+        source.close();
+    };
+}
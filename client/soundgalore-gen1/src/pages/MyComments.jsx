@@ -56,7 +56,7 @@ export default function MyComments() {
             const oldestComment = comments[comments.length - 1];
 
             const res = await fetch(
-                `/api/my_comments?before=${encodeURIComponent(oldestComment.created_at)}`,
+                `/api/my_comments?cursor=${encodeURIComponent(oldestComment.cursor)}`,
                 {
                     method: "GET",
                     credentials: "include",
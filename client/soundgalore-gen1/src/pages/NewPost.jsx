@@ -7,6 +7,58 @@ import Header from '../components/Header';
 import AudioRecorder from '../components/AudioRecorder';
 import CameraCapture from '../components/CameraCapture';
 
+// Audio above this size is sent in resumable chunks instead of one request.
+const CHUNKED_UPLOAD_THRESHOLD = 32 * 1024 * 1024;
+const CHUNKED_UPLOAD_MAX_PASSES = 6;
+
+async function uploadInChunks(file, mediaType) {
+    const sessionRes = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        credentials: 'include',
+        body: JSON.stringify({media_type: mediaType, filename: file.name, total_bytes: file.size}),
+    });
+
+    if (!sessionRes.ok) throw new Error(`Could not start upload: HTTP ${sessionRes.status}`);
+
+    let session = await sessionRes.json();
+
+    // Each pass re-sends whatever the server has not stored yet, so a dropped
+    // connection only costs the chunks that were in flight.
+    for (let pass = 0; session.missing_chunks.length > 0; pass++) {
+        if (pass >= CHUNKED_UPLOAD_MAX_PASSES) throw new Error('Upload kept failing; please try again.');
+
+        for (const index of session.missing_chunks) {
+            const start = index * session.chunk_size;
+
+            try {
+                await fetch(`/api/uploads/${session.id}/chunks/${index}`, {
+                    method: 'PUT',
+                    headers: {'Content-Type': 'application/octet-stream'},
+                    credentials: 'include',
+                    body: file.slice(start, start + session.chunk_size),
+                });
+            } catch (err) {
+                console.warn(`Chunk ${index} failed, will retry`, err);
+            }
+        }
+
+        const stateRes = await fetch(`/api/uploads/${session.id}`, {credentials: 'include'});
+        if (!stateRes.ok) throw new Error(`Upload was lost: HTTP ${stateRes.status}`);
+        session = await stateRes.json();
+    }
+
+    const finalizeRes = await fetch(`/api/uploads/${session.id}/finalize`, {
+        method: 'POST',
+        credentials: 'include',
+    });
+
+    if (!finalizeRes.ok) throw new Error(`Could not finish upload: HTTP ${finalizeRes.status}`);
+
+    const {media_id} = await finalizeRes.json();
+    return media_id;
+}
+
 export default function NewPost(){
     const[imageFile, setImageFile] = useState(null);
     const[audioFile, setAudioFile] = useState(null);
@@ -48,6 +100,28 @@ export default function NewPost(){
 
 
         try{
+            if (audioFile.size > CHUNKED_UPLOAD_THRESHOLD) {
+                const audio_media_id = await uploadInChunks(audioFile, 'audio');
+                const image_media_id = await uploadInChunks(imageFile, 'image');
+
+                const postRes = await fetch('/api/posts', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    credentials: 'include',
+                    body: JSON.stringify({title, description, audio_media_id, image_media_id}),
+                });
+
+                if (!postRes.ok) throw new Error(`Post creation failed: HTTP ${postRes.status}`);
+
+                const {id} = await postRes.json();
+                setImageFile(null);
+                setAudioFile(null);
+                setTitle('');
+                setDescription('');
+                navigate(`/new_post_successful`, { replace: true, state: {postId: id } });
+                return;
+            }
+
             // upload the title, image, audio and description at once
             const form = new FormData();
             form.append('title', title);
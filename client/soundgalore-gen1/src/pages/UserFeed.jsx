@@ -3,6 +3,7 @@ import Header from "../components/Header";
 import AudioPlayer from "../components/AudioPlayer";
 import LikeAndCommentBox from "../components/LikeAndCommentBox";
 import UserBadge from "../components/UserBadge";
+import { openLiveEvents } from "../liveEvents";
 
 const PAGE_SIZE = 20;
 
@@ -19,6 +20,54 @@ export default function UserFeed(){
     const headerWrapRef = useRef(null);
     const scrollEndTimerRef = useRef(null);
 
+    const fetchFeed = useCallback(async () => {
+        try {
+            const res = await fetch("/api/feed", {
+                method: "GET",
+                credentials: "include",
+            });
+
+            if (!res.ok) {
+                throw new Error(`Failed to fetch feed: HTTP ${res.status}`);
+            }
+
+            const data = await res.json();
+
+            setPosts(data);
+            setHasMorePosts(data.length >= PAGE_SIZE);
+
+            if (data.length > 0) {
+                setActivePostId((prev) => prev ?? data[0].id);
+            }
+        } catch (err) {
+            console.error("Failed to fetch feed: ", err);
+        }
+    }, []);
+
+    // Puts posts newer than the ones shown on top, keeping the rest in place.
+    const fetchNewPosts = useCallback(async () => {
+        try {
+            const res = await fetch("/api/feed", {
+                method: "GET",
+                credentials: "include",
+            });
+
+            if (!res.ok) {
+                throw new Error(`Failed to fetch new posts: HTTP ${res.status}`);
+            }
+
+            const data = await res.json();
+
+            setPosts((prev) => {
+                const existingIds = new Set(prev.map((post) => post.id));
+                const newPosts = data.filter((post) => !existingIds.has(post.id));
+                return [...newPosts, ...prev];
+            });
+        } catch (err) {
+            console.error("Failed to fetch new posts: ", err);
+        }
+    }, []);
+
     useEffect(() => {
         const fetchUser = async () => {
             try {
@@ -36,33 +85,6 @@ export default function UserFeed(){
             }
         };
 
-        const fetchFeed = async () => {
-            try {
-                const res = await fetch("/api/feed", {
-                    method: "GET",
-                    credentials: "include",
-                });
-
-                if (!res.ok) {
-                    throw new Error(`Failed to fetch feed: HTTP ${res.status}`);
-                }
-
-                const data = await res.json();
-
-                setPosts(data);
-
-                if (data.length < PAGE_SIZE) {
-                    setHasMorePosts(false);
-                }
-
-                if (data.length > 0) {
-                    setActivePostId(data[0].id);
-                }
-            } catch (err) {
-                console.error("Failed to fetch feed: ", err);
-            }
-        };
-
         fetchUser();
         fetchFeed();
 
@@ -71,7 +93,35 @@ export default function UserFeed(){
                 clearTimeout(scrollEndTimerRef.current);
             }
         };
-    }, []);
+    }, [fetchFeed]);
+
+    const handleLiveEvent = useCallback((type, data) => {
+        switch (type) {
+            case "post_created":
+            case "followed":
+                fetchNewPosts();
+                break;
+            case "post_deleted":
+                setPosts((prev) => prev.filter((post) => post.id !== data.post_id));
+                break;
+            case "unfollowed":
+                setPosts((prev) => prev.filter((post) => post.user_id !== data.followee_id));
+                break;
+            case "resync":
+                // Events were missed; start over from the first page.
+                fetchFeed();
+                break;
+            default:
+                break;
+        }
+    }, [fetchFeed, fetchNewPosts]);
+
+    // Reopened when the loaded posts change, so their counters stay live.
+    const livePostIds = posts.map((post) => post.id).join(",");
+
+    useEffect(() => {
+        return openLiveEvents(livePostIds ? livePostIds.split(",") : [], handleLiveEvent);
+    }, [livePostIds, handleLiveEvent]);
 
     const fetchMorePosts = useCallback(async () => {
         if (isLoadingMore || !hasMorePosts || posts.length === 0) return;
@@ -82,7 +132,7 @@ export default function UserFeed(){
             const oldestPost = posts[posts.length - 1];
 
             const res = await fetch(
-                `/api/feed?before=${encodeURIComponent(oldestPost.created_at)}`,
+                `/api/feed?cursor=${encodeURIComponent(oldestPost.cursor)}`,
                 {
                     method: "GET",
                     credentials: "include",
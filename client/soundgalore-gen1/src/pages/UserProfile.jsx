@@ -71,7 +71,7 @@ export default function UserProfile(){
             const oldestPost = posts[posts.length - 1];
 
             const res = await fetch(
-                `/api/user_profile/${userId}?before=${encodeURIComponent(oldestPost.created_at)}`,
+                `/api/user_profile/${userId}?cursor=${encodeURIComponent(oldestPost.cursor)}`,
                 {
                     method: "GET",
                     credentials: "include",
@@ -3,9 +3,8 @@ from __future__ import annotations
 
 import os
 import re
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
-from uuid import uuid4
 
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request, send_from_directory, url_for
@@ -17,14 +16,40 @@ from flask_login import (
     login_user,
     logout_user,
 )
+from sqlalchemy import inspect
 from sqlalchemy.exc import IntegrityError
-from werkzeug.utils import secure_filename
-
-from models import db, User, Post, Media, Comment, Like, Follow
-
-import smtplib
-from email.message import EmailMessage
-
+from werkzeug.routing import BaseConverter
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+
+from models import db, parse_id, User, Post, Media, Comment, Like, Follow
+import audio_pipeline  # noqa: F401  (registers job handlers)
+import blob_store
+import chunked_uploads
+import counters
+import cursors
+import db_engine
+import etags
+import events
+import feed_cache
+import image_pipeline  # noqa: F401  (registers job handlers)
+import jobs
+import mailer
+import media_gc
+import media_metadata  # noqa: F401  (registers job handlers)
+import media_serving
+import password_hashing
+import post_search
+import timeline
+import user_cache
+import user_search
+from db_routing import reads_from_replica
+from serializers import (
+    comment_threads_version,
+    posts_version,
+    serialize_comment_threads,
+    serialize_comments,
+    serialize_posts,
+)
 
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 
@@ -40,6 +65,21 @@ app = Flask(
     static_url_path="/",
 )
 
+
+
+class IdConverter(BaseConverter):
+    """`<id:name>` route segments in canonical form, so views can compare them.
+
+    Values that aren't UUIDs pass through unchanged; they match no row, so
+    the view answers its usual JSON 404 rather than the SPA catch-all.
+    """
+
+    def to_python(self, value: str) -> str:
+        return parse_id(value) or value
+
+
+app.url_map.converters["id"] = IdConverter
+
 CORS(
     app,
     origins=["http://localhost:3000", "http://127.0.0.1:3000"],
@@ -58,7 +98,23 @@ app.config["SMTP_PORT"] = int(os.getenv("SMTP_PORT", "587"))
 app.config["SMTP_USERNAME"] = os.getenv("SMTP_USERNAME", "")
 app.config["SMTP_PASSWORD"] = os.getenv("SMTP_PASSWORD", "")
 app.config["SMTP_USE_TLS"] = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+app.config["SMTP_IDLE_SECONDS"] = float(os.getenv("SMTP_IDLE_SECONDS", "30"))
+app.config["MAIL_BATCH_SIZE"] = int(os.getenv("MAIL_BATCH_SIZE", "50"))
+app.config["PASSWORD_PBKDF2_ITERATIONS"] = int(
+    os.getenv("PASSWORD_PBKDF2_ITERATIONS", str(DEFAULT_PBKDF2_ITERATIONS))
+)
+app.config["PASSWORD_HASH_WORKERS"] = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1)))
+)
+app.config["PASSWORD_HASH_MAX_PENDING"] = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+app.config["PASSWORD_HASH_TIMEOUT_SECONDS"] = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", "10"))
 app.config["FRONTEND_URL"] = os.getenv("FRONTEND_URL", "http://localhost:3000")
+app.config["JOB_WORKER_THREADS"] = int(os.getenv("JOB_WORKER_THREADS", "1"))
+app.config["JOB_POLL_INTERVAL_SECONDS"] = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+app.config["FFMPEG_BINARY"] = os.getenv("FFMPEG_BINARY", "")
+app.config["TIMELINE_FANOUT_MAX_FOLLOWERS"] = int(
+    os.getenv("TIMELINE_FANOUT_MAX_FOLLOWERS", str(timeline.DEFAULT_FANOUT_MAX_FOLLOWERS))
+)
 # ------------------------------------------------------------------------------------
 # Database setup
 # ------------------------------------------------------------------------------------
@@ -71,7 +127,54 @@ app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv(
     f"sqlite:///{db_path}",
 )
 
-db.init_app(app)
+# Size the pool to the threads that use the database in one process: the
+# web server's request threads, JOB_WORKER_THREADS and the email sender.
+# Read replicas for the @reads_from_replica routes (comma-separated URLs), and
+# how long a client that just wrote keeps reading from the primary.
+app.config["DATABASE_REPLICA_URLS"] = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+app.config["REPLICA_STICKY_SECONDS"] = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+app.config["DB_POOL_SIZE"] = int(os.getenv("DB_POOL_SIZE", "10"))
+app.config["DB_MAX_OVERFLOW"] = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+app.config["DB_POOL_TIMEOUT_SECONDS"] = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+app.config["DB_POOL_RECYCLE_SECONDS"] = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+# Rendered /api/feed pages (see feed_cache): "memory", "sqlite" (one file
+# shared by all workers on the box) or "none".
+app.config["FEED_CACHE_BACKEND"] = os.getenv("FEED_CACHE_BACKEND", "memory")
+app.config["FEED_CACHE_SIZE"] = int(os.getenv("FEED_CACHE_SIZE", "5000"))
+app.config["FEED_CACHE_TTL_SECONDS"] = float(os.getenv("FEED_CACHE_TTL_SECONDS", "30"))
+app.config["FEED_CACHE_PATH"] = os.getenv(
+    "FEED_CACHE_PATH",
+    str(Path(app.instance_path) / "feed_cache.db"),
+)
+
+# Live updates on /api/events (see events): "memory" reaches streams in this
+# process only; "postgres" fans out to every worker through LISTEN/NOTIFY.
+app.config["EVENTS_BACKEND"] = os.getenv("EVENTS_BACKEND", "memory")
+# Each open stream holds a thread under a WSGI server, but none under asgi.py.
+app.config["EVENTS_MAX_STREAMS"] = int(os.getenv("EVENTS_MAX_STREAMS", "100"))
+app.config["EVENTS_MAX_STREAM_SECONDS"] = float(os.getenv("EVENTS_MAX_STREAM_SECONDS", "300"))
+app.config["EVENTS_HEARTBEAT_SECONDS"] = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+app.config["EVENTS_QUEUE_SIZE"] = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+app.config["EVENTS_MAX_POSTS"] = int(os.getenv("EVENTS_MAX_POSTS", "100"))
+
+# Threads that run Flask views when served through asgi.py. Uploads are
+# buffered and long bodies streamed on the event loop, so each thread is
+# held only while a view or a chunk read runs.
+app.config["ASGI_WSGI_THREADS"] = int(os.getenv("ASGI_WSGI_THREADS", "32"))
+
+# Per-connection SQLite pragmas (see db_engine); an empty value leaves the default.
+app.config["SQLITE_JOURNAL_MODE"] = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+app.config["SQLITE_SYNCHRONOUS"] = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+app.config["SQLITE_MMAP_SIZE"] = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative means KiB rather than pages: 64 MiB per connection.
+app.config["SQLITE_CACHE_SIZE"] = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+
+db_engine.init_app(app)
 
 # ------------------------------------------------------------------------------------
 # Upload directories
@@ -83,46 +186,105 @@ app.config["UPLOAD_IMAGE_DIR"] = os.path.join(app.root_path, "uploads", "images"
 os.makedirs(app.config["UPLOAD_AUDIO_DIR"], exist_ok=True)
 os.makedirs(app.config["UPLOAD_IMAGE_DIR"], exist_ok=True)
 
+# One-shot requests (including /api/upload_media) are capped here; larger
+# files go through the chunked /api/uploads sessions.
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH", str(64 * 1024 * 1024)))
+app.config["UPLOAD_CHUNK_SIZE"] = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+app.config["UPLOAD_SESSION_TTL_SECONDS"] = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", "86400"))
+app.config["MAX_AUDIO_UPLOAD_BYTES"] = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(1024 ** 3)))
+app.config["MAX_IMAGE_UPLOAD_BYTES"] = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+app.config["MAX_AUDIO_DURATION_SECONDS"] = float(os.getenv("MAX_AUDIO_DURATION_SECONDS", "7200"))
+app.config["USER_UPLOAD_QUOTA_BYTES"] = int(os.getenv("USER_UPLOAD_QUOTA_BYTES", str(5 * 1024 ** 3)))
+
+# Garbage collection (media_gc): unreferenced media and stray files are kept
+# for the grace period; soft-deleted posts are hard-deleted after the reap delay.
+app.config["MEDIA_GC_GRACE_SECONDS"] = int(os.getenv("MEDIA_GC_GRACE_SECONDS", "86400"))
+app.config["POST_REAP_AFTER_SECONDS"] = int(os.getenv("POST_REAP_AFTER_SECONDS", str(30 * 86400)))
+app.config["GC_BATCH_SIZE"] = int(os.getenv("GC_BATCH_SIZE", "200"))
+app.config["GC_INTERVAL_SECONDS"] = int(os.getenv("GC_INTERVAL_SECONDS", "3600"))
+
+# When set (e.g. "/protected-uploads/"), nginx serves upload bytes via
+# X-Accel-Redirect to <prefix>audio/<name> and <prefix>images/<name>.
+app.config["MEDIA_ACCEL_REDIRECT_PREFIX"] = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", "")
+
 # ------------------------------------------------------------------------------------
 # Login setup
 # ------------------------------------------------------------------------------------
 
 login_manager = LoginManager(app)
 
+# Identity columns of recently seen users, so load_user can skip its query.
+app.config["USER_CACHE_SIZE"] = int(os.getenv("USER_CACHE_SIZE", "1024"))
+app.config["USER_CACHE_TTL_SECONDS"] = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
 
 @login_manager.user_loader
 def load_user(user_id: str):
-    return db.session.get(User, user_id)
+    return user_cache.load(user_id)
 
 
 # ------------------------------------------------------------------------------------
 # DB initialization
 # ------------------------------------------------------------------------------------
 
+def schema_is_current() -> bool:
+    """False for a database from before compact ids.
+
+    create_all() can't change existing columns, so such a database is
+    copied into a fresh one with migrate_ids.py instead (see README.txt).
+    """
+    inspector = inspect(db.engine)
+
+    if not inspector.has_table(User.__tablename__):
+        return True
+
+    columns = {column["name"] for column in inspector.get_columns(User.__tablename__)}
+
+    return "username_lower" in columns
+
+
 def init_database() -> None:
     with app.app_context():
+        if not schema_is_current():
+            # Left untouched, so hard_reset_db.py and migrate_ids.py can
+            # still import the app to replace or copy it.
+            app.logger.error(
+                "%s predates the current schema; copy it into a fresh database "
+                "with migrate_ids.py (see README.txt)",
+                db.engine.url.render_as_string(),
+            )
+            return
+
         db.create_all()
+        post_search.ensure_index()
+        user_search.ensure_index()
+        media_gc.ensure_scheduled()
+        db.session.commit()
 
 
 init_database()
 
-# ------------------------------------------------------------------------------------
-# Helpers
-# ------------------------------------------------------------------------------------
-
-def make_unique_upload_filename(original_filename: str) -> str:
-    safe_name = secure_filename(original_filename)
 
-    stem = Path(safe_name).stem
-    suffix = Path(safe_name).suffix
+@app.before_request
+def start_background_workers() -> None:
+    # Started on the first request rather than at import so maintenance
+    # scripts that import app don't spin up workers.
+    jobs.start_workers(app, app.config["JOB_WORKER_THREADS"])
 
-    if not stem:
-        stem = "upload"
+    if app.config["JOB_WORKER_THREADS"] > 0:
+        mailer.start_sender(app)
 
-    if not suffix:
-        suffix = ".jpg"
+# ------------------------------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------------------------------
 
-    return f"{stem}-{uuid4().hex}{suffix}"
+def enqueue_media_processing(media: Media) -> None:
+    """Queue the background jobs a newly stored post audio or image needs."""
+    if media.media_type == "audio":
+        jobs.enqueue("transcode_audio", media_id=media.id)
+        jobs.enqueue("extract_media_metadata", media_id=media.id)
+    else:
+        jobs.enqueue("process_post_image", media_id=media.id)
 
 
 USERNAME_RE = re.compile(r"^[a-zA-Z0-9_]{3,30}$")
@@ -154,20 +316,40 @@ def validate_new_user(username: str, email: str, password: str) -> str | None:
     return None
 
 
-def save_profile_image(profile_image_file):
+def save_profile_image(profile_image_file, user: User) -> str | None:
+    """Save an uploaded profile picture and queue its avatar variant.
+
+    Adds a Media row and the job to the caller's transaction. The returned
+    URL is the original upload until the job swaps in the avatar.
+    """
     if not profile_image_file:
         return None
 
-    profile_image_filename = make_unique_upload_filename(profile_image_file.filename)
-
-    profile_image_dest_path = os.path.join(
+    profile_image_blob = blob_store.store_upload(
+        profile_image_file,
         app.config["UPLOAD_IMAGE_DIR"],
-        profile_image_filename,
+        default_suffix=".jpg",
+    )
+
+    profile_image_media = Media(
+        media_type="image",
+        url=f"/images/{profile_image_blob.filename}",
+        filename=profile_image_blob.filename,
+        content_hash=profile_image_blob.content_hash,
+        size_bytes=profile_image_blob.size_bytes,
+        user_id=user.id,
     )
 
-    profile_image_file.save(profile_image_dest_path)
+    db.session.add(profile_image_media)
+    db.session.flush()
 
-    return f"/images/{profile_image_filename}"
+    jobs.enqueue(
+        "process_profile_image",
+        media_id=profile_image_media.id,
+        user_id=user.id,
+    )
+
+    return profile_image_media.url
 
 def get_email_verification_serializer() -> URLSafeTimedSerializer:
     return URLSafeTimedSerializer(
@@ -209,33 +391,8 @@ def verify_email_verification_token(token: str) -> User | None:
     return user
 
 
-def send_email(to_email: str, subject: str, body: str) -> None:
-    message = EmailMessage()
-    message["From"] = app.config["MAIL_FROM"]
-    message["To"] = to_email
-    message["Subject"] = subject
-    message.set_content(body)
-
-    smtp_host = app.config["SMTP_HOST"]
-
-    if not smtp_host:
-        app.logger.warning("SMTP_HOST is not set. Email body:\n%s", body)
-        return
-
-    with smtplib.SMTP(smtp_host, app.config["SMTP_PORT"]) as smtp:
-        if app.config["SMTP_USE_TLS"]:
-            smtp.starttls()
-
-        if app.config["SMTP_USERNAME"]:
-            smtp.login(
-                app.config["SMTP_USERNAME"],
-                app.config["SMTP_PASSWORD"],
-            )
-
-        smtp.send_message(message)
-
-
-def send_verification_email(user: User) -> None:
+def queue_verification_email(user: User) -> None:
+    """Add the verification email to the caller's transaction (see mailer)."""
     token = make_email_verification_token(user)
 
     verification_url = url_for(
@@ -255,34 +412,12 @@ This link expires in 24 hours.
 If you did not create this account, you can ignore this email.
 """
 
-    send_email(
+    mailer.queue_email(
         to_email=user.email,
         subject="Verify your SoundGalore email address",
         body=body,
     )
 
-def comment_to_dict(comment):
-    like_count = Like.query.filter_by(comment_id=comment.id).count()
-    liked_by_current_user = (
-        Like.query
-        .filter_by(user_id=current_user.id, comment_id=comment.id)
-        .first()
-        is not None
-    )
-
-    return {
-        "id": comment.id,
-        "post_id": comment.post_id,
-        "user_id": comment.user_id,
-        "username": comment.author.username,
-        "display_name": comment.author.display_name or comment.author.username,
-        "profile_image_url": comment.author.profile_image_url,
-        "body": comment.body,
-        "created_at": comment.created_at.isoformat(),
-        "like_count": like_count,
-        "liked_by_current_user": liked_by_current_user,
-    }
-
 
 # ------------------------------------------------------------------------------------
 # Routes
@@ -309,6 +444,7 @@ def get_current_user():
 
 @app.get("/api/my_followees")
 @login_required
+@reads_from_replica
 def my_followees():
     rows = (
         db.session.query(
@@ -342,6 +478,7 @@ def my_followees():
 
 @app.get("/api/my_followers")
 @login_required
+@reads_from_replica
 def my_followers():
     rows = (
         db.session.query(
@@ -390,7 +527,7 @@ def my_followers():
     return jsonify(result), 200
 
 
-@app.delete("/api/follows/<followee_id>")
+@app.delete("/api/follows/<id:followee_id>")
 @login_required
 def delete_follow(followee_id):
     existing_follow = Follow.query.filter_by(
@@ -402,6 +539,13 @@ def delete_follow(followee_id):
         return jsonify({"error": "follow not found"}), 404
 
     db.session.delete(existing_follow)
+    counters.adjust_followers(followee_id, -1)
+    timeline.prune_follow(current_user.id, followee_id)
+    events.publish(
+        [f"user:{current_user.id}"],
+        "unfollowed",
+        {"follower_id": current_user.id, "followee_id": followee_id},
+    )
 
     try:
         db.session.commit()
@@ -428,43 +572,60 @@ def upload_media():
     if not image_file:
         return jsonify({"error": "post to /api/upload_media was missing image file"}), 400
 
-    audio_filename = make_unique_upload_filename(audio_file.filename)
-    image_filename = make_unique_upload_filename(image_file.filename)
+    post_title = request.form.get("title", "").strip()
+    post_description = request.form.get("description", "")
+
+    if not post_title:
+        return jsonify({"error": "missing title"}), 400
+
+    try:
+        # The request size bounds both files before anything is written.
+        chunked_uploads.check_quota(current_user.id, request.content_length or 0)
 
-    audio_dest_path = os.path.join(app.config["UPLOAD_AUDIO_DIR"], audio_filename)
-    image_dest_path = os.path.join(app.config["UPLOAD_IMAGE_DIR"], image_filename)
+        audio_blob = blob_store.store_upload(
+            audio_file,
+            app.config["UPLOAD_AUDIO_DIR"],
+            default_suffix=".webm",
+        )
+        # A rejected file stays unreferenced until media_gc sweeps it.
+        audio_duration = chunked_uploads.checked_audio_duration(
+            Path(app.config["UPLOAD_AUDIO_DIR"]) / audio_blob.filename
+        )
+    except chunked_uploads.UploadError as e:
+        return jsonify({"error": str(e)}), e.status
 
-    audio_file.save(audio_dest_path)
-    image_file.save(image_dest_path)
+    image_blob = blob_store.store_upload(
+        image_file,
+        app.config["UPLOAD_IMAGE_DIR"],
+        default_suffix=".jpg",
+    )
 
-    audio_url = f"/audio/{audio_filename}"
-    image_url = f"/images/{image_filename}"
+    audio_url = f"/audio/{audio_blob.filename}"
+    image_url = f"/images/{image_blob.filename}"
 
     try:
         audio_media_entry = Media(
             media_type="audio",
             url=audio_url,
-            filename=audio_filename,
+            filename=audio_blob.filename,
+            content_hash=audio_blob.content_hash,
+            size_bytes=audio_blob.size_bytes,
+            duration=audio_duration,
             user_id=current_user.id,
         )
 
         image_media_entry = Media(
             media_type="image",
             url=image_url,
-            filename=image_filename,
+            filename=image_blob.filename,
+            content_hash=image_blob.content_hash,
+            size_bytes=image_blob.size_bytes,
             user_id=current_user.id,
         )
 
         db.session.add_all([audio_media_entry, image_media_entry])
         db.session.flush()
 
-        post_title = request.form.get("title", "").strip()
-        post_description = request.form.get("description", "")
-
-        if not post_title:
-            db.session.rollback()
-            return jsonify({"error": "missing title"}), 400
-
         new_post_entry = Post(
             user_id=current_user.id,
             title=post_title,
@@ -475,6 +636,18 @@ def upload_media():
         )
 
         db.session.add(new_post_entry)
+        db.session.flush()
+
+        timeline.push_post(new_post_entry)
+        post_search.index_post(new_post_entry)
+        events.publish(
+            [f"author:{current_user.id}"],
+            "post_created",
+            {"post_id": new_post_entry.id, "user_id": current_user.id},
+        )
+        enqueue_media_processing(audio_media_entry)
+        enqueue_media_processing(image_media_entry)
+
         db.session.commit()
 
     except Exception as e:
@@ -497,14 +670,107 @@ def upload_media():
     ), 201
 
 
+@app.post("/api/uploads")
+@login_required
+def create_upload():
+    data = request.get_json(force=True)
+
+    try:
+        total_bytes = int(data.get("total_bytes", 0))
+        duration_seconds = data.get("duration_seconds")
+        duration_seconds = float(duration_seconds) if duration_seconds is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "total_bytes and duration_seconds must be numbers"}), 400
+
+    try:
+        upload = chunked_uploads.create_session(
+            current_user.id,
+            media_type=data.get("media_type", ""),
+            filename=data.get("filename"),
+            total_bytes=total_bytes,
+            duration_seconds=duration_seconds,
+        )
+        db.session.commit()
+    except chunked_uploads.UploadError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), e.status
+
+    return jsonify(chunked_uploads.describe(upload)), 201
+
+
+@app.get("/api/uploads/<id:upload_id>")
+@login_required
+def get_upload(upload_id):
+    try:
+        upload = chunked_uploads.get_session(current_user.id, upload_id)
+    except chunked_uploads.UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    return jsonify(chunked_uploads.describe(upload)), 200
+
+
+@app.put("/api/uploads/<id:upload_id>/chunks/<int:index>")
+@login_required
+def put_upload_chunk(upload_id, index):
+    try:
+        upload = chunked_uploads.get_session(current_user.id, upload_id)
+        chunked_uploads.write_chunk(upload, index, request.stream, request.content_length)
+    except chunked_uploads.UploadError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), e.status
+
+    return jsonify({"id": upload_id, "chunk": index, "received": True}), 200
+
+
+@app.post("/api/uploads/<id:upload_id>/finalize")
+@login_required
+def finalize_upload(upload_id):
+    try:
+        upload = chunked_uploads.get_session(current_user.id, upload_id)
+        already_finalized = upload.status == "finalized"
+        media = chunked_uploads.finalize(upload)
+
+        if not already_finalized:
+            enqueue_media_processing(media)
+
+        db.session.commit()
+    except chunked_uploads.UploadError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), e.status
+    except Exception:
+        db.session.rollback()
+        app.logger.exception("Finalize upload failed")
+        return jsonify({"error": "Could not finalize upload."}), 500
+
+    return jsonify({
+        "id": upload.id,
+        "media_id": media.id,
+        "media_type": media.media_type,
+        "url": media.url,
+    }), 200
+
+
+def accel_prefix_for(kind: str) -> str:
+    prefix = app.config["MEDIA_ACCEL_REDIRECT_PREFIX"]
+    return f"{prefix.rstrip('/')}/{kind}/" if prefix else ""
+
+
 @app.route("/audio/<path:filename>")
 def serve_audio(filename: str):
-    return send_from_directory(app.config["UPLOAD_AUDIO_DIR"], filename)
+    return media_serving.serve_media(
+        app.config["UPLOAD_AUDIO_DIR"],
+        filename,
+        accel_prefix=accel_prefix_for("audio"),
+    )
 
 
 @app.route("/images/<path:filename>")
 def serve_image(filename: str):
-    return send_from_directory(app.config["UPLOAD_IMAGE_DIR"], filename)
+    return media_serving.serve_media(
+        app.config["UPLOAD_IMAGE_DIR"],
+        filename,
+        accel_prefix=accel_prefix_for("images"),
+    )
 
 
 @app.post("/api/posts")
@@ -521,6 +787,21 @@ def create_post():
     if not title:
         return jsonify({"error": "missing title"}), 400
 
+    for media_id, media_type in ((image_media_id, "image"), (audio_media_id, "audio")):
+        if media_id is None:
+            continue
+
+        media = db.session.get(Media, media_id)
+
+        if media is None or media.user_id != current_user.id or media.media_type != media_type:
+            return jsonify({"error": f"unknown {media_type} media"}), 400
+
+        if (
+            media.duration is not None
+            and media.duration > app.config["MAX_AUDIO_DURATION_SECONDS"]
+        ):
+            return jsonify({"error": "That recording is too long."}), 413
+
     new_post = Post(
         user_id=current_user.id,
         title=title,
@@ -533,15 +814,23 @@ def create_post():
     db.session.add(new_post)
 
     try:
+        db.session.flush()
+        timeline.push_post(new_post)
+        post_search.index_post(new_post)
+        events.publish(
+            [f"author:{current_user.id}"],
+            "post_created",
+            {"post_id": new_post.id, "user_id": current_user.id},
+        )
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         app.logger.exception("Create post failed")
         return jsonify({"error": str(e)}), 500
 
-    return jsonify(new_post.to_dict()), 201
+    return jsonify(serialize_posts([new_post.id])[0]), 201
 
-@app.delete("/api/posts/<post_id>")
+@app.delete("/api/posts/<id:post_id>")
 @login_required
 def delete_post(post_id):
     post = db.session.get(Post, post_id)
@@ -553,6 +842,14 @@ def delete_post(post_id):
         return jsonify({"error": "you are not allowed to delete this post"}), 403
 
     post.is_deleted = True
+    post.deleted_at = datetime.now(timezone.utc)
+    timeline.retract_post(post.id)
+    post_search.unindex_post(post.id)
+    events.publish(
+        [f"author:{post.user_id}", f"post:{post.id}"],
+        "post_deleted",
+        {"post_id": post.id, "user_id": post.user_id},
+    )
 
     try:
         db.session.commit()
@@ -582,10 +879,9 @@ def list_media():
 
 @app.route("/api/user_profile", methods=["GET"])
 @login_required
+@reads_from_replica
 def api_user_profile():
     cache_size = 20
-    before_ts = request.args.get("before")
-    before_dt = datetime.fromisoformat(before_ts) if before_ts else None
 
     posts_query = (
         Post.query
@@ -595,30 +891,29 @@ def api_user_profile():
         )
     )
 
-    if before_dt is not None:
-        posts_query = posts_query.filter(Post.created_at < before_dt)
-
-    posts = (
-        posts_query
-        .order_by(Post.created_at.desc())
-        .limit(cache_size)
-        .options(
-            db.selectinload(Post.image),
-            db.selectinload(Post.audio),
-            db.selectinload(Post.author),
-        )
-        .all()
-    )
+    try:
+        rows = cursors.paginate(
+            posts_query.with_entities(Post.id, Post.created_at),
+            Post.created_at,
+            Post.id,
+            cursor=request.args.get("cursor"),
+            limit=cache_size,
+        ).all()
+    except cursors.InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    # A bare list like /api/feed: clients page on the last post's `cursor`.
+    rows, _ = cursors.page_of(rows, cache_size)
+    post_ids = [row.id for row in rows]
 
-    return jsonify([post.to_dict() for post in posts]), 200
+    return jsonify(serialize_posts(post_ids)), 200
 
 
-@app.route("/api/user_profile/<user_id>", methods=["GET"])
+@app.route("/api/user_profile/<id:user_id>", methods=["GET"])
 @login_required
+@reads_from_replica
 def api_user_profile_by_id(user_id):
     cache_size = 20
-    before_ts = request.args.get("before")
-    before_dt = datetime.fromisoformat(before_ts) if before_ts else None
 
     profile_user = db.session.get(User, user_id)
 
@@ -633,27 +928,40 @@ def api_user_profile_by_id(user_id):
         )
     )
 
-    if before_dt is not None:
-        posts_query = posts_query.filter(Post.created_at < before_dt)
-
-    posts = (
-        posts_query
-        .order_by(Post.created_at.desc())
-        .limit(cache_size)
-        .options(
-            db.selectinload(Post.image),
-            db.selectinload(Post.audio),
-            db.selectinload(Post.author),
-        )
-        .all()
-    )
+    try:
+        rows = cursors.paginate(
+            posts_query.with_entities(Post.id, Post.created_at),
+            Post.created_at,
+            Post.id,
+            cursor=request.args.get("cursor"),
+            limit=cache_size,
+        ).all()
+    except cursors.InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    rows, next_cursor = cursors.page_of(rows, cache_size)
+    post_ids = [row.id for row in rows]
 
     existing_follow = Follow.query.filter_by(
         follower_id=current_user.id,
         followee_id=profile_user.id,
     ).first()
 
-    return jsonify({
+    etag = etags.make(
+        "profile",
+        current_user.id,
+        profile_user.id,
+        profile_user.version,
+        existing_follow is not None,
+        next_cursor,
+        post_ids,
+        posts_version(post_ids),
+    )
+
+    if etags.matches(etag):
+        return etags.not_modified(etag)
+
+    return etags.tag(jsonify({
         "user": {
             "id": profile_user.id,
             "username": profile_user.username,
@@ -662,20 +970,67 @@ def api_user_profile_by_id(user_id):
             "is_current_user": profile_user.id == current_user.id,
             "is_following": existing_follow is not None,
         },
-        "posts": [post.to_dict() for post in posts],
-    }), 200
+        "posts": serialize_posts(post_ids),
+        "next_cursor": next_cursor,
+    }), etag), 200
 
 
 @app.route("/api/feed", methods=["GET"])
 @login_required
+@reads_from_replica
 def api_feed():
     cache_size = 20
-    before_ts = request.args.get("before")
-    before_dt = datetime.fromisoformat(before_ts) if before_ts else None
+    cursor = request.args.get("cursor")
+
+    cache_key = feed_cache.page_key(current_user.id, cursor)
+    cached = feed_cache.get(cache_key)
 
-    posts = current_user.feed(limit=cache_size, before=before_dt).all()
+    if cached is not None:
+        etag, body = cached
 
-    return jsonify([post.to_dict() for post in posts]), 200
+        if etags.matches(etag):
+            return etags.not_modified(etag)
+
+        return etags.tag(app.response_class(body, mimetype="application/json"), etag), 200
+
+    try:
+        post_ids = timeline.read_feed(
+            current_user.id,
+            limit=cache_size,
+            cursor=cursor,
+        )
+    except cursors.InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    etag = etags.make("feed", current_user.id, cursor, post_ids, posts_version(post_ids))
+
+    if etags.matches(etag):
+        return etags.not_modified(etag)
+
+    response = jsonify(serialize_posts(post_ids))
+    feed_cache.put(cache_key, etag, response.get_data())
+
+    return etags.tag(response, etag), 200
+
+
+@app.get("/api/events")
+@login_required
+def api_events():
+    # ?posts=<id>,<id> adds live counters for the posts on screen.
+    post_ids = [parse_id(post_id) for post_id in request.args.get("posts", "").split(",") if post_id]
+    post_ids = [post_id for post_id in post_ids if post_id is not None]
+    post_ids = post_ids[: app.config["EVENTS_MAX_POSTS"]]
+
+    followee_ids = db.session.scalars(
+        db.select(Follow.followee_id).where(Follow.follower_id == current_user.id)
+    ).all()
+
+    response = events.open_stream(current_user.id, followee_ids, post_ids)
+
+    if response is None:
+        return jsonify({"error": "too many open event streams"}), 503, {"Retry-After": "10"}
+
+    return response
 
 
 @app.post("/api/users")
@@ -712,13 +1067,10 @@ def create_user():
     if existing_email:
         return jsonify({"error": "That email is already in use."}), 409
 
-    profile_image_url = save_profile_image(profile_image_file)
-
     user = User(
         username=username,
         display_name=display_name or username,
         email=email,
-        profile_image_url=profile_image_url,
     )
 
     user.set_password(password)
@@ -726,6 +1078,9 @@ def create_user():
     db.session.add(user)
 
     try:
+        db.session.flush()
+        user.profile_image_url = save_profile_image(profile_image_file, user)
+        queue_verification_email(user)
         db.session.commit()
     except IntegrityError:
         db.session.rollback()
@@ -735,15 +1090,6 @@ def create_user():
         app.logger.exception("Create user failed")
         return jsonify({"error": "Could not create user."}), 500
 
-    try:
-        send_verification_email(user)
-    except Exception:
-        app.logger.exception("Could not send verification email")
-        return jsonify({
-            "error": "Account was created, but the verification email could not be sent. Please try resending the verification email.",
-            "email": user.email,
-        }), 500
-
     return jsonify({
         "id": user.id,
         "username": user.username,
@@ -776,7 +1122,7 @@ def update_current_user():
         current_user.display_name = display_name
 
     if profile_image_file:
-        current_user.profile_image_url = save_profile_image(profile_image_file)
+        current_user.profile_image_url = save_profile_image(profile_image_file, current_user)
 
     if new_password:
         if not current_password:
@@ -803,6 +1149,8 @@ def update_current_user():
         app.logger.exception("Update user failed")
         return jsonify({"error": "Could not update profile."}), 500
 
+    user_cache.invalidate(current_user.id)
+
     return jsonify({
         "id": current_user.id,
         "username": current_user.username,
@@ -821,6 +1169,11 @@ def create_follow():
     if not followee_id:
         return jsonify({"error": "missing followee_id"}), 400
 
+    followee_id = parse_id(followee_id)
+
+    if followee_id is None:
+        return jsonify({"error": "invalid followee_id"}), 400
+
     if followee_id == current_user.id:
         return jsonify({"error": "you cannot follow yourself"}), 400
 
@@ -849,6 +1202,14 @@ def create_follow():
     db.session.add(follow)
 
     try:
+        db.session.flush()
+        counters.adjust_followers(followee_id, +1)
+        timeline.backfill_follow(current_user.id, followee_id)
+        events.publish(
+            [f"user:{current_user.id}", f"user:{followee_id}"],
+            "followed",
+            {"follower_id": current_user.id, "followee_id": followee_id},
+        )
         db.session.commit()
     except Exception:
         db.session.rollback()
@@ -870,9 +1231,20 @@ def login() -> tuple[dict, int]:
     if not user:
         return {"error": "invalid username"}, 401
 
-    if not user.check_password(data.get("password", "")):
+    password = data.get("password", "")
+
+    if not user.check_password(password):
         return {"error": "invalid credentials"}, 401
 
+    if password_hashing.needs_rehash(user.password_hash):
+        user.set_password(password)
+
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("Password rehash failed")
+
     if not user.email_verified:
         return {
             "error": "Please verify your email address before logging in.",
@@ -946,9 +1318,11 @@ def resend_verification_email():
         }), 200
 
     try:
-        send_verification_email(user)
+        queue_verification_email(user)
+        db.session.commit()
     except Exception:
-        app.logger.exception("Could not resend verification email")
+        db.session.rollback()
+        app.logger.exception("Could not queue verification email")
         return jsonify({"error": "Could not send verification email."}), 500
 
     return jsonify({
@@ -959,8 +1333,6 @@ def resend_verification_email():
 @login_required
 def get_my_comments():
     cache_size = 20
-    before_ts = request.args.get("before")
-    before_dt = datetime.fromisoformat(before_ts) if before_ts else None
 
     comments_query = (
         Comment.query
@@ -971,19 +1343,19 @@ def get_my_comments():
         )
     )
 
-    if before_dt is not None:
-        comments_query = comments_query.filter(Comment.created_at < before_dt)
-
-    comments = (
-        comments_query
-        .order_by(Comment.created_at.desc())
-        .limit(cache_size)
-        .options(
-            db.selectinload(Comment.author),
-            db.selectinload(Comment.post).selectinload(Post.author),
-        )
-        .all()
-    )
+    try:
+        rows = cursors.paginate(
+            comments_query.with_entities(Comment.id, Comment.created_at),
+            Comment.created_at,
+            Comment.id,
+            cursor=request.args.get("cursor"),
+            limit=cache_size,
+        ).all()
+    except cursors.InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    rows, next_cursor = cursors.page_of(rows, cache_size)
+    comment_ids = [row.id for row in rows]
 
     return jsonify({
         "user": {
@@ -993,27 +1365,16 @@ def get_my_comments():
             "profile_image_url": current_user.profile_image_url,
             "is_current_user": True,
         },
-        "comments": [
-            {
-                **comment_to_dict(comment),
-                "post": {
-                    "id": comment.post.id,
-                    "title": comment.post.title,
-                    "description": comment.post.description,
-                    "author": {
-                        "id": comment.post.author.id,
-                        "username": comment.post.author.username,
-                        "display_name": comment.post.author.display_name or comment.post.author.username,
-                        "profile_image_url": comment.post.author.profile_image_url,
-                    },
-                },
-            }
-            for comment in comments
-        ],
+        "comments": serialize_comments(
+            comment_ids,
+            viewer_id=current_user.id,
+            with_post=True,
+        ),
+        "next_cursor": next_cursor,
     }), 200
 
 
-@app.delete("/api/comments/<comment_id>")
+@app.delete("/api/comments/<id:comment_id>")
 @login_required
 def delete_comment(comment_id):
     comment = db.session.get(Comment, comment_id)
@@ -1024,9 +1385,28 @@ def delete_comment(comment_id):
     if comment.user_id != current_user.id:
         return jsonify({"error": "you are not allowed to delete this comment"}), 403
 
+    counters.adjust_post(
+        comment.post_id,
+        comments=-len(counters.comment_subtree_ids(comment)),
+    )
+
+    if comment.parent_id:
+        counters.adjust_comment(comment.parent_id, replies=-1)
+
+    post_id = comment.post_id
+    parent_id = comment.parent_id
     db.session.delete(comment)
 
     try:
+        db.session.flush()
+        post = db.session.get(Post, post_id)
+        db.session.refresh(post, ["comment_count"])
+        events.publish([f"post:{post_id}"], "comment_deleted", {
+            "post_id": post_id,
+            "comment_id": comment_id,
+            "parent_id": parent_id,
+            "comment_count": post.comment_count,
+        })
         db.session.commit()
     except Exception:
         db.session.rollback()
@@ -1038,22 +1418,41 @@ def delete_comment(comment_id):
         "comment_id": comment_id,
     }), 200
 
-@app.get("/api/posts/<post_id>/comments")
+@app.get("/api/posts/<id:post_id>/comments")
 @login_required
+@reads_from_replica
 def get_post_comments(post_id):
+    cache_size = 20
+    reply_preview = 3
+
     post = db.session.get(Post, post_id)
 
     if post is None:
         return jsonify({"error": "post not found"}), 404
 
-    comments = (
+    top_level_query = (
         Comment.query
-        .filter(Comment.post_id == post_id)
-        .order_by(Comment.created_at.desc())
-        .all()
+        .with_entities(Comment.id, Comment.created_at)
+        .filter(
+            Comment.post_id == post_id,
+            Comment.parent_id.is_(None),
+        )
     )
 
-    post_like_count = Like.query.filter_by(post_id=post_id).count()
+    try:
+        rows = cursors.paginate(
+            top_level_query,
+            Comment.created_at,
+            Comment.id,
+            cursor=request.args.get("cursor"),
+            limit=cache_size,
+        ).all()
+    except cursors.InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    rows, next_cursor = cursors.page_of(rows, cache_size)
+    comment_ids = [row.id for row in rows]
+
     post_liked_by_current_user = (
         Like.query
         .filter_by(user_id=current_user.id, post_id=post_id)
@@ -1061,14 +1460,76 @@ def get_post_comments(post_id):
         is not None
     )
 
-    return jsonify({
-        "post_like_count": post_like_count,
+    etag = etags.make(
+        "comments",
+        current_user.id,
+        post.id,
+        post.version,
+        post_liked_by_current_user,
+        next_cursor,
+        comment_ids,
+        comment_threads_version(comment_ids),
+    )
+
+    if etags.matches(etag):
+        return etags.not_modified(etag)
+
+    return etags.tag(jsonify({
+        "post_like_count": post.like_count,
+        "post_comment_count": post.comment_count,
         "post_liked_by_current_user": post_liked_by_current_user,
-        "comments": [comment_to_dict(comment) for comment in comments],
+        "comments": serialize_comment_threads(
+            comment_ids,
+            viewer_id=current_user.id,
+            reply_preview=reply_preview,
+        ),
+        "next_cursor": next_cursor,
+    }), etag), 200
+
+
+@app.get("/api/comments/<id:comment_id>/replies")
+@login_required
+@reads_from_replica
+def get_comment_replies(comment_id):
+    cache_size = 20
+
+    comment = db.session.get(Comment, comment_id)
+
+    if comment is None:
+        return jsonify({"error": "comment not found"}), 404
+
+    replies_query = (
+        Comment.query
+        .with_entities(Comment.id, Comment.created_at)
+        .filter(Comment.parent_id == comment_id)
+    )
+
+    try:
+        rows = cursors.paginate(
+            replies_query,
+            Comment.created_at,
+            Comment.id,
+            cursor=request.args.get("cursor"),
+            limit=cache_size,
+            descending=False,
+        ).all()
+    except cursors.InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    rows, next_cursor = cursors.page_of(rows, cache_size)
+
+    return jsonify({
+        "comment_id": comment_id,
+        "reply_count": comment.reply_count,
+        "replies": serialize_comments(
+            [row.id for row in rows],
+            viewer_id=current_user.id,
+        ),
+        "next_cursor": next_cursor,
     }), 200
 
 
-@app.post("/api/posts/<post_id>/comments")
+@app.post("/api/posts/<id:post_id>/comments")
 @login_required
 def create_comment(post_id):
     post = db.session.get(Post, post_id)
@@ -1078,23 +1539,55 @@ def create_comment(post_id):
 
     data = request.get_json(force=True)
     body = data.get("body", "").strip()
+    parent_id = data.get("parent_id")
 
     if not body:
         return jsonify({"error": "missing comment body"}), 400
 
+    if parent_id:
+        parent_id = parse_id(parent_id)
+
+        if parent_id is None:
+            return jsonify({"error": "invalid parent_id"}), 400
+
+        parent = db.session.get(Comment, parent_id)
+
+        if parent is None or parent.post_id != post_id:
+            return jsonify({"error": "parent comment not found"}), 400
+
     comment = Comment(
         post_id=post_id,
         user_id=current_user.id,
         body=body,
+        parent_id=parent_id or None,
     )
 
     db.session.add(comment)
-    db.session.commit()
 
-    return jsonify(comment_to_dict(comment)), 201
+    try:
+        counters.adjust_post(post_id, comments=+1)
+
+        if parent_id:
+            counters.adjust_comment(parent_id, replies=+1)
 
+        db.session.flush()
+        db.session.refresh(post, ["comment_count"])
+        events.publish([f"post:{post_id}"], "comment_created", {
+            "post_id": post_id,
+            "comment_id": comment.id,
+            "parent_id": comment.parent_id,
+            "comment_count": post.comment_count,
+        })
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        app.logger.exception("Create comment failed")
+        return jsonify({"error": "could not create comment"}), 500
 
-@app.post("/api/posts/<post_id>/like")
+    return jsonify(serialize_comments([comment.id], viewer_id=current_user.id)[0]), 201
+
+
+@app.post("/api/posts/<id:post_id>/like")
 @login_required
 def toggle_post_like(post_id):
     post = db.session.get(Post, post_id)
@@ -1117,17 +1610,21 @@ def toggle_post_like(post_id):
         ))
         liked = True
 
+    counters.adjust_post(post_id, likes=+1 if liked else -1)
+    db.session.refresh(post, ["like_count"])
+    events.publish([f"post:{post_id}"], "post_likes", {
+        "post_id": post_id,
+        "like_count": post.like_count,
+    })
     db.session.commit()
 
-    like_count = Like.query.filter_by(post_id=post_id).count()
-
     return jsonify({
         "liked": liked,
-        "like_count": like_count,
+        "like_count": post.like_count,
     }), 200
 
 
-@app.post("/api/comments/<comment_id>/like")
+@app.post("/api/comments/<id:comment_id>/like")
 @login_required
 def toggle_comment_like(comment_id):
     comment = db.session.get(Comment, comment_id)
@@ -1150,46 +1647,34 @@ def toggle_comment_like(comment_id):
         ))
         liked = True
 
+    counters.adjust_comment(comment_id, likes=+1 if liked else -1)
     db.session.commit()
 
-    like_count = Like.query.filter_by(comment_id=comment_id).count()
-
     return jsonify({
         "liked": liked,
-        "like_count": like_count,
+        "like_count": comment.like_count,
     }), 200
 
 
 @app.get("/api/users/search")
 @login_required
+@reads_from_replica
 def search_users():
     query = request.args.get("q", "").strip()
 
     if not query:
         return jsonify([]), 200
 
-    query_lower = query.lower()
-
-    matching_users = (
-        User.query
-        .filter(
-            User.id != current_user.id,
-            db.func.lower(User.username).contains(query_lower),
-        )
-        .limit(25)
-        .all()
-    )
+    matching_ids = user_search.search_user_ids(query, exclude_user_id=current_user.id)
 
-    matching_users.sort(
-        key=lambda user: (
-            user.username.lower() != query_lower,
-            not user.username.lower().startswith(query_lower),
-            len(user.username),
-            user.username.lower(),
-        )
-    )
+    matching_users = []
 
-    matching_users = matching_users[:7]
+    if matching_ids:
+        users_by_id = {
+            user.id: user
+            for user in User.query.filter(User.id.in_(matching_ids)).all()
+        }
+        matching_users = [users_by_id[user_id] for user_id in matching_ids if user_id in users_by_id]
 
     followed_user_ids = set()
 
@@ -1217,6 +1702,21 @@ def search_users():
     ]), 200
 
 
+@app.get("/api/posts/search")
+@login_required
+@reads_from_replica
+def search_posts():
+    cache_size = 20
+    query = request.args.get("q", "").strip()
+
+    if not query:
+        return jsonify([]), 200
+
+    post_ids = post_search.search_post_ids(query, limit=cache_size)
+
+    return jsonify(serialize_posts(post_ids)), 200
+
+
 @app.errorhandler(400)
 def handle_400(e):
     app.logger.exception("400 on %s: %s", request.path, e)
@@ -1229,6 +1729,16 @@ def handle_400(e):
     return jsonify(error=str(e)), 400
 
 
+@app.errorhandler(password_hashing.HasherBusy)
+def handle_hasher_busy(e):
+    return jsonify(error="The server is busy. Please try again in a moment."), 503, {"Retry-After": "2"}
+
+
+@app.errorhandler(413)
+def handle_413(e):
+    return jsonify(error="That upload is too large. Use a chunked upload for large files."), 413
+
+
 # ------------------------------------------------------------------------------------
 # Serve React build
 # ------------------------------------------------------------------------------------
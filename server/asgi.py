@@ -0,0 +1,269 @@
+# server/asgi.py
+"""
+ASGI entry point: `uvicorn asgi:application` (or hypercorn) from server/.
+
+The Flask app is still synchronous. This module is a bounded bridge that
+keeps the slow parts of a request off its threads:
+
+- Request bodies are read on the event loop into a spooled temp file
+  before a thread is taken, so a slow upload costs a socket, not a
+  thread. A body over MAX_CONTENT_LENGTH stops being read and Flask
+  answers 413 as usual.
+- The view runs on a pool of ASGI_WSGI_THREADS threads. The thread also
+  renders the first ASGI_PREFETCH_BYTES of the body, so JSON responses
+  finish in a single hop.
+- Longer bodies (media files, ranges) are sent one chunk at a time, and
+  each chunk is read on the pool. A slow listener holds a thread only
+  while a 64 KiB read runs, not for the whole download.
+- Bodies that can be iterated asynchronously, which means the
+  events.EventStream of /api/events, are awaited on the loop and hold no
+  thread at all.
+
+Email is already sent by mailer's outbox thread, not inside requests.
+The bridge stops sending when the client disconnects, and always closes
+the WSGI iterable.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from app import app
+
+ASGI_PREFETCH_BYTES = 64 * 1024
+# Uploads under this size stay in memory while they are buffered.
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+
+_executor = ThreadPoolExecutor(
+    max_workers=app.config["ASGI_WSGI_THREADS"],
+    thread_name_prefix="wsgi",
+)
+
+
+def _build_environ(scope: dict, body, content_length: int) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        # WSGI carries the raw bytes of the path as latin-1.
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(content_length),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+    for raw_name, raw_value in scope["headers"]:
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+
+        if name in ("CONTENT_LENGTH", "TRANSFER_ENCODING"):
+            # The body is fully buffered; CONTENT_LENGTH above describes it.
+            continue
+
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    return environ
+
+
+async def _read_body(receive, limit: int | None):
+    """Buffer the request body, stopping one byte past `limit`."""
+    body = SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    size = 0
+
+    while True:
+        message = await receive()
+
+        if message["type"] == "http.disconnect":
+            body.close()
+            return None, 0
+
+        chunk = message.get("body", b"")
+
+        if limit is not None and size + len(chunk) > limit:
+            # Enough for Flask to see the body is too large and answer 413.
+            chunk = chunk[: limit + 1 - size]
+            body.write(chunk)
+            size += len(chunk)
+            break
+
+        body.write(chunk)
+        size += len(chunk)
+
+        if not message.get("more_body", False):
+            break
+
+    body.seek(0)
+
+    return body, size
+
+
+def _start_wsgi(environ: dict):
+    """Run the Flask app and render the start of its body, on a pool thread."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers
+        ]
+
+    app_iter = app(environ, start_response)
+
+    if hasattr(app_iter, "__aiter__"):
+        return started, app_iter, None, [], False
+
+    iterator = iter(app_iter)
+    prefetched = []
+    size = 0
+
+    try:
+        while size < ASGI_PREFETCH_BYTES:
+            chunk = next(iterator)
+            prefetched.append(chunk)
+            size += len(chunk)
+    except StopIteration:
+        _close(app_iter)
+        return started, None, None, prefetched, True
+
+    return started, app_iter, iterator, prefetched, False
+
+
+def _next_chunk(iterator) -> bytes | None:
+    return next(iterator, None)
+
+
+def _close(app_iter) -> None:
+    close = getattr(app_iter, "close", None)
+
+    if close is not None:
+        close()
+
+
+async def _wait_for_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_async_body(app_iter, send, disconnected: asyncio.Task) -> None:
+    chunks = app_iter.__aiter__()
+
+    while True:
+        next_chunk = asyncio.ensure_future(chunks.__anext__())
+        await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+
+        if not next_chunk.done():
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+            return
+
+        try:
+            chunk = next_chunk.result()
+        except StopAsyncIteration:
+            return
+
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+
+async def _send_sync_body(iterator, send, disconnected: asyncio.Task) -> None:
+    loop = asyncio.get_running_loop()
+
+    while not disconnected.done():
+        chunk = await loop.run_in_executor(_executor, _next_chunk, iterator)
+
+        if chunk is None:
+            return
+
+        if chunk:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+
+async def _http(scope, receive, send) -> None:
+    loop = asyncio.get_running_loop()
+
+    body, size = await _read_body(receive, app.config.get("MAX_CONTENT_LENGTH"))
+
+    if body is None:
+        return
+
+    environ = _build_environ(scope, body, size)
+
+    try:
+        started, app_iter, iterator, prefetched, complete = await loop.run_in_executor(
+            _executor, _start_wsgi, environ
+        )
+    finally:
+        body.close()
+
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": started["status"],
+            "headers": started["headers"],
+        })
+
+        if complete:
+            await send({"type": "http.response.body", "body": b"".join(prefetched)})
+            return
+
+        for chunk in prefetched:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        if iterator is None:
+            await _send_async_body(app_iter, send, disconnected)
+        else:
+            await _send_sync_body(iterator, send, disconnected)
+
+        if not disconnected.done():
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+
+        if iterator is not None:
+            await loop.run_in_executor(_executor, _close, app_iter)
+        elif app_iter is not None:
+            _close(app_iter)
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            _executor.shutdown(wait=False, cancel_futures=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send) -> None:
+    if scope["type"] == "http":
+        await _http(scope, receive, send)
+    elif scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+    else:
+        raise RuntimeError(f"unsupported ASGI scope type {scope['type']!r}")
@@ -0,0 +1,103 @@
+# server/audio_pipeline.py
+"""
+Background transcoding of uploaded audio into compact, loudness-normalized
+renditions.
+
+upload_media enqueues a `transcode_audio` job; the worker runs ffmpeg once per
+entry in RENDITIONS (EBU R128 loudnorm, fixed codec and bitrate), writes each
+output next to the original under uploads/audio/renditions/, and records it
+as a MediaRendition row. Serializers advertise the first ready rendition in
+RENDITIONS order as `audio_url`, falling back to the original upload.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from uuid import uuid4
+
+from flask import current_app
+
+import jobs
+import timeline
+from models import db, Media, MediaRendition
+
+# label, ffmpeg codec, bitrate (kbps), extension, mime type -- in preference order
+RENDITIONS = (
+    ("aac_128k", "aac", 128, ".m4a", "audio/mp4"),
+    ("opus_64k", "libopus", 64, ".ogg", "audio/ogg"),
+)
+
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+RENDITION_SUBDIR = "renditions"
+FFMPEG_TIMEOUT_SECONDS = 15 * 60
+
+
+def _ffmpeg() -> str | None:
+    return current_app.config.get("FFMPEG_BINARY") or shutil.which("ffmpeg")
+
+
+def _transcode(ffmpeg: str, source: Path, dest: Path, codec: str, bitrate_kbps: int) -> None:
+    tmp_dest = dest.with_name(f".{dest.name}.part")
+
+    subprocess.run(
+        [
+            ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+            "-i", str(source),
+            "-vn",
+            "-af", LOUDNORM_FILTER,
+            "-c:a", codec,
+            "-b:a", f"{bitrate_kbps}k",
+            "-f", "ipod" if dest.suffix == ".m4a" else "ogg",
+            str(tmp_dest),
+        ],
+        check=True,
+        capture_output=True,
+        timeout=FFMPEG_TIMEOUT_SECONDS,
+    )
+
+    os.replace(tmp_dest, dest)
+
+
+@jobs.handler("transcode_audio")
+def transcode_audio(media_id: str) -> None:
+    media = db.session.get(Media, media_id)
+
+    if media is None or media.media_type != "audio":
+        return
+
+    ffmpeg = _ffmpeg()
+
+    if ffmpeg is None:
+        current_app.logger.warning("ffmpeg not found; skipping renditions for media %s", media_id)
+        return
+
+    audio_dir = Path(current_app.config["UPLOAD_AUDIO_DIR"])
+    source = audio_dir / media.filename
+    rendition_dir = audio_dir / RENDITION_SUBDIR
+    rendition_dir.mkdir(parents=True, exist_ok=True)
+
+    existing = {rendition.label for rendition in media.renditions}
+
+    for label, codec, bitrate_kbps, extension, mime_type in RENDITIONS:
+        if label in existing:
+            continue
+
+        filename = f"{RENDITION_SUBDIR}/{Path(media.filename).stem}-{label}-{uuid4().hex}{extension}"
+        dest = audio_dir / filename
+
+        _transcode(ffmpeg, source, dest, codec, bitrate_kbps)
+
+        db.session.add(MediaRendition(
+            media_id=media.id,
+            label=label,
+            mime_type=mime_type,
+            bitrate_kbps=bitrate_kbps,
+            url=f"/audio/{filename}",
+            filename=filename,
+            size_bytes=dest.stat().st_size,
+        ))
+        timeline.media_changed(media.id)
+        db.session.commit()
@@ -0,0 +1,184 @@
+# server/blob_store.py
+"""
+Content-addressed storage for uploaded media files.
+
+An upload is streamed into a temp file next to its destination while its
+SHA-256 is computed, then atomically renamed to `blobs/<ab>/<sha256><ext>`
+under the upload directory (`<ab>` being the first two hex digits). Identical
+bytes therefore land on the same path and are stored once; every Media row
+that points at a blob is a reference to it, and a blob may only be deleted
+(release) once no Media row of that type names it any more. The hash doubles
+as the file's strong ETag and makes the name safe to cache forever.
+
+A dedup hit touches the existing blob instead of writing it, and nothing
+deletes a blob touched within MEDIA_GC_GRACE_SECONDS (see discard). That
+keeps a blob alive between the hit and the commit of the Media row that
+names it, when no reference count can see it yet.
+
+Derived files (audio renditions, image variants) keep their own per-media
+names; only originals go through here.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import uuid4
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from models import db, Media
+
+BLOB_SUBDIR = "blobs"
+TMP_SUBDIR = ".tmp"
+CHUNK_SIZE = 64 * 1024
+
+BLOB_NAME_RE = re.compile(r"(?:^|/)([0-9a-f]{64})\.[A-Za-z0-9]+$")
+
+MEDIA_DIR_CONFIG = {
+    "audio": "UPLOAD_AUDIO_DIR",
+    "image": "UPLOAD_IMAGE_DIR",
+}
+
+
+@dataclass(frozen=True)
+class Blob:
+    filename: str  # relative to the upload directory
+    content_hash: str
+    size_bytes: int
+
+
+def media_dir(media_type: str) -> Path:
+    """The upload directory that Media/MediaRendition filenames of this type live in."""
+    return Path(current_app.config[MEDIA_DIR_CONFIG[media_type]])
+
+
+def upload_suffix(original_filename: str | None, default: str) -> str:
+    """Lower-cased, sanitized extension of a client file name, or `default`."""
+    suffix = Path(secure_filename(original_filename or "")).suffix.lower()
+    return suffix if re.fullmatch(r"\.[a-z0-9]{1,10}", suffix) else default
+
+
+def _temp_path(directory: str | Path) -> Path:
+    tmp_dir = Path(directory) / TMP_SUBDIR
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    return tmp_dir / f"{uuid4().hex}.part"
+
+
+def _touch(path: Path) -> bool:
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+
+    return True
+
+
+def _commit_blob(directory: str | Path, tmp_path: Path, content_hash: str, suffix: str) -> Blob:
+    filename = f"{BLOB_SUBDIR}/{content_hash[:2]}/{content_hash}{suffix}"
+    dest = Path(directory) / filename
+    size = tmp_path.stat().st_size
+
+    if _touch(dest):
+        # Already stored: same hash means same bytes.
+        tmp_path.unlink(missing_ok=True)
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, dest)
+
+    return Blob(filename=filename, content_hash=content_hash, size_bytes=size)
+
+
+def store_stream(stream, directory: str | Path, *, suffix: str) -> Blob:
+    """Copy a binary stream into the store, hashing it on the way."""
+    tmp_path = _temp_path(directory)
+    digest = hashlib.sha256()
+
+    try:
+        with open(tmp_path, "wb") as out:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+
+        return _commit_blob(directory, tmp_path, digest.hexdigest(), suffix)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def store_upload(file_storage, directory: str | Path, *, default_suffix: str) -> Blob:
+    """Store a werkzeug FileStorage, keeping its (sanitized) extension."""
+    return store_stream(
+        file_storage.stream,
+        directory,
+        suffix=upload_suffix(file_storage.filename, default_suffix),
+    )
+
+
+def store_file(path: str | Path, directory: str | Path) -> Blob:
+    """Move a file already written under `directory` (see new_temp_path) into the store."""
+    path = Path(path)
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return _commit_blob(directory, path, digest.hexdigest(), path.suffix.lower())
+
+
+def new_temp_path(directory: str | Path, suffix: str) -> Path:
+    """A scratch path on the same filesystem as the store, for store_file."""
+    return _temp_path(directory).with_suffix(suffix)
+
+
+def reference_count(media_type: str, filename: str) -> int:
+    return db.session.scalar(
+        db.select(db.func.count(Media.id)).where(
+            Media.media_type == media_type,
+            Media.filename == filename,
+        )
+    )
+
+
+def discard(directory: str | Path, filename: str, touched_before: float) -> bool:
+    """Delete a stored file unless it was touched at or after `touched_before`.
+
+    The file is renamed aside before its mtime is read. A dedup hit that
+    touched it first gets it put back; one that comes after the rename finds
+    no file and stores its own copy. Returns True if deleted.
+    """
+    path = Path(directory) / filename
+    aside = _temp_path(directory).with_suffix(".deleted")
+
+    try:
+        os.rename(path, aside)
+    except FileNotFoundError:
+        return False
+
+    if aside.stat().st_mtime >= touched_before:
+        # Same bytes as any copy stored in the meantime.
+        os.replace(aside, path)
+        return False
+
+    aside.unlink(missing_ok=True)
+
+    return True
+
+
+def release(media_type: str, directory: str | Path, filename: str) -> bool:
+    """Delete a blob once no Media row references it. Returns True if deleted.
+
+    Blobs touched within the grace period are left for media_gc's sweep.
+    """
+    if not BLOB_NAME_RE.search(filename) or reference_count(media_type, filename):
+        return False
+
+    grace_cutoff = time.time() - current_app.config["MEDIA_GC_GRACE_SECONDS"]
+
+    return discard(directory, filename, grace_cutoff)
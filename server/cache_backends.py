@@ -0,0 +1,150 @@
+# server/cache_backends.py
+"""
+Small key/value stores for response caches such as feed_cache.
+
+Keys are strings and values are bytes; every entry has a TTL and each
+store holds at most `max_entries`.
+
+- MemoryBackend: an LRU dict for one process. It is the fastest, but each
+  web worker has its own copy.
+- SQLiteBackend: a separate SQLite file that every worker on the box
+  shares. When full it drops the entries closest to expiry.
+
+make_backend() picks one by name ("memory", "sqlite", or "none" to turn
+caching off).
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+PRUNE_EVERY_N_WRITES = 64
+
+
+class MemoryBackend:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # key -> (expires_at on the monotonic clock, value)
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set_many(self, items: dict[str, bytes], ttl_seconds: float) -> None:
+        expires_at = time.monotonic() + ttl_seconds
+
+        with self._lock:
+            for key, value in items.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self.set_many({key: value}, ttl_seconds)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (expires_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread, and never one inherited through fork.
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = OFF")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+
+        return connection
+
+    def get(self, key: str) -> bytes | None:
+        row = self._connect().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+
+        return None if row is None else row[0]
+
+    def set_many(self, items: dict[str, bytes], ttl_seconds: float) -> None:
+        connection = self._connect()
+        expires_at = time.time() + ttl_seconds
+
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, value in items.items()],
+            )
+
+        self._writes += 1
+
+        # Approximate under concurrency, which is fine for a housekeeping cadence.
+        if self._writes % PRUNE_EVERY_N_WRITES == 0:
+            self._prune(connection)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self.set_many({key: value}, ttl_seconds)
+
+    def _prune(self, connection: sqlite3.Connection) -> None:
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+            connection.execute(
+                "DELETE FROM cache_entries WHERE key IN ("
+                "SELECT key FROM cache_entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM cache_entries")
+
+
+def make_backend(name: str, *, max_entries: int, path: str | None = None):
+    if name == "memory":
+        return MemoryBackend(max_entries)
+
+    if name == "sqlite":
+        return SQLiteBackend(path, max_entries)
+
+    if name in ("", "none"):
+        return None
+
+    raise ValueError(f"unknown cache backend {name!r}")
@@ -0,0 +1,306 @@
+# server/chunked_uploads.py
+"""
+Resumable, chunked uploads for large media such as hour-long recordings.
+
+1. create_session() takes the media type, file name, total size and (for
+   audio, optionally) the duration. Size, duration and the user's storage
+   quota are checked here, before any bytes are sent.
+2. write_chunk() streams one fixed-size, numbered chunk from the request
+   body straight into its offset of a staging file under blob_store's temp
+   directory, CHUNK_IO_SIZE bytes at a time. Chunks may arrive in any order
+   and may be re-sent; an UploadChunk row records each one that arrived
+   complete, so an interrupted client asks which ones are missing and
+   resumes from there.
+3. finalize() checks that every chunk is present, measures the audio
+   duration (container header, else ffmpeg), moves the file into
+   blob_store and adds a Media row. Finalizing again returns the same row.
+   Audio whose length can't be measured yet (MediaRecorder WebM without
+   ffmpeg) is accepted; the extract_media_metadata job enforces the limit
+   once it knows the duration.
+
+The one-shot /api/upload_media applies the same quota and duration checks
+through check_quota() and checked_audio_duration().
+
+Sessions expire after UPLOAD_SESSION_TTL_SECONDS of inactivity.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+import blob_store
+from media_metadata import audio_duration
+from models import db, Media, UploadChunk, UploadSession
+
+CHUNK_IO_SIZE = 64 * 1024
+
+MAX_BYTES_CONFIG = {
+    "audio": "MAX_AUDIO_UPLOAD_BYTES",
+    "image": "MAX_IMAGE_UPLOAD_BYTES",
+}
+DEFAULT_SUFFIX = {
+    "audio": ".webm",
+    "image": ".jpg",
+}
+
+
+class UploadError(ValueError):
+    """A rejected upload request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes even for timezone=True columns.
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=current_app.config["UPLOAD_SESSION_TTL_SECONDS"])
+
+
+def staging_path(upload: UploadSession) -> Path:
+    tmp_dir = blob_store.media_dir(upload.media_type) / blob_store.TMP_SUBDIR
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    return tmp_dir / f"upload-{upload.id}{upload.suffix}"
+
+
+def chunk_count(upload: UploadSession) -> int:
+    return max(-(-upload.total_bytes // upload.chunk_size), 1)
+
+
+def expected_chunk_size(upload: UploadSession, index: int) -> int:
+    if index < chunk_count(upload) - 1:
+        return upload.chunk_size
+
+    return upload.total_bytes - upload.chunk_size * (chunk_count(upload) - 1)
+
+
+def received_indexes(upload: UploadSession) -> list[int]:
+    return list(
+        db.session.scalars(
+            db.select(UploadChunk.chunk_index)
+            .where(UploadChunk.session_id == upload.id)
+            .order_by(UploadChunk.chunk_index)
+        )
+    )
+
+
+def describe(upload: UploadSession) -> dict:
+    received = received_indexes(upload)
+
+    return {
+        "id": upload.id,
+        "media_type": upload.media_type,
+        "status": upload.status,
+        "total_bytes": upload.total_bytes,
+        "chunk_size": upload.chunk_size,
+        "chunk_count": chunk_count(upload),
+        "received_chunks": received,
+        "missing_chunks": sorted(set(range(chunk_count(upload))) - set(received)),
+        "media_id": upload.media_id,
+        "expires_at": _aware(upload.expires_at).isoformat(),
+    }
+
+
+def bytes_in_use(user_id: str) -> int:
+    """Stored media plus the declared size of the user's open sessions."""
+    stored = db.session.scalar(
+        db.select(db.func.coalesce(db.func.sum(Media.size_bytes), 0))
+        .where(Media.user_id == user_id)
+    )
+    pending = db.session.scalar(
+        db.select(db.func.coalesce(db.func.sum(UploadSession.total_bytes), 0))
+        .where(
+            UploadSession.user_id == user_id,
+            UploadSession.status == "open",
+            UploadSession.expires_at > _now(),
+        )
+    )
+
+    return stored + pending
+
+
+def check_quota(user_id: str, incoming_bytes: int) -> None:
+    if bytes_in_use(user_id) + incoming_bytes > current_app.config["USER_UPLOAD_QUOTA_BYTES"]:
+        raise UploadError("This upload would exceed your storage quota.", 413)
+
+
+def checked_audio_duration(path: Path) -> float | None:
+    """The duration of a stored audio file, rejecting one over MAX_AUDIO_DURATION_SECONDS.
+
+    None when it can't be measured here; extract_media_metadata checks again.
+    """
+    duration = audio_duration(path)
+
+    if duration is not None and duration > current_app.config["MAX_AUDIO_DURATION_SECONDS"]:
+        raise UploadError("That recording is too long.", 413)
+
+    return duration
+
+
+def create_session(
+    user_id: str,
+    *,
+    media_type: str,
+    filename: str | None,
+    total_bytes: int,
+    duration_seconds: float | None = None,
+) -> UploadSession:
+    config = current_app.config
+
+    if media_type not in blob_store.MEDIA_DIR_CONFIG:
+        raise UploadError("media_type must be 'audio' or 'image'.")
+
+    if total_bytes <= 0:
+        raise UploadError("total_bytes must be positive.")
+
+    if total_bytes > config[MAX_BYTES_CONFIG[media_type]]:
+        raise UploadError("That file is too large.", 413)
+
+    if media_type == "audio" and duration_seconds is not None:
+        if duration_seconds > config["MAX_AUDIO_DURATION_SECONDS"]:
+            raise UploadError("That recording is too long.", 413)
+
+    check_quota(user_id, total_bytes)
+
+    upload = UploadSession(
+        user_id=user_id,
+        media_type=media_type,
+        suffix=blob_store.upload_suffix(filename, DEFAULT_SUFFIX[media_type]),
+        total_bytes=total_bytes,
+        chunk_size=config["UPLOAD_CHUNK_SIZE"],
+        declared_duration=duration_seconds,
+        expires_at=_now() + _ttl(),
+    )
+    db.session.add(upload)
+    db.session.flush()
+
+    return upload
+
+
+def get_session(user_id: str, session_id: str) -> UploadSession:
+    upload = db.session.get(UploadSession, session_id)
+
+    if upload is None or upload.user_id != user_id:
+        raise UploadError("upload not found", 404)
+
+    if upload.status == "open" and _aware(upload.expires_at) <= _now():
+        raise UploadError("upload session expired", 410)
+
+    return upload
+
+
+def write_chunk(upload: UploadSession, index: int, stream, content_length: int | None) -> None:
+    """Stream one chunk into place, then record it (idempotent per index)."""
+    if upload.status != "open":
+        raise UploadError("upload is no longer open", 409)
+
+    if not 0 <= index < chunk_count(upload):
+        raise UploadError("chunk index out of range")
+
+    expected = expected_chunk_size(upload, index)
+
+    if content_length is None:
+        raise UploadError("Content-Length is required", 411)
+
+    if content_length != expected:
+        raise UploadError(f"chunk {index} must be exactly {expected} bytes")
+
+    fd = os.open(staging_path(upload), os.O_WRONLY | os.O_CREAT, 0o644)
+    offset = index * upload.chunk_size
+    written = 0
+
+    try:
+        while written < expected:
+            block = stream.read(min(CHUNK_IO_SIZE, expected - written))
+
+            if not block:
+                break
+
+            os.pwrite(fd, block, offset + written)
+            written += len(block)
+    finally:
+        os.close(fd)
+
+    if written != expected:
+        raise UploadError(f"chunk {index} was cut short; send it again")
+
+    upload.expires_at = _now() + _ttl()
+
+    chunk = db.session.get(UploadChunk, (upload.id, index))
+
+    if chunk is None:
+        db.session.add(UploadChunk(session_id=upload.id, chunk_index=index, size_bytes=written))
+    else:
+        chunk.size_bytes = written
+        chunk.received_at = _now()
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent retry of the same chunk recorded it first.
+        db.session.rollback()
+
+
+def finalize(upload: UploadSession) -> Media:
+    """Turn a complete session into a Media row (added to the session, not committed)."""
+    if upload.status == "finalized":
+        return db.session.get(Media, upload.media_id)
+
+    if upload.status != "open":
+        raise UploadError("upload is no longer open", 409)
+
+    missing = sorted(set(range(chunk_count(upload))) - set(received_indexes(upload)))
+
+    if missing:
+        raise UploadError(f"missing chunks: {missing[:20]}", 409)
+
+    staged = staging_path(upload)
+
+    if not staged.is_file() or staged.stat().st_size != upload.total_bytes:
+        raise UploadError("staged upload is incomplete; resend all chunks", 409)
+
+    duration = None
+
+    if upload.media_type == "audio":
+        try:
+            duration = checked_audio_duration(staged)
+        except UploadError:
+            staged.unlink(missing_ok=True)
+            upload.status = "rejected"
+            db.session.commit()
+            raise
+
+    blob = blob_store.store_file(staged, blob_store.media_dir(upload.media_type))
+    url_prefix = "/audio" if upload.media_type == "audio" else "/images"
+
+    media = Media(
+        media_type=upload.media_type,
+        url=f"{url_prefix}/{blob.filename}",
+        filename=blob.filename,
+        content_hash=blob.content_hash,
+        size_bytes=blob.size_bytes,
+        duration=duration,
+        user_id=upload.user_id,
+    )
+    db.session.add(media)
+    db.session.flush()
+
+    upload.status = "finalized"
+    upload.media_id = media.id
+    upload.chunks.delete()
+
+    return media
@@ -0,0 +1,34 @@
+# server/collect_garbage.py
+"""
+Run media_gc cycles until a full pass finds nothing left to delete.
+
+The `collect_garbage` job does the same work a batch at a time in the
+background; this is for catching up by hand (e.g. after lowering the grace
+period or the reap delay).
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+
+from app import app
+import media_gc
+
+
+with app.app_context():
+    totals = Counter()
+
+    while True:
+        stats = media_gc.collect()
+        totals.update({key: value for key, value in stats.items() if key != "sweep_complete"})
+
+        idle = not any(
+            stats[key]
+            for key in ("posts_reaped", "upload_sessions_expired", "media_collected", "files_deleted")
+        )
+
+        if idle and stats["sweep_complete"]:
+            break
+
+    for key, value in totals.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,115 @@
+# server/counters.py
+"""
+Denormalized like/comment/reply/follower counters.
+
+The adjust_* helpers issue `col = col + delta` updates inside the caller's
+transaction, next to the Like/Comment/Follow insert or delete they account for,
+so counts commit or roll back together with the rows they describe. Post and
+comment updates also bump the row's `version`, which response ETags are built
+from. repair_all recomputes every counter from the source tables and reports
+how many rows had drifted.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import aliased
+
+from models import db, Comment, Follow, Like, Post, User
+
+
+def adjust_post(post_id: str, *, likes: int = 0, comments: int = 0) -> None:
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(
+            like_count=Post.like_count + likes,
+            comment_count=Post.comment_count + comments,
+            version=Post.version + 1,
+        )
+    )
+
+
+def adjust_comment(comment_id: str, *, likes: int = 0, replies: int = 0) -> None:
+    db.session.execute(
+        update(Comment)
+        .where(Comment.id == comment_id)
+        .values(
+            like_count=Comment.like_count + likes,
+            reply_count=Comment.reply_count + replies,
+            version=Comment.version + 1,
+        )
+    )
+
+
+def adjust_followers(user_id: str, delta: int) -> None:
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(follower_count=User.follower_count + delta)
+    )
+
+
+def comment_subtree_ids(comment: Comment) -> list[str]:
+    """Ids of a comment and all of its nested replies."""
+    subtree_ids = [comment.id]
+    frontier = [comment.id]
+
+    while frontier:
+        frontier = list(
+            db.session.scalars(
+                select(Comment.id).where(Comment.parent_id.in_(frontier))
+            )
+        )
+        subtree_ids.extend(frontier)
+
+    return subtree_ids
+
+
+def _count_of(column, owner_id):
+    return (
+        select(db.func.count())
+        .where(column == owner_id)
+        .correlate(owner_id.class_)
+        .scalar_subquery()
+    )
+
+
+def _repair(model, column, actual) -> int:
+    result = db.session.execute(
+        update(model)
+        .where(column != actual)
+        .values({column: actual, model.version: model.version + 1})
+        .execution_options(synchronize_session=False)
+    )
+
+    return result.rowcount
+
+
+def repair_follower_counts() -> int:
+    return _repair(User, User.follower_count, _count_of(Follow.followee_id, User.id))
+
+
+def repair_all() -> dict[str, int]:
+    """Recompute every counter; returns drifted row counts per counter."""
+    Reply = aliased(Comment)
+
+    drift = {
+        "posts.like_count": _repair(
+            Post, Post.like_count, _count_of(Like.post_id, Post.id)
+        ),
+        "posts.comment_count": _repair(
+            Post, Post.comment_count, _count_of(Comment.post_id, Post.id)
+        ),
+        "comments.like_count": _repair(
+            Comment, Comment.like_count, _count_of(Like.comment_id, Comment.id)
+        ),
+        "comments.reply_count": _repair(
+            Comment, Comment.reply_count, _count_of(Reply.parent_id, Comment.id)
+        ),
+        "users.follower_count": repair_follower_counts(),
+    }
+
+    db.session.commit()
+
+    return drift
@@ -0,0 +1,82 @@
+# server/cursors.py
+"""
+Opaque keyset-pagination cursors.
+
+A cursor is the signed (created_at, id) of the last row on a page. Pages are
+fetched with a composite `(created_at, id) < (?, ?)` predicate (or `>` for
+ascending lists), so ties on created_at are broken by id and every page is an
+index range scan regardless of depth.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from models import db
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(
+        current_app.config["SECRET_KEY"],
+        salt="pagination-cursor",
+    )
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    return _serializer().dumps([created_at.isoformat(), row_id])
+
+
+def decode_cursor(token: str) -> tuple[datetime, str]:
+    try:
+        created_at, row_id = _serializer().loads(token)
+        return datetime.fromisoformat(created_at), row_id
+    except (BadSignature, TypeError, ValueError) as e:
+        raise InvalidCursor("invalid cursor") from e
+
+
+def paginate(query, created_col, id_col, *, cursor: str | None, limit: int, descending: bool = True):
+    """Apply keyset filter, ordering and limit to a query.
+
+    Fetches one extra row so callers can tell whether a next page exists;
+    use page_of() to split the result.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        position = db.tuple_(created_col, id_col)
+        boundary = db.tuple_(
+            db.literal(created_at, created_col.type),
+            db.literal(row_id, id_col.type),
+        )
+
+        if descending:
+            query = query.filter(position < boundary)
+        else:
+            query = query.filter(position > boundary)
+
+    if descending:
+        query = query.order_by(created_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(created_col.asc(), id_col.asc())
+
+    return query.limit(limit + 1)
+
+
+def page_of(rows: list, limit: int) -> tuple[list, str | None]:
+    """Split paginate() results into (page rows, next cursor or None).
+
+    Rows must expose `created_at` and `id`.
+    """
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+
+    return rows, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,106 @@
+# server/db_engine.py
+"""
+Engine and connection-pool settings for the app's database.
+
+init_app() replaces a bare `db.init_app(app)`. It builds
+SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings and, for SQLite,
+applies these pragmas to every new connection:
+
+- journal_mode=WAL, so readers don't block the writer or each other;
+- synchronous=NORMAL, which is durable against app crashes in WAL mode
+  (only a power loss can drop the last few commits) and skips an fsync per
+  commit;
+- busy_timeout, so a writer waits for the lock instead of failing at once
+  with "database is locked";
+- mmap_size and cache_size, so hot pages are read from memory.
+
+Each setting has an SQLITE_* config key. A single SQLite file allows one
+writer at a time however the pool is sized, so write transactions should
+stay short. Server databases (e.g. Postgres via DATABASE_URL) get the pool
+settings plus pool_pre_ping and pool_recycle.
+
+Each of DATABASE_REPLICA_URLS becomes a `replica_<n>` bind with the same
+treatment; db_routing decides which requests read from them.
+"""
+
+from __future__ import annotations
+
+from functools import partial
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from models import db
+import db_routing
+
+_SQLITE_PRAGMAS = (
+    ("journal_mode", "SQLITE_JOURNAL_MODE"),
+    ("synchronous", "SQLITE_SYNCHRONOUS"),
+    ("busy_timeout", "SQLITE_BUSY_TIMEOUT_MS"),
+    ("mmap_size", "SQLITE_MMAP_SIZE"),
+    ("cache_size", "SQLITE_CACHE_SIZE"),
+)
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+
+
+def engine_options(config, uri: str) -> dict:
+    url = make_url(uri)
+    options = dict(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+
+    if url.get_backend_name() == "sqlite" and _is_memory_sqlite(url):
+        # SQLAlchemy picks a single-connection pool for in-memory databases.
+        return options
+
+    options.setdefault("pool_size", config["DB_POOL_SIZE"])
+    options.setdefault("max_overflow", config["DB_MAX_OVERFLOW"])
+    options.setdefault("pool_timeout", config["DB_POOL_TIMEOUT_SECONDS"])
+
+    if url.get_backend_name() == "sqlite":
+        # The driver's own lock wait, in seconds; kept in step with busy_timeout.
+        connect_args = options.setdefault("connect_args", {})
+        connect_args.setdefault("timeout", config["SQLITE_BUSY_TIMEOUT_MS"] / 1000)
+    else:
+        options.setdefault("pool_pre_ping", True)
+        options.setdefault("pool_recycle", config["DB_POOL_RECYCLE_SECONDS"])
+
+    return options
+
+
+def _apply_sqlite_pragmas(config, dbapi_connection, _connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+
+    try:
+        for pragma, config_key in _SQLITE_PRAGMAS:
+            value = config[config_key]
+
+            if value is not None and value != "":
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+    finally:
+        cursor.close()
+
+
+def init_app(app: Flask) -> None:
+    config = app.config
+    primary_options = engine_options(config, config["SQLALCHEMY_DATABASE_URI"])
+
+    binds = dict(config.get("SQLALCHEMY_BINDS") or {})
+
+    for index, url in enumerate(config["DATABASE_REPLICA_URLS"]):
+        binds[f"{db_routing.REPLICA_BIND_PREFIX}{index}"] = {"url": url, **engine_options(config, url)}
+
+    config["SQLALCHEMY_ENGINE_OPTIONS"] = primary_options
+    config["SQLALCHEMY_BINDS"] = binds
+    db.init_app(app)
+
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    for engine in engines:
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", partial(_apply_sqlite_pragmas, config))
+
+    db_routing.init_app(app)
@@ -0,0 +1,82 @@
+# server/db_routing.py
+"""
+Send read-only requests to database replicas.
+
+Views decorated with @reads_from_replica run their queries on one of the
+DATABASE_REPLICA_URLS binds (picked at random per request). Everything else
+uses the primary, and so does anything a routed request flushes or
+executes as INSERT/UPDATE/DELETE.
+
+Replicas lag. So that a user sees their own like or comment straight away,
+any request that writes through the session stamps the login session
+cookie. That client's next reads stay on the primary for
+REPLICA_STICKY_SECONDS. Because the stamp lives in the cookie, it works
+across web processes.
+
+With no replica configured, everything goes to the primary. To try it
+locally without Postgres, point DATABASE_REPLICA_URLS at a copy of the
+SQLite file (e.g. `cp instance/data.db /tmp/replica.db` and
+DATABASE_REPLICA_URLS=sqlite:////tmp/replica.db). It is a replica that
+never catches up, so anything written after the copy shows up in routed
+reads only while the writer is sticky.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from functools import wraps
+
+from flask import Flask, current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND_PREFIX = "replica_"
+_WRITE_STAMP_KEY = "db_write_at"
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy's session, reading from a replica when the request asks for it."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g.db_wrote = True
+            elif g.get("db_replica_key"):
+                return self._db.engines[g.db_replica_key]
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_keys(engines) -> list[str]:
+    return [key for key in engines if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)]
+
+
+def _wrote_recently(sticky_seconds: float) -> bool:
+    wrote_at = session.get(_WRITE_STAMP_KEY)
+
+    return wrote_at is not None and time.time() - wrote_at < sticky_seconds
+
+
+def reads_from_replica(view):
+    """Route this view's queries to a replica unless the client just wrote."""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        keys = replica_keys(current_app.extensions["sqlalchemy"].engines)
+
+        if keys and not _wrote_recently(current_app.config["REPLICA_STICKY_SECONDS"]):
+            g.db_replica_key = random.choice(keys)
+
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def init_app(app: Flask) -> None:
+    @app.after_request
+    def _stamp_writes(response):
+        if g.get("db_wrote") and app.config["REPLICA_STICKY_SECONDS"] > 0:
+            session[_WRITE_STAMP_KEY] = time.time()
+
+        return response
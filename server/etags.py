@@ -0,0 +1,49 @@
+# server/etags.py
+"""
+Conditional GET for JSON endpoints.
+
+A view builds an ETag from cheap version data before it does any expensive
+work. That data is the ids on the page plus the `version` columns of the
+rows the serializer would read (see serializers.posts_version). If the
+client's If-None-Match already holds that tag, the view answers 304 with no
+body. Otherwise it renders as usual and tags the response:
+
+    etag = etags.make("feed", current_user.id, cursor, versions)
+    if etags.matches(etag):
+        return etags.not_modified(etag)
+    ...
+    return etags.tag(jsonify(payload), etag), 200
+
+The viewer is always one of the parts, so users never share tags.
+`Cache-Control: private, no-cache` makes browsers revalidate every time
+instead of reusing a stale copy.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+from flask import Response, request
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def make(*parts) -> str:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def matches(etag: str) -> bool:
+    # If-None-Match uses weak comparison (RFC 9110 13.1.2).
+    return request.if_none_match.contains_weak(etag)
+
+
+def tag(response: Response, etag: str) -> Response:
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.vary.add("Cookie")
+
+    return response
+
+
+def not_modified(etag: str) -> Response:
+    return tag(Response(status=304), etag)
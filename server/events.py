@@ -0,0 +1,377 @@
+# server/events.py
+"""
+Live updates over Server-Sent Events (GET /api/events).
+
+Write handlers publish() small JSON deltas to topics:
+
+    user:<id>     follows of, and by, that user
+    author:<id>   new and deleted posts by that user
+    post:<id>     like and comment counts of that post, and its deletion
+
+A stream subscribes to its own user topic, the author topic of every user
+it follows, and the post topics the client asked for. Follows and unfollows
+seen on the user topic add or drop author topics while the stream runs.
+
+Like the other write hooks, publish() joins the caller's transaction:
+nothing is sent unless it commits. EVENTS_BACKEND picks the transport:
+
+- "memory": events reach streams held by this process only, after commit.
+- "postgres": the event is a NOTIFY in the same transaction. Postgres
+  delivers it at commit to a LISTEN thread in every web worker, and each
+  thread hands it to its local streams.
+
+Under a WSGI server each stream holds a thread; under asgi.py it is awaited
+on the event loop instead. Either way there are at most EVENTS_MAX_STREAMS
+per process. A stream closes after EVENTS_MAX_STREAM_SECONDS, and the
+browser's EventSource reconnects, which picks up follows made elsewhere. A
+client that falls EVENTS_QUEUE_SIZE events behind gets a `resync` event and
+is disconnected, and it should refetch what it shows.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import queue
+import threading
+import time
+
+from flask import Flask, Response, current_app
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+from db_routing import RoutingSession
+from models import db
+
+NOTIFY_CHANNEL = "soundgalore_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD_BYTES = 7900
+LISTEN_RETRY_SECONDS = 2
+CLIENT_RETRY_MS = 3000
+KEEPALIVE = b": keepalive\n\n"
+
+_PENDING_KEY = "events_pending"
+_RESYNC = object()
+
+_listener_lock = threading.Lock()
+_listener_started = False
+
+
+class Subscription:
+    def __init__(self, topics, queue_size: int):
+        self.topics = set(topics)
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+        # Called after each put, for consumers that can't block on the queue.
+        self.wakeup = None
+
+
+class Broker:
+    """Topic fan-out to the streams held by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_topic: dict[str, set[Subscription]] = {}
+        self._count = 0
+
+    def subscribe(self, topics, *, queue_size: int, limit: int) -> Subscription | None:
+        with self._lock:
+            if self._count >= limit:
+                return None
+
+            self._count += 1
+            subscription = Subscription(topics, queue_size)
+
+            for topic in subscription.topics:
+                self._by_topic.setdefault(topic, set()).add(subscription)
+
+        return subscription
+
+    def add_topic(self, subscription: Subscription, topic: str) -> None:
+        with self._lock:
+            subscription.topics.add(topic)
+            self._by_topic.setdefault(topic, set()).add(subscription)
+
+    def remove_topic(self, subscription: Subscription, topic: str) -> None:
+        with self._lock:
+            subscription.topics.discard(topic)
+            subscribers = self._by_topic.get(topic)
+
+            if subscribers is not None:
+                subscribers.discard(subscription)
+
+                if not subscribers:
+                    del self._by_topic[topic]
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription.closed:
+                return
+
+            subscription.closed = True
+            self._count -= 1
+
+            for topic in subscription.topics:
+                subscribers = self._by_topic.get(topic)
+
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+
+                    if not subscribers:
+                        del self._by_topic[topic]
+
+            subscription.topics.clear()
+
+    def deliver(self, message: dict) -> None:
+        with self._lock:
+            targets = set()
+
+            for topic in message["topics"]:
+                targets.update(self._by_topic.get(topic, ()))
+
+        for subscription in targets:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # Too far behind: drop the backlog and tell the client to resync.
+                _resync(subscription)
+
+            if subscription.wakeup is not None:
+                subscription.wakeup()
+
+    def resync_all(self) -> None:
+        with self._lock:
+            targets = set().union(*self._by_topic.values())
+
+        for subscription in targets:
+            _resync(subscription)
+
+            if subscription.wakeup is not None:
+                subscription.wakeup()
+
+
+broker = Broker()
+
+
+def _resync(subscription: Subscription) -> None:
+    try:
+        while True:
+            subscription.queue.get_nowait()
+    except queue.Empty:
+        pass
+
+    try:
+        subscription.queue.put_nowait(_RESYNC)
+    except queue.Full:
+        pass  # another thread refilled it; the stream still ends on its _RESYNC
+
+
+def publish(topics, event_type: str, data: dict) -> None:
+    """Send an event to `topics` once the current transaction commits."""
+    message = {"topics": list(topics), "event": event_type, "data": data}
+
+    if current_app.config["EVENTS_BACKEND"] == "postgres":
+        payload = json.dumps(message, separators=(",", ":"))
+
+        if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+            current_app.logger.warning("Dropping oversized %s event", event_type)
+            return
+
+        db.session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": NOTIFY_CHANNEL, "payload": payload},
+        )
+    else:
+        db.session.info.setdefault(_PENDING_KEY, []).append(message)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _deliver_pending(session) -> None:
+    for message in session.info.pop(_PENDING_KEY, ()):
+        broker.deliver(message)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _discard_pending(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+# ------------------------------------------------------------------------------------
+# Postgres LISTEN thread
+# ------------------------------------------------------------------------------------
+
+def _listen_forever(app: Flask, conninfo: str) -> None:
+    import psycopg
+
+    while True:
+        try:
+            with psycopg.connect(conninfo, autocommit=True) as connection:
+                connection.execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+                for notify in connection.notifies():
+                    broker.deliver(json.loads(notify.payload))
+        except Exception:
+            app.logger.exception("Event listener connection lost")
+
+        # Events published while reconnecting are lost, so tell streams to resync.
+        broker.resync_all()
+        time.sleep(LISTEN_RETRY_SECONDS)
+
+
+def start_listener(app: Flask) -> None:
+    """Start the LISTEN thread once per process when the backend needs one."""
+    global _listener_started
+
+    if app.config["EVENTS_BACKEND"] != "postgres":
+        return
+
+    with _listener_lock:
+        if _listener_started:
+            return
+
+        _listener_started = True
+
+    # psycopg wants a plain libpq URL, not SQLAlchemy's "postgresql+psycopg://".
+    url = make_url(app.config["SQLALCHEMY_DATABASE_URI"]).set(drivername="postgresql")
+
+    threading.Thread(
+        target=_listen_forever,
+        args=(app, url.render_as_string(hide_password=False)),
+        name="event-listener",
+        daemon=True,
+    ).start()
+
+
+# ------------------------------------------------------------------------------------
+# Streams
+# ------------------------------------------------------------------------------------
+
+def _format(event_type: str, data: dict) -> bytes:
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+def _follow_topics(subscription: Subscription, user_id: str, message: dict) -> None:
+    data = message["data"]
+
+    if data.get("follower_id") != user_id:
+        return
+
+    if message["event"] == "followed":
+        broker.add_topic(subscription, f"author:{data['followee_id']}")
+    elif message["event"] == "unfollowed":
+        broker.remove_topic(subscription, f"author:{data['followee_id']}")
+
+
+class EventStream:
+    """The body of one event stream.
+
+    WSGI servers iterate it and block a thread in queue.get(); the asgi
+    bridge iterates it asynchronously, so an idle stream holds no thread.
+    close() ends the subscription either way.
+    """
+
+    def __init__(self, subscription: Subscription, user_id: str, heartbeat: float, max_seconds: float):
+        self.subscription = subscription
+        self.user_id = user_id
+        self.heartbeat = heartbeat
+        self.deadline = time.monotonic() + max_seconds
+
+    def _render(self, message) -> bytes:
+        if message is _RESYNC:
+            return _format("resync", {})
+
+        _follow_topics(self.subscription, self.user_id, message)
+        return _format(message["event"], message["data"])
+
+    def __iter__(self):
+        yield f"retry: {CLIENT_RETRY_MS}\n\n".encode()
+
+        while (remaining := self.deadline - time.monotonic()) > 0:
+            try:
+                message = self.subscription.queue.get(timeout=min(self.heartbeat, remaining))
+            except queue.Empty:
+                # Keeps proxies from timing the stream out, and surfaces a
+                # closed client as a write error so the thread is freed.
+                yield KEEPALIVE
+                continue
+
+            yield self._render(message)
+
+            if message is _RESYNC:
+                return
+
+    async def _aiter(self):
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+
+        def wakeup():
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass  # the loop is shutting down
+
+        self.subscription.wakeup = wakeup
+
+        yield f"retry: {CLIENT_RETRY_MS}\n\n".encode()
+
+        while (remaining := self.deadline - time.monotonic()) > 0:
+            # Clear before checking, so an event that lands in between still wakes us.
+            ready.clear()
+
+            try:
+                message = self.subscription.queue.get_nowait()
+            except queue.Empty:
+                try:
+                    await asyncio.wait_for(ready.wait(), min(self.heartbeat, remaining))
+                except TimeoutError:
+                    yield KEEPALIVE
+
+                continue
+
+            yield self._render(message)
+
+            if message is _RESYNC:
+                return
+
+    def __aiter__(self):
+        return self._aiter()
+
+    def close(self) -> None:
+        broker.unsubscribe(self.subscription)
+
+
+def open_stream(user_id: str, followee_ids, post_ids) -> Response | None:
+    """The text/event-stream response for one client, or None when full."""
+    config = current_app.config
+    start_listener(current_app._get_current_object())
+
+    topics = [f"user:{user_id}"]
+    topics += [f"author:{followee_id}" for followee_id in followee_ids]
+    topics += [f"post:{post_id}" for post_id in post_ids]
+
+    subscription = broker.subscribe(
+        topics,
+        queue_size=config["EVENTS_QUEUE_SIZE"],
+        limit=config["EVENTS_MAX_STREAMS"],
+    )
+
+    if subscription is None:
+        return None
+
+    # Passed through as-is, so the server sees EventStream (and its close()
+    # and __aiter__) rather than a wrapper around it.
+    response = Response(
+        EventStream(
+            subscription,
+            user_id,
+            config["EVENTS_HEARTBEAT_SECONDS"],
+            config["EVENTS_MAX_STREAM_SECONDS"],
+        ),
+        mimetype="text/event-stream",
+        direct_passthrough=True,
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream.
+    response.headers["X-Accel-Buffering"] = "no"
+
+    return response
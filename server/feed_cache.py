@@ -0,0 +1,184 @@
+# server/feed_cache.py
+"""
+Cache of rendered /api/feed pages, keyed by user and cursor.
+
+A page is stored as its ETag and JSON response body, so a hit skips the
+timeline query, the post serialization and jsonify. The store comes from
+cache_backends: FEED_CACHE_BACKEND picks "memory" (per process), "sqlite"
+(a file at FEED_CACHE_PATH shared by every worker on the box) or "none".
+It holds at most FEED_CACHE_SIZE entries, each good for
+FEED_CACHE_TTL_SECONDS.
+
+Invalidation is per user. Every user has a generation token that is part
+of each page key; invalidate_users() swaps in a new token, so all of that
+user's pages miss at once. Old pages are never read again and age out of
+the store. The timeline hooks call it inside the write transaction, and the
+new tokens are written only after that transaction commits, so a
+concurrent request can't re-cache the pre-commit page. The hooks cover a
+new post, a deleted post, a follow or unfollow, and a media job (renditions,
+waveform, duration, image variants or a new avatar) finishing. Posts by authors above
+the fan-out limit have no follower list to walk, so they bump one shared
+token that every key also includes (invalidate_pulled()). Like and comment
+counts inside a cached page refresh within the TTL.
+
+A page read from a lagging replica soon after an invalidation isn't
+cached, so the stale copy isn't kept for a whole TTL.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+
+import cache_backends
+from db_routing import RoutingSession
+from models import db
+
+_PENDING_KEY = "feed_cache_invalidate"
+# Generation tokens outlive the pages keyed by them, so a busy user's pages
+# aren't orphaned every TTL.
+GENERATION_TTL_FACTOR = 10
+GENERATION_PREFIX = "feedgen:"
+PULLED_GENERATION_KEY = "feedgen-pulled"
+
+_backend = None
+_backend_config: tuple | None = None
+_backend_lock = threading.Lock()
+
+
+def _get_backend():
+    global _backend, _backend_config
+
+    config = current_app.config
+    wanted = (
+        config["FEED_CACHE_BACKEND"],
+        config["FEED_CACHE_SIZE"],
+        config["FEED_CACHE_PATH"],
+    )
+
+    with _backend_lock:
+        if _backend_config != wanted:
+            name, max_entries, path = wanted
+
+            if name == "sqlite":
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+            _backend = cache_backends.make_backend(name, max_entries=max_entries, path=path)
+            _backend_config = wanted
+
+        return _backend
+
+
+def enabled() -> bool:
+    return _get_backend() is not None
+
+
+def _ttl() -> float:
+    return current_app.config["FEED_CACHE_TTL_SECONDS"]
+
+
+def _new_generation(invalidated_at: float) -> bytes:
+    return f"{invalidated_at:.6f}_{uuid4().hex}".encode()
+
+
+def _generation(backend, key: str) -> str:
+    generation = backend.get(key)
+
+    if generation is None:
+        # Never invalidated, or the token was evicted: start a fresh one.
+        generation = _new_generation(0)
+        backend.set(key, generation, _ttl() * GENERATION_TTL_FACTOR)
+
+    return generation.decode()
+
+
+def page_key(user_id: str, cursor: str | None) -> str | None:
+    """The cache key for one feed page, or None when caching is off."""
+    backend = _get_backend()
+
+    if backend is None:
+        return None
+
+    user_generation = _generation(backend, f"{GENERATION_PREFIX}{user_id}")
+    pulled_generation = _generation(backend, PULLED_GENERATION_KEY)
+
+    return f"feed:{user_id}:{user_generation}:{pulled_generation}:{cursor or ''}"
+
+
+def get(key: str | None) -> tuple[str, bytes] | None:
+    """The cached (etag, body) for a page key, if any."""
+    if key is None:
+        return None
+
+    entry = _get_backend().get(key)
+
+    if entry is None:
+        return None
+
+    etag, _, body = entry.partition(b"\n")
+
+    return etag.decode(), body
+
+
+def put(key: str | None, etag: str, body: bytes) -> None:
+    if key is None:
+        return
+
+    if has_request_context() and g.get("db_replica_key"):
+        generations = key.split(":")[2:4]
+        invalidated_at = max(float(generation.split("_")[0]) for generation in generations)
+
+        if time.time() - invalidated_at < current_app.config["REPLICA_STICKY_SECONDS"]:
+            return
+
+    _get_backend().set(key, etag.encode() + b"\n" + body, _ttl())
+
+
+def _invalidate_after_commit(generation_keys) -> None:
+    if not enabled():
+        return
+
+    db.session.info.setdefault(_PENDING_KEY, set()).update(generation_keys)
+
+
+def invalidate_users(user_ids) -> None:
+    """Drop the users' cached pages once the current transaction commits."""
+    _invalidate_after_commit(f"{GENERATION_PREFIX}{user_id}" for user_id in user_ids)
+
+
+def invalidate_pulled() -> None:
+    """Drop every cached page once the current transaction commits.
+
+    For posts by high-fanout authors, which are merged into feeds at read
+    time, so there is no follower list to invalidate.
+    """
+    _invalidate_after_commit([PULLED_GENERATION_KEY])
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _apply_invalidations(session) -> None:
+    generation_keys = session.info.pop(_PENDING_KEY, None)
+
+    if not generation_keys:
+        return
+
+    backend = _get_backend()
+
+    if backend is None:
+        return
+
+    now = time.time()
+    backend.set_many(
+        {key: _new_generation(now) for key in generation_keys},
+        _ttl() * GENERATION_TTL_FACTOR,
+    )
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _discard_invalidations(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -6,7 +6,7 @@ from sqlalchemy import inspect
 from app import app, db
 
 # Ensure all models are imported so SQLAlchemy "sees" them
-from models import User, Post, Media, Comment, Like, Follow  # noqa: F401
+from models import User, Post, Media, MediaRendition, Comment, Like, Follow, TimelineEntry, Job, UploadSession, UploadChunk, OutboxEmail  # noqa: F401
 
 
 def _sqlite_path_from_uri(uri: str) -> Path | None:
@@ -52,6 +52,10 @@ with app.app_context():
         else:
             print("No existing DB file found.")
 
+        # WAL mode keeps the most recent writes next to the main file.
+        for suffix in ("-wal", "-shm"):
+            db_path.with_name(db_path.name + suffix).unlink(missing_ok=True)
+
     else:
         # Non-SQLite fallback
         print("Non-SQLite database detected; using drop_all/create_all")
@@ -87,6 +91,12 @@ with app.app_context():
     show_cols("comments")
     show_cols("likes")
     show_cols("follows")
+    show_cols("timeline_entries")
+    show_cols("media_renditions")
+    show_cols("jobs")
+    show_cols("upload_sessions")
+    show_cols("upload_chunks")
+    show_cols("email_outbox")
 
     # 5) Specific sanity check for new comment-like capable likes table
     if "likes" in tables:
@@ -0,0 +1,188 @@
+# server/image_pipeline.py
+"""
+Background processing of uploaded post and profile images with Pillow.
+
+Each job decodes the upload once, applies its EXIF orientation, and:
+
+- re-saves the original with EXIF (GPS position, camera serials, ...)
+  stripped as a new blob_store blob, points the Media row at it and releases
+  the upload's blob, so no public URL keeps serving the metadata;
+- writes fixed-size variants under uploads/images/variants/ and records
+  them as MediaRendition rows.
+
+Post images get feed-card variants (at most CARD_MAX_WIDTH wide, WebP with a
+JPEG fallback); serialize_posts advertises the first ready one in
+CARD_VARIANTS order as `image_url`. Profile pictures get a square
+AVATAR_SIZE WebP crop that replaces the user's `profile_image_url`, so every
+payload that embeds an author picks up the small file without another join.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from uuid import uuid4
+
+from flask import current_app
+from PIL import Image, ImageOps
+
+import blob_store
+import jobs
+import timeline
+import user_cache
+from models import db, Media, MediaRendition, User
+
+CARD_MAX_WIDTH = 1080
+AVATAR_SIZE = 256
+
+# label, Pillow format, extension, mime type -- in preference order
+CARD_VARIANTS = (
+    ("card_webp", "WEBP", ".webp", "image/webp"),
+    ("card_jpeg", "JPEG", ".jpg", "image/jpeg"),
+)
+AVATAR_VARIANT = ("avatar_webp", "WEBP", ".webp", "image/webp")
+
+VARIANT_SUBDIR = "variants"
+
+_SAVE_OPTIONS = {
+    "WEBP": {"quality": 80, "method": 6},
+    "JPEG": {"quality": 82, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+}
+ORIGINAL_QUALITY = 95
+
+
+def _image_dir() -> Path:
+    return Path(current_app.config["UPLOAD_IMAGE_DIR"])
+
+
+def _save(image: Image.Image, dest: Path, image_format: str, **options) -> None:
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        # JPEG has no alpha: flatten onto white rather than black.
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert("RGBA")).convert("RGB")
+
+    if image.info.get("icc_profile"):
+        options.setdefault("icc_profile", image.info["icc_profile"])
+
+    tmp_dest = dest.with_name(f".{dest.name}.part")
+    image.save(tmp_dest, image_format, **{**_SAVE_OPTIONS[image_format], **options})
+    os.replace(tmp_dest, dest)
+
+
+def _strip_original(media: Media) -> tuple[Image.Image, str | None]:
+    """Load the upload upright; re-save it without EXIF if it carried any.
+
+    Returns the oriented image and the filename the Media row no longer uses.
+    """
+    source = _image_dir() / media.filename
+
+    with Image.open(source) as original:
+        image_format = original.format
+        has_exif = bool(original.getexif())
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    image.info.pop("exif", None)
+
+    if not has_exif or image_format not in _SAVE_OPTIONS:
+        return image, None
+
+    options = {"quality": ORIGINAL_QUALITY} if image_format in ("JPEG", "WEBP") else {}
+    tmp_path = blob_store.new_temp_path(_image_dir(), source.suffix.lower())
+
+    _save(image, tmp_path, image_format, **options)
+    blob = blob_store.store_file(tmp_path, _image_dir())
+
+    stale_filename = media.filename
+    media.filename = blob.filename
+    media.url = f"/images/{blob.filename}"
+    media.content_hash = blob.content_hash
+    media.size_bytes = blob.size_bytes
+
+    return image, stale_filename
+
+
+def _write_variant(media: Media, image: Image.Image, variant: tuple) -> MediaRendition:
+    label, image_format, extension, mime_type = variant
+
+    filename = f"{VARIANT_SUBDIR}/{Path(media.filename).stem}-{label}-{uuid4().hex}{extension}"
+    dest = _image_dir() / filename
+    dest.parent.mkdir(parents=True, exist_ok=True)
+
+    _save(image, dest, image_format)
+
+    rendition = MediaRendition(
+        media_id=media.id,
+        label=label,
+        mime_type=mime_type,
+        url=f"/images/{filename}",
+        filename=filename,
+        size_bytes=dest.stat().st_size,
+        width=image.width,
+        height=image.height,
+    )
+    db.session.add(rendition)
+
+    return rendition
+
+
+def _commit_and_release(stale_filename: str | None) -> None:
+    db.session.commit()
+
+    if stale_filename:
+        blob_store.release("image", _image_dir(), stale_filename)
+
+
+@jobs.handler("process_post_image")
+def process_post_image(media_id: str) -> None:
+    media = db.session.get(Media, media_id)
+
+    if media is None or media.media_type != "image":
+        return
+
+    image, stale_filename = _strip_original(media)
+    media.width, media.height = image.size
+
+    if image.width > CARD_MAX_WIDTH:
+        image = image.resize(
+            (CARD_MAX_WIDTH, round(image.height * CARD_MAX_WIDTH / image.width)),
+            Image.Resampling.LANCZOS,
+        )
+
+    existing = {rendition.label for rendition in media.renditions}
+
+    for variant in CARD_VARIANTS:
+        if variant[0] not in existing:
+            _write_variant(media, image, variant)
+
+    timeline.media_changed(media.id)
+    _commit_and_release(stale_filename)
+
+
+@jobs.handler("process_profile_image")
+def process_profile_image(media_id: str, user_id: str) -> None:
+    media = db.session.get(Media, media_id)
+
+    if media is None or media.media_type != "image":
+        return
+
+    uploaded_url = media.url
+    image, stale_filename = _strip_original(media)
+    media.width, media.height = image.size
+
+    rendition = media.renditions.filter_by(label=AVATAR_VARIANT[0]).first()
+
+    if rendition is None:
+        avatar = ImageOps.fit(image, (AVATAR_SIZE, AVATAR_SIZE), Image.Resampling.LANCZOS)
+        rendition = _write_variant(media, avatar, AVATAR_VARIANT)
+
+    user = db.session.get(User, user_id)
+
+    # Leave the picture alone if the user has uploaded a newer one since.
+    if user is not None and user.profile_image_url == uploaded_url:
+        user.profile_image_url = rendition.url
+        timeline.author_changed(user_id)
+
+    _commit_and_release(stale_filename)
+    user_cache.invalidate(user_id)
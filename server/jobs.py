@@ -0,0 +1,189 @@
+# server/jobs.py
+"""
+Durable background jobs.
+
+Request handlers enqueue() a row in `jobs` inside their own transaction, so a
+job exists exactly when the data it refers to was committed. Worker threads
+(started lazily by the web app, or by run_worker.py as a separate process)
+claim jobs with a conditional UPDATE, run the registered handler inside an
+app context, and retry failures with exponential backoff. Jobs whose worker
+died are reclaimed once their lease expires.
+"""
+
+from __future__ import annotations
+
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, current_app
+from sqlalchemy import select, update
+
+from models import db, Job
+
+MAX_ATTEMPTS = 5
+BASE_BACKOFF_SECONDS = 30
+LEASE_SECONDS = 600
+
+_handlers: dict[str, callable] = {}
+_wakeup = threading.Event()
+_started_lock = threading.Lock()
+_started = False
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def handler(kind: str):
+    """Register `fn(**payload)` as the handler for jobs of `kind`."""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+
+    return register
+
+
+def enqueue(kind: str, *, delay_seconds: float = 0, **payload) -> Job:
+    """Add a job to the current transaction; it runs after the caller commits."""
+    job = Job(
+        kind=kind,
+        payload=payload,
+        run_after=_now() + timedelta(seconds=delay_seconds),
+    )
+    db.session.add(job)
+    _wakeup.set()
+
+    return job
+
+
+def _claim_next() -> Job | None:
+    now = _now()
+    lease_expired = now - timedelta(seconds=LEASE_SECONDS)
+
+    candidates = db.session.scalars(
+        select(Job.id)
+        .where(
+            db.or_(
+                db.and_(Job.status == "queued", Job.run_after <= now),
+                db.and_(Job.status == "running", Job.locked_at < lease_expired),
+            )
+        )
+        .order_by(Job.run_after)
+        .limit(5)
+    ).all()
+
+    for job_id in candidates:
+        claimed = db.session.execute(
+            update(Job)
+            .where(
+                Job.id == job_id,
+                db.or_(
+                    Job.status == "queued",
+                    db.and_(Job.status == "running", Job.locked_at < lease_expired),
+                ),
+            )
+            .values(status="running", locked_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        if claimed.rowcount == 1:
+            return db.session.get(Job, job_id)
+
+    return None
+
+
+def _finish(job: Job, error: str | None) -> None:
+    if error is None:
+        job.status = "done"
+        job.last_error = None
+    elif job.attempts >= MAX_ATTEMPTS:
+        job.status = "failed"
+        job.last_error = error
+    else:
+        job.status = "queued"
+        job.last_error = error
+        job.run_after = _now() + timedelta(
+            seconds=BASE_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+        )
+
+    job.locked_at = None
+    db.session.commit()
+
+
+def run_one() -> bool:
+    """Run the next due job, if any. Returns False when the queue is idle."""
+    job = _claim_next()
+
+    if job is None:
+        return False
+
+    fn = _handlers.get(job.kind)
+
+    if fn is None:
+        current_app.logger.error("No handler registered for job kind %r", job.kind)
+        job.attempts = MAX_ATTEMPTS
+        _finish(job, f"no handler for {job.kind!r}")
+        return True
+
+    job_id = job.id
+
+    try:
+        fn(**job.payload)
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Job %s (%s) failed", job_id, job.kind)
+        _finish(db.session.get(Job, job_id), traceback.format_exc(limit=5))
+    else:
+        _finish(db.session.get(Job, job_id), None)
+
+    return True
+
+
+def run_pending() -> int:
+    """Drain every job that is currently due; returns how many ran."""
+    ran = 0
+
+    while run_one():
+        ran += 1
+
+    return ran
+
+
+def _work_forever(app: Flask) -> None:
+    poll_interval = app.config.get("JOB_POLL_INTERVAL_SECONDS", 2.0)
+
+    while True:
+        with app.app_context():
+            try:
+                busy = run_one()
+            except Exception:
+                app.logger.exception("Job worker loop error")
+                db.session.rollback()
+                busy = False
+            finally:
+                db.session.remove()
+
+        if not busy:
+            _wakeup.wait(poll_interval)
+            _wakeup.clear()
+
+
+def start_workers(app: Flask, count: int) -> None:
+    """Start `count` daemon worker threads once per process."""
+    global _started
+
+    with _started_lock:
+        if _started or count <= 0:
+            return
+
+        _started = True
+
+    for i in range(count):
+        threading.Thread(
+            target=_work_forever,
+            args=(app,),
+            name=f"job-worker-{i}",
+            daemon=True,
+        ).start()
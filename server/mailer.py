@@ -0,0 +1,268 @@
+# server/mailer.py
+"""
+Transactional email through a durable outbox.
+
+Request handlers call queue_email(), which adds an `email_outbox` row to
+their own transaction, so signup never waits on SMTP and an email exists
+exactly when the account it belongs to was committed. A sender thread
+(started with the job workers, or driven by run_worker.py) claims due rows
+in batches of MAIL_BATCH_SIZE and sends them over one SMTP connection that
+is kept open between batches, reconnecting when the server drops it or it
+sits idle longer than SMTP_IDLE_SECONDS. Temporary failures retry with
+exponential backoff; 5xx rejections fail at once.
+
+With SMTP_HOST unset, emails are logged instead of sent. To try it against
+a local stand-in, run e.g. `python -m aiosmtpd -n -l localhost:1025` and
+set SMTP_HOST=localhost, SMTP_PORT=1025, SMTP_USE_TLS=false.
+"""
+
+from __future__ import annotations
+
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+
+from flask import Flask, current_app
+from sqlalchemy import select, update
+
+from models import db, OutboxEmail
+
+MAX_ATTEMPTS = 8
+BASE_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 60 * 60
+LEASE_SECONDS = 300
+SMTP_TIMEOUT_SECONDS = 30
+
+_wakeup = threading.Event()
+_started_lock = threading.Lock()
+_started = False
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def queue_email(to_email: str, subject: str, body: str) -> OutboxEmail:
+    """Add an email to the current transaction; it is sent after the caller commits."""
+    email = OutboxEmail(to_email=to_email, subject=subject, body=body)
+    db.session.add(email)
+    _wakeup.set()
+
+    return email
+
+
+class _PooledSMTP:
+    """One SMTP connection reused across sends and re-opened on demand."""
+
+    def __init__(self):
+        self._smtp: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        config = current_app.config
+        smtp = smtplib.SMTP(config["SMTP_HOST"], config["SMTP_PORT"], timeout=SMTP_TIMEOUT_SECONDS)
+
+        try:
+            if config["SMTP_USE_TLS"]:
+                smtp.starttls()
+
+            if config["SMTP_USERNAME"]:
+                smtp.login(config["SMTP_USERNAME"], config["SMTP_PASSWORD"])
+        except Exception:
+            smtp.close()
+            raise
+
+        return smtp
+
+    def send(self, message: EmailMessage) -> None:
+        idle_limit = current_app.config["SMTP_IDLE_SECONDS"]
+
+        if self._smtp is not None and time.monotonic() - self._last_used > idle_limit:
+            self.close()
+
+        for attempt in range(2):
+            if self._smtp is None:
+                self._smtp = self._connect()
+
+            try:
+                self._smtp.send_message(message)
+                break
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the idle connection; reconnect once.
+                self.close()
+
+                if attempt:
+                    raise
+
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+
+        self._smtp = None
+
+
+_smtp = _PooledSMTP()
+_smtp_lock = threading.Lock()
+
+
+def _build_message(email: OutboxEmail) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = current_app.config["MAIL_FROM"]
+    message["To"] = email.to_email
+    message["Subject"] = email.subject
+    message.set_content(email.body)
+
+    return message
+
+
+def _claim_batch(limit: int) -> list[OutboxEmail]:
+    now = _now()
+    lease_expired = now - timedelta(seconds=LEASE_SECONDS)
+    claimable = db.or_(
+        db.and_(OutboxEmail.status == "queued", OutboxEmail.run_after <= now),
+        db.and_(OutboxEmail.status == "sending", OutboxEmail.locked_at < lease_expired),
+    )
+
+    candidates = db.session.scalars(
+        select(OutboxEmail.id)
+        .where(claimable)
+        .order_by(OutboxEmail.run_after)
+        .limit(limit)
+    ).all()
+
+    claimed = []
+
+    for email_id in candidates:
+        result = db.session.execute(
+            update(OutboxEmail)
+            .where(OutboxEmail.id == email_id, claimable)
+            .values(status="sending", locked_at=now, attempts=OutboxEmail.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+        if result.rowcount == 1:
+            claimed.append(email_id)
+
+    db.session.commit()
+
+    if not claimed:
+        return []
+
+    return db.session.scalars(select(OutboxEmail).where(OutboxEmail.id.in_(claimed))).all()
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _msg in error.recipients.values())
+
+    code = getattr(error, "smtp_code", None)
+
+    return isinstance(code, int) and code >= 500
+
+
+def _record_failure(email: OutboxEmail, error: Exception) -> None:
+    email.last_error = f"{type(error).__name__}: {error}"
+    email.locked_at = None
+
+    if _is_permanent(error) or email.attempts >= MAX_ATTEMPTS:
+        email.status = "failed"
+    else:
+        email.status = "queued"
+        email.run_after = _now() + timedelta(
+            seconds=min(BASE_BACKOFF_SECONDS * 2 ** (email.attempts - 1), MAX_BACKOFF_SECONDS)
+        )
+
+
+def send_batch() -> int:
+    """Send up to MAIL_BATCH_SIZE due emails; returns how many were claimed."""
+    batch = _claim_batch(current_app.config["MAIL_BATCH_SIZE"])
+
+    if not batch:
+        return 0
+
+    with _smtp_lock:
+        for email in batch:
+            try:
+                if current_app.config["SMTP_HOST"]:
+                    _smtp.send(_build_message(email))
+                else:
+                    current_app.logger.warning(
+                        "SMTP_HOST is not set. Email to %s:\n%s", email.to_email, email.body
+                    )
+            except (smtplib.SMTPException, OSError) as error:
+                current_app.logger.warning("Sending email %s failed: %s", email.id, error)
+
+                # A refused message leaves the session usable; anything else may not.
+                if not isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException)):
+                    _smtp.close()
+
+                _record_failure(email, error)
+            else:
+                email.status = "sent"
+                email.sent_at = _now()
+                email.locked_at = None
+                email.last_error = None
+
+            # Commit per email so a crash mid-batch doesn't resend the ones already out.
+            db.session.commit()
+
+    return len(batch)
+
+
+def close_idle_connection() -> None:
+    with _smtp_lock:
+        _smtp.close()
+
+
+def _send_forever(app: Flask) -> None:
+    poll_interval = app.config.get("JOB_POLL_INTERVAL_SECONDS", 2.0)
+    idle_limit = app.config["SMTP_IDLE_SECONDS"]
+    idle_since = time.monotonic()
+
+    while True:
+        with app.app_context():
+            try:
+                busy = send_batch() > 0
+            except Exception:
+                app.logger.exception("Email sender loop error")
+                db.session.rollback()
+                busy = False
+            finally:
+                db.session.remove()
+
+        if busy:
+            idle_since = time.monotonic()
+            continue
+
+        if time.monotonic() - idle_since > idle_limit:
+            close_idle_connection()
+
+        _wakeup.wait(poll_interval)
+        _wakeup.clear()
+
+
+def start_sender(app: Flask) -> None:
+    """Start the email sender thread once per process."""
+    global _started
+
+    with _started_lock:
+        if _started:
+            return
+
+        _started = True
+
+    threading.Thread(
+        target=_send_forever,
+        args=(app,),
+        name="email-sender",
+        daemon=True,
+    ).start()
@@ -0,0 +1,349 @@
+# server/media_gc.py
+"""
+Garbage collection for uploaded files and soft-deleted posts.
+
+Every collect() cycle does a bounded amount of each kind of work:
+
+- reap_posts() hard-deletes posts that were soft-deleted more than
+  POST_REAP_AFTER_SECONDS ago, together with their likes, comments, the
+  comments' likes and timeline entries, GC_BATCH_SIZE posts at a time.
+  Posts soft-deleted before `deleted_at` existed are stamped on first sight
+  so they still get the full window.
+- expire_upload_sessions() drops expired chunked-upload sessions and their
+  staging files.
+- collect_media() deletes Media rows older than MEDIA_GC_GRACE_SECONDS that
+  no post (live, or soft-deleted but not yet reaped) and no profile picture
+  references, with their renditions; original files are released through
+  blob_store, so a blob shared by another Media row stays.
+- sweep_files() walks uploads/audio and uploads/images in path order,
+  GC_SWEEP_BATCH_FILES per cycle, resuming where the previous cycle stopped.
+  Upload-named files that no Media or MediaRendition row and no user's
+  profile_image_url mentions (e.g. left by a failed request) and abandoned
+  temp files are deleted once they are older than the grace period. Files with other names are never touched.
+
+The `collect_garbage` job runs one cycle and re-enqueues itself, sooner when
+a batch came back full; collect_garbage.py runs cycles until nothing is left.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import delete, exists, select, update
+
+import blob_store
+import chunked_uploads
+import jobs
+from media_serving import IMMUTABLE_NAME_RE
+from models import (
+    db,
+    Comment,
+    Job,
+    Like,
+    Media,
+    MediaRendition,
+    Post,
+    TimelineEntry,
+    UploadSession,
+    User,
+)
+
+JOB_KIND = "collect_garbage"
+BUSY_RESCHEDULE_SECONDS = 5
+GC_SWEEP_BATCH_FILES = 500
+PROFILE_IMAGE_URL_PREFIX = "/images/"
+
+# media type -> path parts of the last file examined by sweep_files()
+_sweep_cursors: dict[str, tuple[str, ...]] = {}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _ago(config_key: str) -> datetime:
+    return _now() - timedelta(seconds=current_app.config[config_key])
+
+
+def _batch_size() -> int:
+    return current_app.config["GC_BATCH_SIZE"]
+
+
+# ------------------------------------------------------------------------------------
+# Posts
+# ------------------------------------------------------------------------------------
+
+def reap_posts(limit: int) -> int:
+    db.session.execute(
+        update(Post)
+        .where(Post.is_deleted.is_(True), Post.deleted_at.is_(None))
+        .values(deleted_at=_now())
+        .execution_options(synchronize_session=False)
+    )
+
+    post_ids = db.session.scalars(
+        select(Post.id)
+        .where(Post.is_deleted.is_(True), Post.deleted_at < _ago("POST_REAP_AFTER_SECONDS"))
+        .order_by(Post.deleted_at)
+        .limit(limit)
+    ).all()
+
+    if post_ids:
+        comment_ids = select(Comment.id).where(Comment.post_id.in_(post_ids))
+
+        for statement in (
+            delete(Like).where(db.or_(Like.post_id.in_(post_ids), Like.comment_id.in_(comment_ids))),
+            delete(Comment).where(Comment.post_id.in_(post_ids)),
+            delete(TimelineEntry).where(TimelineEntry.post_id.in_(post_ids)),
+            delete(Post).where(Post.id.in_(post_ids)),
+        ):
+            db.session.execute(statement.execution_options(synchronize_session=False))
+
+    db.session.commit()
+
+    return len(post_ids)
+
+
+# ------------------------------------------------------------------------------------
+# Upload sessions and media
+# ------------------------------------------------------------------------------------
+
+def expire_upload_sessions(limit: int) -> int:
+    expired = db.session.scalars(
+        select(UploadSession)
+        .where(UploadSession.expires_at < _now())
+        .limit(limit)
+    ).all()
+
+    for upload in expired:
+        chunked_uploads.staging_path(upload).unlink(missing_ok=True)
+        upload.chunks.delete()
+        db.session.delete(upload)
+
+    db.session.commit()
+
+    return len(expired)
+
+
+def collect_media(limit: int) -> int:
+    profile_urls = select(User.profile_image_url).where(User.profile_image_url.is_not(None))
+
+    doomed = db.session.scalars(
+        select(Media)
+        .where(
+            Media.created_at < _ago("MEDIA_GC_GRACE_SECONDS"),
+            ~exists().where(Post.image_media_id == Media.id),
+            ~exists().where(Post.audio_media_id == Media.id),
+            Media.url.not_in(profile_urls),
+            ~exists().where(
+                MediaRendition.media_id == Media.id,
+                MediaRendition.url.in_(profile_urls),
+            ),
+        )
+        .limit(limit)
+    ).all()
+
+    if not doomed:
+        return 0
+
+    doomed_ids = [media.id for media in doomed]
+    originals = [(media.media_type, media.filename) for media in doomed]
+    derived = [
+        (media.media_type, rendition.filename)
+        for media in doomed
+        for rendition in media.renditions
+    ]
+
+    db.session.execute(
+        update(UploadSession)
+        .where(UploadSession.media_id.in_(doomed_ids))
+        .values(media_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+    for media in doomed:
+        db.session.delete(media)  # renditions cascade
+
+    db.session.commit()
+
+    # Files go only after the rows are gone, so nothing can point at a
+    # deleted file; a crash in between leaves orphans for sweep_files().
+    for media_type, filename in derived:
+        (blob_store.media_dir(media_type) / filename).unlink(missing_ok=True)
+
+    for media_type, filename in originals:
+        blob_store.release(media_type, blob_store.media_dir(media_type), filename)
+
+    return len(doomed)
+
+
+# ------------------------------------------------------------------------------------
+# Files on disk
+# ------------------------------------------------------------------------------------
+
+def _walk_after(path: str, parts: tuple[str, ...], cursor: tuple[str, ...]):
+    """Yield (parts, DirEntry) for files under `path` after `cursor`, in order."""
+    try:
+        entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return
+
+    for entry in entries:
+        entry_parts = parts + (entry.name,)
+
+        if entry.is_dir(follow_symlinks=False):
+            # Skip subtrees that sort entirely before the cursor.
+            if entry_parts >= cursor[:len(entry_parts)]:
+                yield from _walk_after(entry.path, entry_parts, cursor)
+        elif entry.is_file(follow_symlinks=False) and entry_parts > cursor:
+            yield entry_parts, entry
+
+
+def _is_temp(parts: tuple[str, ...]) -> bool:
+    # blob_store staging files, and the ".<name>.part" files of atomic writes
+    name = parts[-1]
+    return parts[0] == blob_store.TMP_SUBDIR or (name.startswith(".") and name.endswith(".part"))
+
+
+def _is_upload_name(filename: str) -> bool:
+    return bool(blob_store.BLOB_NAME_RE.search(filename) or IMMUTABLE_NAME_RE.search(filename))
+
+
+def sweep_files(media_type: str, limit: int = GC_SWEEP_BATCH_FILES) -> tuple[int, int, bool]:
+    """Examine up to `limit` files; returns (examined, deleted, wrapped_around)."""
+    directory = blob_store.media_dir(media_type)
+    cursor = _sweep_cursors.get(media_type, ())
+
+    batch = []
+
+    for entry_parts, entry in _walk_after(str(directory), (), cursor):
+        batch.append(("/".join(entry_parts), entry))
+
+        if len(batch) >= limit:
+            break
+
+    wrapped = len(batch) < limit
+    _sweep_cursors[media_type] = () if wrapped else tuple(batch[-1][0].split("/"))
+
+    names = [filename for filename, _entry in batch if _is_upload_name(filename)]
+    referenced = set()
+
+    if names:
+        referenced.update(db.session.scalars(select(Media.filename).where(Media.filename.in_(names))))
+        referenced.update(
+            db.session.scalars(
+                select(MediaRendition.filename).where(MediaRendition.filename.in_(names))
+            )
+        )
+
+        if media_type == "image":
+            # Profile pictures saved before they got Media rows are only
+            # known by users.profile_image_url.
+            profile_urls = [f"{PROFILE_IMAGE_URL_PREFIX}{name}" for name in names]
+            referenced.update(
+                url.removeprefix(PROFILE_IMAGE_URL_PREFIX)
+                for url in db.session.scalars(
+                    select(User.profile_image_url).where(User.profile_image_url.in_(profile_urls))
+                )
+            )
+
+    grace_cutoff = _ago("MEDIA_GC_GRACE_SECONDS").timestamp()
+    # Staging files of open upload sessions are touched by every chunk.
+    temp_cutoff = min(grace_cutoff, _ago("UPLOAD_SESSION_TTL_SECONDS").timestamp())
+    deleted = 0
+
+    for filename, entry in batch:
+        try:
+            mtime = entry.stat(follow_symlinks=False).st_mtime
+        except FileNotFoundError:
+            continue
+
+        temp = _is_temp(tuple(filename.split("/")))
+
+        if temp:
+            stale = mtime < temp_cutoff
+        else:
+            stale = (
+                _is_upload_name(filename)
+                and filename not in referenced
+                and mtime < grace_cutoff
+            )
+
+        if not stale:
+            continue
+
+        if temp:
+            try:
+                os.unlink(entry.path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+        elif blob_store.discard(directory, filename, grace_cutoff):
+            # Re-checks the mtime, in case a dedup hit touched it since the stat.
+            deleted += 1
+
+    return len(batch), deleted, wrapped
+
+
+# ------------------------------------------------------------------------------------
+# Cycle and job
+# ------------------------------------------------------------------------------------
+
+def collect() -> dict:
+    """Run one bounded GC cycle and report what it did."""
+    limit = _batch_size()
+
+    stats = {
+        "posts_reaped": reap_posts(limit),
+        "upload_sessions_expired": expire_upload_sessions(limit),
+        "media_collected": collect_media(limit),
+        "files_examined": 0,
+        "files_deleted": 0,
+        "sweep_complete": True,
+    }
+
+    for media_type in blob_store.MEDIA_DIR_CONFIG:
+        examined, deleted, wrapped = sweep_files(media_type)
+        stats["files_examined"] += examined
+        stats["files_deleted"] += deleted
+        stats["sweep_complete"] = stats["sweep_complete"] and wrapped
+
+    return stats
+
+
+def ensure_scheduled() -> None:
+    """Enqueue the first collect_garbage job unless one is already pending."""
+    pending = db.session.scalar(
+        select(Job.id)
+        .where(Job.kind == JOB_KIND, Job.status.in_(("queued", "running")))
+        .limit(1)
+    )
+
+    if pending is None:
+        jobs.enqueue(JOB_KIND, delay_seconds=60)
+
+
+@jobs.handler(JOB_KIND)
+def collect_garbage() -> None:
+    stats = collect()
+    limit = _batch_size()
+
+    busy = (
+        stats["posts_reaped"] >= limit
+        or stats["upload_sessions_expired"] >= limit
+        or stats["media_collected"] >= limit
+        or not stats["sweep_complete"]
+    )
+
+    already_queued = db.session.scalar(
+        select(Job.id).where(Job.kind == JOB_KIND, Job.status == "queued").limit(1)
+    )
+
+    if already_queued is None:
+        jobs.enqueue(
+            JOB_KIND,
+            delay_seconds=BUSY_RESCHEDULE_SECONDS if busy else current_app.config["GC_INTERVAL_SECONDS"],
+        )
+        db.session.commit()
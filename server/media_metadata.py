@@ -0,0 +1,494 @@
+# server/media_metadata.py
+"""
+Off-request metadata extraction for uploaded media.
+
+upload_media enqueues an `extract_media_metadata` job for the audio Media row;
+image_pipeline records image dimensions while it builds variants, but images
+are still handled here (Pillow header only, EXIF orientation applied). Audio
+gets a duration from its container header (WAV, Ogg Opus/Vorbis, WebM/
+Matroska, MP4/M4A, CBR MP3) and a compact waveform: WAVEFORM_BINS peak
+values in 0-100, computed from PCM read directly for WAV or decoded by ffmpeg
+for compressed formats. Either way the PCM is read in fixed-size blocks and
+reduced to per-block peaks as it goes, so a long upload never sits in memory
+whole. Files whose header lacks a duration (e.g. streamed WebM from
+MediaRecorder) take it from the decoded sample count instead.
+"""
+
+from __future__ import annotations
+
+import array
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import wave
+from pathlib import Path
+
+from datetime import datetime, timezone
+
+from flask import current_app
+from PIL import Image
+from sqlalchemy import select
+
+import events
+import jobs
+import post_search
+import timeline
+from models import db, Media, Post
+
+WAVEFORM_BINS = 64
+PEAK_SAMPLE_RATE = 8000
+# Samples per peak for decoded audio: 8 ms at PEAK_SAMPLE_RATE.
+DECODED_PEAK_BLOCK = 64
+PCM_READ_FRAMES = 64 * 1024
+FFMPEG_TIMEOUT_SECONDS = 5 * 60
+
+
+# ------------------------------------------------------------------------------------
+# Images
+# ------------------------------------------------------------------------------------
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def image_dimensions(path: Path) -> tuple[int, int]:
+    """Displayed (width, height), read from the header without decoding pixels."""
+    with Image.open(path) as image:
+        width, height = image.size
+
+        # Orientations 5-8 are rotated by 90 degrees.
+        if image.getexif().get(EXIF_ORIENTATION_TAG, 1) in (5, 6, 7, 8):
+            width, height = height, width
+
+    return width, height
+
+
+# ------------------------------------------------------------------------------------
+# Audio container headers
+# ------------------------------------------------------------------------------------
+
+def _ffmpeg_binary() -> str | None:
+    return current_app.config.get("FFMPEG_BINARY") or shutil.which("ffmpeg")
+
+
+def _wav_duration(f) -> float | None:
+    with wave.open(f) as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def _ogg_duration(f, size: int) -> float | None:
+    head = f.read(512)
+
+    if b"OpusHead" in head:
+        offset = head.index(b"OpusHead")
+        pre_skip = struct.unpack_from("<H", head, offset + 10)[0]
+        sample_rate = 48000
+    elif b"\x01vorbis" in head:
+        offset = head.index(b"\x01vorbis")
+        pre_skip = 0
+        sample_rate = struct.unpack_from("<I", head, offset + 12)[0]
+    else:
+        return None
+
+    f.seek(max(size - 65536, 0))
+    tail = f.read()
+    last_page = tail.rfind(b"OggS")
+
+    if last_page < 0 or last_page + 14 > len(tail):
+        return None
+
+    granule = struct.unpack_from("<q", tail, last_page + 6)[0]
+
+    if granule <= 0:
+        return None
+
+    return max(granule - pre_skip, 0) / sample_rate
+
+
+def _read_vint(data: bytes, pos: int, *, keep_marker: bool) -> tuple[int, int]:
+    first = data[pos]
+    length = 1
+
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+
+    value = first if keep_marker else first & (0xFF >> length)
+
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+
+    return value, pos + length
+
+
+def _matroska_duration(f) -> float | None:
+    data = f.read(256 * 1024)
+    containers = {0x18538067, 0x1549A966}  # Segment, Info
+    timecode_scale = 1_000_000
+    duration = None
+    pos = 0
+
+    while pos < len(data) - 2:
+        element_id, pos = _read_vint(data, pos, keep_marker=True)
+        element_size, pos = _read_vint(data, pos, keep_marker=False)
+
+        if element_id in containers:
+            continue  # descend into the children
+
+        payload = data[pos:pos + element_size]
+
+        if element_id == 0x2AD7B1:
+            timecode_scale = int.from_bytes(payload, "big")
+        elif element_id == 0x4489 and len(payload) in (4, 8):
+            duration = struct.unpack(">f" if len(payload) == 4 else ">d", payload)[0]
+        elif element_id == 0x1F43B675:  # Cluster: Info is always before it
+            break
+
+        pos += element_size
+
+    if not duration:
+        return None
+
+    return duration * timecode_scale / 1e9
+
+
+def _mp4_duration(f, size: int) -> float | None:
+    def boxes(start: int, end: int):
+        pos = start
+
+        while pos + 8 <= end:
+            f.seek(pos)
+            box_size, box_type = struct.unpack(">I4s", f.read(8))
+            header = 8
+
+            if box_size == 1:
+                box_size = struct.unpack(">Q", f.read(8))[0]
+                header = 16
+            elif box_size == 0:
+                box_size = end - pos
+
+            if box_size < header:
+                return
+
+            yield box_type, pos + header, pos + box_size
+            pos += box_size
+
+    for box_type, start, end in boxes(0, size):
+        if box_type != b"moov":
+            continue
+
+        for child_type, child_start, _child_end in boxes(start, end):
+            if child_type != b"mvhd":
+                continue
+
+            f.seek(child_start)
+            version = f.read(4)[0]
+
+            if version == 1:
+                f.seek(16, os.SEEK_CUR)
+                timescale, duration = struct.unpack(">IQ", f.read(12))
+            else:
+                f.seek(8, os.SEEK_CUR)
+                timescale, duration = struct.unpack(">II", f.read(8))
+
+            return duration / timescale if timescale else None
+
+    return None
+
+
+_MP3_BITRATES_KBPS = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+
+
+def _mp3_duration(f, size: int) -> float | None:
+    head = f.read(10)
+    audio_start = 0
+
+    if head[:3] == b"ID3":
+        tag_size = 0
+        for byte in head[6:10]:
+            tag_size = (tag_size << 7) | (byte & 0x7F)
+        audio_start = 10 + tag_size
+
+    f.seek(audio_start)
+    frame_header = f.read(4)
+
+    # MPEG-1 Layer III only; the bitrate of the first frame is assumed constant.
+    if len(frame_header) < 4 or frame_header[0] != 0xFF or frame_header[1] & 0xFE != 0xFA:
+        return None
+
+    bitrate_index = frame_header[2] >> 4
+
+    if not 0 < bitrate_index < len(_MP3_BITRATES_KBPS):
+        return None
+
+    return (size - audio_start) * 8 / (_MP3_BITRATES_KBPS[bitrate_index] * 1000)
+
+
+def audio_header_duration(path: Path) -> float | None:
+    """Duration in seconds from the container header, or None if unknown."""
+    size = path.stat().st_size
+
+    with open(path, "rb") as f:
+        magic = f.read(12)
+        f.seek(0)
+
+        try:
+            if magic[:4] == b"RIFF" and magic[8:12] == b"WAVE":
+                return _wav_duration(f)
+            if magic[:4] == b"OggS":
+                return _ogg_duration(f, size)
+            if magic[:4] == b"\x1a\x45\xdf\xa3":
+                return _matroska_duration(f)
+            if magic[4:8] == b"ftyp":
+                return _mp4_duration(f, size)
+            if magic[:3] == b"ID3" or magic[:1] == b"\xff":
+                return _mp3_duration(f, size)
+        except (wave.Error, struct.error, IndexError, EOFError, ZeroDivisionError):
+            return None
+
+    return None
+
+
+def _remuxed_duration(path: Path) -> float | None:
+    """Duration from the last packet timestamp, by remuxing to nowhere.
+
+    Needs no decoding, so it is quick even for hour-long files.
+    """
+    ffmpeg = _ffmpeg_binary()
+
+    if ffmpeg is None:
+        return None
+
+    try:
+        result = subprocess.run(
+            [
+                ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-nostats",
+                "-i", str(path),
+                "-vn", "-c", "copy", "-f", "null",
+                "-progress", "pipe:1", "-",
+            ],
+            capture_output=True,
+            timeout=FFMPEG_TIMEOUT_SECONDS,
+        )
+    except subprocess.TimeoutExpired:
+        return None
+
+    if result.returncode != 0:
+        return None
+
+    out_times = [
+        line.partition("=")[2]
+        for line in result.stdout.decode(errors="replace").splitlines()
+        if line.startswith("out_time_us=")
+    ]
+
+    try:
+        return int(out_times[-1]) / 1_000_000
+    except (IndexError, ValueError):
+        return None
+
+
+def audio_duration(path: Path) -> float | None:
+    """Duration from the header, else from ffmpeg; None if neither can tell."""
+    duration = audio_header_duration(path)
+
+    if duration is None:
+        duration = _remuxed_duration(path)
+
+    return duration
+
+
+# ------------------------------------------------------------------------------------
+# Waveform peaks
+# ------------------------------------------------------------------------------------
+
+def _pcm16_samples(raw: bytes) -> array.array:
+    samples = array.array("h")
+    samples.frombytes(raw[: len(raw) - len(raw) % 2])
+
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    return samples
+
+
+def _block_peaks(chunks, block: int) -> tuple[array.array, int]:
+    """Peak level of every `block` mono samples, and the sample count.
+
+    Consumes `chunks` (arrays of samples) one at a time, so memory stays
+    bounded by the chunk size and the, much smaller, list of peaks.
+    """
+    peaks = array.array("i")
+    pending = array.array("h")
+    total = 0
+
+    for samples in chunks:
+        total += len(samples)
+        pending.extend(samples)
+        full = len(pending) - len(pending) % block
+
+        for start in range(0, full, block):
+            part = pending[start:start + block]
+            peaks.append(max(max(part), -min(part)))
+
+        del pending[:full]
+
+    if pending:
+        peaks.append(max(max(pending), -min(pending)))
+
+    return peaks, total
+
+
+def _wav_peaks(path: Path) -> tuple[array.array, int, int] | None:
+    """(block peaks, sample count, sample rate) of a 16-bit WAV, read in blocks."""
+    try:
+        with wave.open(str(path)) as wav:
+            if wav.getsampwidth() != 2:
+                return None
+
+            channels = wav.getnchannels()
+            frame_count = wav.getnframes()
+            # Fine enough that every waveform bin still spans many blocks.
+            block = max(frame_count // (WAVEFORM_BINS * 64), 1)
+
+            def chunks():
+                while raw := wav.readframes(PCM_READ_FRAMES):
+                    yield _pcm16_samples(raw)[::channels]
+
+            peaks, total = _block_peaks(chunks(), block)
+            return peaks, total, wav.getframerate()
+    except wave.Error:
+        return None
+
+
+def _decoded_peaks(path: Path) -> tuple[array.array, int, int] | None:
+    """Like _wav_peaks, for anything ffmpeg can decode, streamed from its stdout."""
+    ffmpeg = _ffmpeg_binary()
+
+    if ffmpeg is None:
+        return None
+
+    command = [
+        ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-i", str(path),
+        "-vn", "-ac", "1", "-ar", str(PEAK_SAMPLE_RATE),
+        "-f", "s16le", "-",
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    timer = threading.Timer(FFMPEG_TIMEOUT_SECONDS, process.kill)
+    timer.start()
+
+    def chunks():
+        carry = b""
+
+        while raw := process.stdout.read(PCM_READ_FRAMES * 2):
+            raw = carry + raw
+            carry = raw[len(raw) - len(raw) % 2:]
+            yield _pcm16_samples(raw)
+
+    try:
+        peaks, total = _block_peaks(chunks(), DECODED_PEAK_BLOCK)
+        # stderr is small (-loglevel error), so draining it last can't deadlock ffmpeg.
+        stderr = process.stderr.read()
+        process.wait()
+    finally:
+        timer.cancel()
+        process.stdout.close()
+        process.stderr.close()
+
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+
+    return peaks, total, PEAK_SAMPLE_RATE
+
+
+def waveform_peaks(samples: array.array, bins: int = WAVEFORM_BINS) -> list[int]:
+    if not samples:
+        return []
+
+    step = max(len(samples) / bins, 1)
+    peaks = []
+
+    for i in range(min(bins, len(samples))):
+        chunk = samples[int(i * step):int((i + 1) * step)]
+        peaks.append(max(max(chunk), -min(chunk)))
+
+    loudest = max(peaks) or 1
+
+    return [round(peak * 100 / loudest) for peak in peaks]
+
+
+# ------------------------------------------------------------------------------------
+# Job
+# ------------------------------------------------------------------------------------
+
+def _take_down_overlong(media: Media) -> None:
+    """Soft-delete the posts of audio that turned out over the length limit.
+
+    Uploads whose duration couldn't be measured are accepted; this is
+    where MAX_AUDIO_DURATION_SECONDS catches up with them.
+    """
+    current_app.logger.warning(
+        "Media %s is %.0f s, over MAX_AUDIO_DURATION_SECONDS; taking its posts down",
+        media.id,
+        media.duration,
+    )
+
+    posts = db.session.scalars(
+        select(Post).where(Post.audio_media_id == media.id, Post.is_deleted.is_(False))
+    ).all()
+
+    for post in posts:
+        post.is_deleted = True
+        post.deleted_at = datetime.now(timezone.utc)
+        timeline.retract_post(post.id)
+        post_search.unindex_post(post.id)
+        events.publish(
+            [f"author:{post.user_id}", f"post:{post.id}"],
+            "post_deleted",
+            {"post_id": post.id, "user_id": post.user_id},
+        )
+
+
+@jobs.handler("extract_media_metadata")
+def extract_media_metadata(media_id: str) -> None:
+    media = db.session.get(Media, media_id)
+
+    if media is None:
+        return
+
+    if media.media_type == "image":
+        path = Path(current_app.config["UPLOAD_IMAGE_DIR"]) / media.filename
+        media.width, media.height = image_dimensions(path)
+        timeline.media_changed(media.id)
+        db.session.commit()
+        return
+
+    path = Path(current_app.config["UPLOAD_AUDIO_DIR"]) / media.filename
+    # upload_media / finalize may already have measured it (with ffmpeg).
+    if media.duration is None:
+        media.duration = audio_header_duration(path)
+
+    decoded = _wav_peaks(path) if path.suffix.lower() == ".wav" else None
+
+    if decoded is None:
+        decoded = _decoded_peaks(path)
+
+    if decoded is not None:
+        peaks, sample_count, sample_rate = decoded
+        media.waveform = waveform_peaks(peaks)
+
+        if media.duration is None and sample_count:
+            media.duration = sample_count / sample_rate
+
+    timeline.media_changed(media.id)
+
+    if media.duration is not None and media.duration > current_app.config["MAX_AUDIO_DURATION_SECONDS"]:
+        _take_down_overlong(media)
+
+    db.session.commit()
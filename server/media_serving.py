@@ -0,0 +1,220 @@
+# server/media_serving.py
+"""
+Range-aware static serving for uploaded audio and images.
+
+- Strong ETags from a SHA-256 of the file contents, answered with 304 on
+  If-None-Match. Content-addressed blobs carry the hash in their name; other
+  files are hashed once per version and cached in memory.
+- Single ranges (206), multi-range multipart/byteranges responses, If-Range,
+  and 416 for unsatisfiable ranges.
+- `Cache-Control: immutable` for blob_store names and the uuid-suffixed
+  names of renditions and variants, since their bytes never change.
+- Zero-copy delivery: with MEDIA_ACCEL_REDIRECT_PREFIX set, only headers are
+  produced and nginx streams the file via X-Accel-Redirect; otherwise full
+  responses go through the WSGI server's file_wrapper (sendfile under
+  gunicorn).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+from flask import Response, abort, request
+from werkzeug.http import http_date, parse_range_header
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+from blob_store import BLOB_NAME_RE
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16
+IMMUTABLE_NAME_RE = re.compile(r"-[0-9a-f]{32}\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class _ETagCache:
+    """LRU of path -> (mtime_ns, size, etag) so files are hashed once."""
+
+    def __init__(self, max_entries: int = 4096):
+        self._entries: OrderedDict[str, tuple[int, int, str]] = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, path: str, stat: os.stat_result) -> str:
+        with self._lock:
+            cached = self._entries.get(path)
+
+            if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._entries.move_to_end(path)
+                return cached[2]
+
+        digest = hashlib.sha256()
+
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+
+        etag = digest.hexdigest()
+
+        with self._lock:
+            self._entries[path] = (stat.st_mtime_ns, stat.st_size, etag)
+            self._entries.move_to_end(path)
+
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+        return etag
+
+
+etag_cache = _ETagCache()
+
+
+def _read_range(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+
+            if not chunk:
+                break
+
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _resolve_ranges(size: int) -> list[tuple[int, int]] | None:
+    """Return [(start, stop)] for the request's Range header.
+
+    None means "serve the whole file" (no header, a stale If-Range, or a
+    header we choose to ignore); an empty list means unsatisfiable.
+    """
+    parsed = parse_range_header(request.headers.get("Range"))
+
+    if parsed is None or parsed.units != "bytes" or len(parsed.ranges) > MAX_RANGES:
+        return None
+
+    resolved = []
+
+    for start, stop in parsed.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+
+        if start < stop:
+            resolved.append((start, stop))
+
+    return resolved
+
+
+def serve_media(directory: str, filename: str, *, accel_prefix: str = "") -> Response:
+    path = safe_join(directory, filename)
+
+    # Dot-prefixed names are in-progress temp files.
+    hidden = any(part.startswith(".") for part in filename.split("/"))
+
+    if path is None or hidden or not os.path.isfile(path):
+        abort(404)
+
+    stat = os.stat(path)
+    size = stat.st_size
+    blob_name = BLOB_NAME_RE.search(filename)
+    etag = blob_name.group(1) if blob_name else etag_cache.get(path, stat)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    headers = {
+        "ETag": f'"{etag}"',
+        "Last-Modified": http_date(stat.st_mtime),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (
+            IMMUTABLE_CACHE_CONTROL
+            if blob_name or IMMUTABLE_NAME_RE.search(filename)
+            else REVALIDATE_CACHE_CONTROL
+        ),
+    }
+
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    if accel_prefix:
+        # nginx handles Range itself for internal redirects.
+        headers["X-Accel-Redirect"] = accel_prefix + filename
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    ranges = None
+
+    # If-Range is only honoured with our strong ETag; a date or stale tag
+    # falls back to the full body as RFC 9110 requires.
+    if_range = request.if_range
+    if not (if_range.etag or if_range.date) or if_range.etag == etag:
+        ranges = _resolve_ranges(size)
+
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        body = wrap_file(request.environ, open(path, "rb"), CHUNK_SIZE)
+
+        return Response(
+            body,
+            status=200,
+            headers=headers,
+            mimetype=mimetype,
+            direct_passthrough=True,
+        )
+
+    if not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        headers["Content-Length"] = str(stop - start)
+
+        return Response(
+            _read_range(path, start, stop - start),
+            status=206,
+            headers=headers,
+            mimetype=mimetype,
+            direct_passthrough=True,
+        )
+
+    boundary = uuid4().hex
+    part_headers = [
+        (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+        ).encode("ascii")
+        for start, stop in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode("ascii")
+
+    def multipart_body():
+        for part_header, (start, stop) in zip(part_headers, ranges):
+            yield part_header
+            yield from _read_range(path, start, stop - start)
+        yield closing
+
+    headers["Content-Length"] = str(
+        sum(len(part) for part in part_headers)
+        + sum(stop - start for start, stop in ranges)
+        + len(closing)
+    )
+
+    return Response(
+        multipart_body(),
+        status=206,
+        headers=headers,
+        content_type=f"multipart/byteranges; boundary={boundary}",
+        direct_passthrough=True,
+    )
@@ -0,0 +1,100 @@
+# server/migrate_ids.py
+"""
+Copy a database with 36-character string ids into the compact-id schema.
+
+Ids are CompactUUID columns: 16 bytes (native `uuid` on Postgres), with new
+rows getting time-ordered UUIDv7s. The old uuid4 strings are valid UUIDs, so
+every row keeps its id and only the storage changes -- but create_all()
+can't change an existing column, so the rows are copied into a fresh
+database instead:
+
+    DATABASE_URL=sqlite:////path/to/new.db python hard_reset_db.py
+    DATABASE_URL=sqlite:////path/to/new.db python migrate_ids.py sqlite:////path/to/old.db
+
+This is the only upgrade path for such a database; the app leaves one
+alone at startup and logs an error. The target (the app's DATABASE_URL)
+must have no users yet. Columns the old
+database lacks get their defaults; counters, timelines and the post search
+index are rebuilt afterwards. Copied rows keep their random ids; only rows
+created from now on sort by time.
+"""
+
+from __future__ import annotations
+
+import sys
+import uuid
+
+from sqlalchemy import MetaData, create_engine, func, insert, select
+
+from app import app
+from models import db, CompactUUID, User
+import counters
+import post_search
+import timeline
+
+BATCH_SIZE = 1000
+
+
+def _convert(table, row: dict) -> dict:
+    for column in table.columns:
+        value = row.get(column.name)
+
+        if isinstance(column.type, CompactUUID) and value is not None:
+            # Fail loudly on a malformed id rather than bind it as the nil UUID.
+            row[column.name] = str(uuid.UUID(str(value)))
+
+    if table.name == User.__tablename__:
+        # Plain INSERTs skip the ORM listener that fills these.
+        row["username_lower"] = row["username"].casefold()
+        row["display_name_lower"] = (row.get("display_name") or row["username"]).casefold()
+
+    return row
+
+
+def copy_table(source, source_table, table) -> int:
+    columns = [column for column in source_table.columns if column.name in table.columns]
+    query = select(*columns)
+
+    # Parents before children (e.g. comment replies) where the FKs are enforced.
+    if "created_at" in source_table.columns:
+        query = query.order_by(source_table.columns["created_at"])
+
+    copied = 0
+    result = source.execution_options(yield_per=BATCH_SIZE).execute(query)
+
+    for rows in result.mappings().partitions():
+        db.session.execute(insert(table), [_convert(table, dict(row)) for row in rows])
+        copied += len(rows)
+
+    return copied
+
+
+if len(sys.argv) != 2:
+    sys.exit("usage: python migrate_ids.py <source database url>")
+
+source_engine = create_engine(sys.argv[1])
+source_metadata = MetaData()
+source_metadata.reflect(source_engine, only=lambda name, _metadata: name in db.metadata.tables)
+
+with app.app_context():
+    if db.session.scalar(select(func.count()).select_from(User)):
+        sys.exit("The target database already has users; run hard_reset_db.py first.")
+
+    with source_engine.connect() as source:
+        for table in db.metadata.sorted_tables:
+            source_table = source_metadata.tables.get(table.name)
+
+            if source_table is None:
+                print(f"{table.name}: not in source, skipped")
+                continue
+
+            print(f"{table.name}: {copy_table(source, source_table, table)} row(s)")
+
+    db.session.commit()
+
+    for counter, drifted_rows in counters.repair_all().items():
+        print(f"{counter}: {drifted_rows} row(s) repaired")
+
+    print("Timeline entries written:", timeline.rebuild_all())
+
+    post_search.rebuild_index()
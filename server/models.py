@@ -1,21 +1,132 @@
-from __future__ import annotations
-
 """
 Flask-SQLAlchemy data model for a minimal social-media style prototype.
 """
 
+from __future__ import annotations
+
+import os
+import threading
+import time
 import uuid
 from datetime import datetime, timezone
 
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.types import BINARY, LargeBinary, TypeDecorator, Uuid
+
+import password_hashing
+from db_routing import RoutingSession
+
+db: SQLAlchemy = SQLAlchemy(session_options={"class_": RoutingSession})
+
+_NIL_UUID = uuid.UUID(int=0)
+
+_uuid7_lock = threading.Lock()
+_uuid7_last_ms = 0
+_uuid7_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """A version 7 UUID: 48-bit Unix milliseconds, then a counter and random bits.
+
+    IDs sort by creation time, so inserts append to the right edge of each
+    primary-key index instead of landing on random pages. Within one
+    millisecond the 12-bit counter keeps IDs from this process increasing.
+    """
+    global _uuid7_last_ms, _uuid7_counter
+
+    with _uuid7_lock:
+        now_ms = time.time_ns() // 1_000_000
+
+        if now_ms > _uuid7_last_ms:
+            _uuid7_last_ms = now_ms
+            # Start low enough that a busy millisecond can't overflow.
+            _uuid7_counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            _uuid7_counter += 1
+
+            if _uuid7_counter > 0xFFF:
+                _uuid7_last_ms += 1
+                _uuid7_counter = 0
 
-db: SQLAlchemy = SQLAlchemy()
+        timestamp_ms, counter = _uuid7_last_ms, _uuid7_counter
+
+    random_bits = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (
+        (timestamp_ms & ((1 << 48) - 1)) << 80
+        | 0x7 << 76
+        | counter << 64
+        | 0b10 << 62
+        | random_bits
+    )
+
+    return uuid.UUID(int=value)
 
 
 def _uuid() -> str:
-    return str(uuid.uuid4())
+    return str(uuid7())
+
+
+def parse_id(value) -> str | None:
+    """The canonical (lower-case, hyphenated) form of a client-supplied id, or None.
+
+    The database matches ids in any spelling, but Python compares strings, so
+    ids from requests are canonicalized before they meet ids from rows.
+    """
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+class CompactUUID(TypeDecorator):
+    """A UUID kept as 16 bytes but exposed to Python as its canonical string.
+
+    Postgres uses its native `uuid` type; other databases get BINARY(16)
+    (a BLOB on SQLite). Byte order matches UUID order, so time-ordered ids
+    stay ordered in every index. Values that aren't UUIDs (say, a mistyped id
+    in a URL) are bound as the nil UUID, which no row has, so lookups simply
+    find nothing instead of raising.
+    """
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(Uuid(as_uuid=False))
+
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(LargeBinary(16))
+
+        return dialect.type_descriptor(BINARY(16))
+
+    @staticmethod
+    def _parse(value) -> uuid.UUID:
+        if isinstance(value, uuid.UUID):
+            return value
+
+        try:
+            return uuid.UUID(str(value))
+        except ValueError:
+            return _NIL_UUID
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+
+        parsed = self._parse(value)
+
+        return str(parsed) if dialect.name == "postgresql" else parsed.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return str(uuid.UUID(bytes=bytes(value)))
+
+        return str(uuid.UUID(str(value)))
 
 
 def _now_utc():
@@ -25,14 +136,19 @@ def _now_utc():
 class User(db.Model, UserMixin):
     __tablename__ = "users"
 
-    id = db.Column(db.String(36), primary_key=True, default=_uuid)
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
     username = db.Column(db.String(80), unique=True, nullable=False, index=True)
     display_name = db.Column(db.String(80), nullable=True)
+    username_lower = db.Column(db.String(80), nullable=False, index=True)
+    display_name_lower = db.Column(db.String(80), nullable=True, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
     profile_image_url = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
     email_verified = db.Column(db.Boolean, nullable=False, default=False)
+    follower_count = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped on every change to the row (see _bump_version); part of ETags.
+    version = db.Column(db.Integer, nullable=False, default=1)
 
     posts = db.relationship(
         "Post",
@@ -72,10 +188,10 @@ class User(db.Model, UserMixin):
     )
 
     def set_password(self, raw_pw: str) -> None:
-        self.password_hash = generate_password_hash(raw_pw, method="pbkdf2:sha256")
+        self.password_hash = password_hashing.hash_password(raw_pw)
 
     def check_password(self, raw_pw: str) -> bool:
-        return check_password_hash(self.password_hash, raw_pw)
+        return password_hashing.verify_password(self.password_hash, raw_pw)
 
     def to_dict(self):
         return {
@@ -85,45 +201,36 @@ class User(db.Model, UserMixin):
             "profile_image_url": self.profile_image_url,
         }
 
-    def feed(self, *, limit: int = 20, before: datetime | None = None):
-        q = (
-            Post.query
-            .join(Follow, Follow.followee_id == Post.user_id)
-            .filter(
-                Follow.follower_id == self.id,
-                Post.is_deleted.is_(False),
-            )
-        )
-
-        if before is not None:
-            q = q.filter(Post.created_at < before)
-
-        return (
-            q.order_by(Post.created_at.desc())
-            .limit(limit)
-            .options(
-                db.selectinload(Post.image),
-                db.selectinload(Post.audio),
-                db.selectinload(Post.author),
-            )
-        )
-
     def __repr__(self) -> str:
         return f"<User {self.username}>"
 
 
+@db.event.listens_for(User, "before_insert")
+@db.event.listens_for(User, "before_update")
+def _normalize_search_names(mapper, connection, user: User) -> None:
+    user.username_lower = user.username.casefold()
+    user.display_name_lower = (user.display_name or user.username).casefold()
+
+
 class Post(db.Model):
     __tablename__ = "posts"
 
-    id = db.Column(db.String(36), primary_key=True, default=_uuid)
-    user_id = db.Column(db.String(36), db.ForeignKey("users.id"), nullable=False, index=True)
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
+    user_id = db.Column(CompactUUID, db.ForeignKey("users.id"), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
     is_deleted = db.Column(db.Boolean, default=False, nullable=False)
+    deleted_at = db.Column(db.DateTime(timezone=True))
+    like_count = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # False when timeline.push_post skipped fan-out (a high-follower author);
+    # such posts are merged into feeds at read time for as long as they live.
+    fanned_out = db.Column(db.Boolean, nullable=False, default=True)
 
-    image_media_id = db.Column(db.String(36), db.ForeignKey("media.id"))
-    audio_media_id = db.Column(db.String(36), db.ForeignKey("media.id"))
+    image_media_id = db.Column(CompactUUID, db.ForeignKey("media.id"), index=True)
+    audio_media_id = db.Column(CompactUUID, db.ForeignKey("media.id"), index=True)
 
     comments = db.relationship(
         "Comment",
@@ -142,53 +249,76 @@ class Post(db.Model):
     image = db.relationship("Media", foreign_keys=[image_media_id])
     audio = db.relationship("Media", foreign_keys=[audio_media_id])
 
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "user_id": self.user_id,
-            "username": self.author.username,
-            "title": self.title,
-            "description": self.description,
-            "created_at": self.created_at.isoformat(),
-            "image_url": self.image.url if self.image else None,
-            "audio_url": self.audio.url if self.audio else None,
-            "author": {
-                "id": self.author.id,
-                "username": self.author.username,
-                "display_name": self.author.display_name or self.author.username,
-                "profile_image_url": self.author.profile_image_url,
-            },
-        }
+    __table_args__ = (
+        db.Index("ix_posts_user_live_created", "user_id", "is_deleted", "created_at", "id"),
+        db.Index("ix_posts_deleted_at", "is_deleted", "deleted_at"),
+    )
 
 
 class Media(db.Model):
     __tablename__ = "media"
 
-    id = db.Column(db.String(36), primary_key=True, default=_uuid)
-    user_id = db.Column(db.String(36), db.ForeignKey("users.id"), index=True)
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
+    user_id = db.Column(CompactUUID, db.ForeignKey("users.id"), index=True)
 
     media_type = db.Column(db.String(20), nullable=False)
     url = db.Column(db.String(255), nullable=False)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, index=True)
+    content_hash = db.Column(db.String(64), index=True)
+    size_bytes = db.Column(db.Integer)
 
     width = db.Column(db.Integer)
     height = db.Column(db.Integer)
     duration = db.Column(db.Float)
+    waveform = db.Column(db.JSON)
+    version = db.Column(db.Integer, nullable=False, default=1)
 
     created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
 
+    renditions = db.relationship(
+        "MediaRendition",
+        backref="media",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+    )
+
+
+class MediaRendition(db.Model):
+    __tablename__ = "media_renditions"
+
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
+    media_id = db.Column(CompactUUID, db.ForeignKey("media.id"), nullable=False)
+
+    label = db.Column(db.String(40), nullable=False)
+    mime_type = db.Column(db.String(60), nullable=False)
+    bitrate_kbps = db.Column(db.Integer)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    url = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size_bytes = db.Column(db.Integer)
+
+    created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint("media_id", "label", name="uq_media_rendition_label"),
+    )
+
 
 class Comment(db.Model):
     __tablename__ = "comments"
 
-    id = db.Column(db.String(36), primary_key=True, default=_uuid)
-    post_id = db.Column(db.String(36), db.ForeignKey("posts.id"), nullable=False, index=True)
-    user_id = db.Column(db.String(36), db.ForeignKey("users.id"), nullable=False, index=True)
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
+    post_id = db.Column(CompactUUID, db.ForeignKey("posts.id"), nullable=False, index=True)
+    user_id = db.Column(CompactUUID, db.ForeignKey("users.id"), nullable=False, index=True)
 
     body = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
 
-    parent_id = db.Column(db.String(36), db.ForeignKey("comments.id"))
+    parent_id = db.Column(CompactUUID, db.ForeignKey("comments.id"))
+    like_count = db.Column(db.Integer, nullable=False, default=0)
+    reply_count = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=1)
 
     replies = db.relationship(
         "Comment",
@@ -204,14 +334,20 @@ class Comment(db.Model):
         cascade="all, delete-orphan",
     )
 
+    __table_args__ = (
+        db.Index("ix_comments_post_parent_created", "post_id", "parent_id", "created_at", "id"),
+        db.Index("ix_comments_parent_created", "parent_id", "created_at", "id"),
+        db.Index("ix_comments_user_created", "user_id", "created_at", "id"),
+    )
+
 
 class Like(db.Model):
     __tablename__ = "likes"
 
-    id = db.Column(db.String(36), primary_key=True, default=_uuid)
-    user_id = db.Column(db.String(36), db.ForeignKey("users.id"), nullable=False, index=True)
-    post_id = db.Column(db.String(36), db.ForeignKey("posts.id"), nullable=True, index=True)
-    comment_id = db.Column(db.String(36), db.ForeignKey("comments.id"), nullable=True, index=True)
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
+    user_id = db.Column(CompactUUID, db.ForeignKey("users.id"), nullable=False, index=True)
+    post_id = db.Column(CompactUUID, db.ForeignKey("posts.id"), nullable=True, index=True)
+    comment_id = db.Column(CompactUUID, db.ForeignKey("comments.id"), nullable=True, index=True)
     created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
 
     __table_args__ = (
@@ -223,12 +359,125 @@ class Like(db.Model):
 class Follow(db.Model):
     __tablename__ = "follows"
 
-    follower_id = db.Column(db.String(36), db.ForeignKey("users.id"), primary_key=True)
-    followee_id = db.Column(db.String(36), db.ForeignKey("users.id"), primary_key=True)
+    follower_id = db.Column(CompactUUID, db.ForeignKey("users.id"), primary_key=True)
+    followee_id = db.Column(CompactUUID, db.ForeignKey("users.id"), primary_key=True)
     created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
 
     __table_args__ = (
         db.Index("ix_follower_follow_created", "follower_id", "created_at"),
         db.Index("ix_follow_followed_created", "followee_id", "created_at"),
         db.CheckConstraint("follower_id != followee_id", name="ck_no_self_follow"),
-    )
\ No newline at end of file
+    )
+
+
+class TimelineEntry(db.Model):
+    __tablename__ = "timeline_entries"
+
+    user_id = db.Column(CompactUUID, db.ForeignKey("users.id"), primary_key=True)
+    post_id = db.Column(CompactUUID, db.ForeignKey("posts.id"), primary_key=True)
+    author_id = db.Column(CompactUUID, db.ForeignKey("users.id"), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_timeline_user_created", "user_id", "created_at", "post_id"),
+        db.Index("ix_timeline_user_author", "user_id", "author_id"),
+        db.Index("ix_timeline_post", "post_id"),
+    )
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
+    locked_at = db.Column(db.DateTime(timezone=True))
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+
+class UploadSession(db.Model):
+    __tablename__ = "upload_sessions"
+
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
+    user_id = db.Column(CompactUUID, db.ForeignKey("users.id"), nullable=False, index=True)
+
+    media_type = db.Column(db.String(20), nullable=False)
+    suffix = db.Column(db.String(16), nullable=False)
+    total_bytes = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    declared_duration = db.Column(db.Float)
+
+    status = db.Column(db.String(20), nullable=False, default="open")
+    media_id = db.Column(CompactUUID, db.ForeignKey("media.id"))
+
+    created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+    chunks = db.relationship(
+        "UploadChunk",
+        backref="session",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+    )
+
+
+class UploadChunk(db.Model):
+    __tablename__ = "upload_chunks"
+
+    session_id = db.Column(CompactUUID, db.ForeignKey("upload_sessions.id"), primary_key=True)
+    chunk_index = db.Column(db.Integer, primary_key=True)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    received_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
+
+
+@db.event.listens_for(User, "before_update")
+@db.event.listens_for(Post, "before_update")
+@db.event.listens_for(Media, "before_update")
+@db.event.listens_for(Comment, "before_update")
+def _bump_version(mapper, connection, target) -> None:
+    # Bulk UPDATEs (counters) bump `version` themselves.
+    if db.object_session(target).is_modified(target, include_collections=False):
+        target.version = mapper.class_.version + 1
+
+
+@db.event.listens_for(MediaRendition, "after_insert")
+@db.event.listens_for(MediaRendition, "after_delete")
+def _bump_media_version(mapper, connection, rendition: MediaRendition) -> None:
+    # A new rendition changes the media's URLs in serialized posts.
+    connection.execute(
+        db.update(Media)
+        .where(Media.id == rendition.media_id)
+        .values(version=Media.version + 1)
+    )
+
+
+class OutboxEmail(db.Model):
+    __tablename__ = "email_outbox"
+
+    id = db.Column(CompactUUID, primary_key=True, default=_uuid)
+    to_email = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
+    locked_at = db.Column(db.DateTime(timezone=True))
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime(timezone=True), default=_now_utc, nullable=False)
+    sent_at = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_run_after", "status", "run_after"),
+    )
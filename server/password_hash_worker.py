@@ -0,0 +1,12 @@
+# server/password_hash_worker.py
+"""
+Entry module for password_hashing's worker processes.
+
+Spawned workers run this as their __main__ instead of whatever script
+started the web process (app.py, a seed script...), so a worker imports
+werkzeug.security and nothing else: no Flask app, no database setup.
+"""
+
+from __future__ import annotations
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: F401
@@ -0,0 +1,148 @@
+# server/password_hashing.py
+"""
+Password hashing off the request threads.
+
+pbkdf2 runs in a dedicated pool of PASSWORD_HASH_WORKERS processes, so a
+burst of logins burns those cores instead of holding the GIL that feed
+requests need. At most PASSWORD_HASH_MAX_PENDING hashes may be queued or
+running per web process; past that, callers wait up to
+PASSWORD_HASH_TIMEOUT_SECONDS and then get HasherBusy (a 503), rather than
+piling up unbounded work. A hash that takes longer than that once submitted
+is also HasherBusy. If a worker dies, the pool is broken for good, so it is
+replaced and the hash retried once.
+
+The cost is PASSWORD_PBKDF2_ITERATIONS. needs_rehash() tells login when a
+stored hash was made with other parameters, so it can store a fresh hash
+while it still has the plaintext. PASSWORD_HASH_WORKERS=0 hashes inline,
+for tests and debugging; otherwise every process that imports app,
+including the seed scripts, starts its own pool on first use.
+
+Workers are spawned, and spawn normally re-runs the parent's __main__ script
+in every child, which for `python app.py` means the whole app setup.
+_WorkerProcess points __main__ at password_hash_worker while a worker
+starts, so children import that instead.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.context import SpawnContext, SpawnProcess
+from types import SimpleNamespace
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(RuntimeError):
+    """The hashing pool is saturated; the request should be retried later."""
+
+
+WORKER_MAIN_MODULE = "password_hash_worker"
+
+_spawn_lock = threading.Lock()
+
+
+class _WorkerProcess(SpawnProcess):
+    def start(self):
+        main = sys.modules["__main__"]
+
+        # multiprocessing re-imports the child's __main__ by module name when
+        # __main__.__spec__ has one, and by file path otherwise.
+        with _spawn_lock:
+            saved = main.__dict__.get("__spec__")
+            main.__spec__ = SimpleNamespace(name=WORKER_MAIN_MODULE)
+
+            try:
+                super().start()
+            finally:
+                main.__spec__ = saved
+
+
+class _WorkerContext(SpawnContext):
+    Process = _WorkerProcess
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+_slots: threading.BoundedSemaphore | None = None
+
+
+def method() -> str:
+    return f"pbkdf2:sha256:{current_app.config['PASSWORD_PBKDF2_ITERATIONS']}"
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid, _slots
+
+    with _pool_lock:
+        # A pool inherited through fork (e.g. gunicorn preload) is unusable.
+        if _pool is None or _pool_pid != os.getpid():
+            config = current_app.config
+            _pool = ProcessPoolExecutor(
+                max_workers=config["PASSWORD_HASH_WORKERS"],
+                # Never fork a multi-threaded web process.
+                mp_context=_WorkerContext(),
+            )
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(config["PASSWORD_HASH_MAX_PENDING"])
+
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+
+    with _pool_lock:
+        # Another thread may already have replaced it.
+        if _pool is pool:
+            _pool = None
+
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn, *args):
+    if current_app.config["PASSWORD_HASH_WORKERS"] <= 0:
+        return fn(*args)
+
+    pool = _get_pool()
+    timeout = current_app.config["PASSWORD_HASH_TIMEOUT_SECONDS"]
+    slots = _slots
+
+    if not slots.acquire(timeout=timeout):
+        raise HasherBusy("password hashing is overloaded")
+
+    try:
+        try:
+            return pool.submit(fn, *args).result(timeout=timeout)
+        except BrokenProcessPool:
+            current_app.logger.warning("Password hashing pool broke; starting a new one")
+            _discard_pool(pool)
+            return _get_pool().submit(fn, *args).result(timeout=timeout)
+    except TimeoutError:
+        raise HasherBusy("password hashing timed out") from None
+    finally:
+        slots.release()
+
+
+def hash_password(raw_pw: str) -> str:
+    return _run(generate_password_hash, raw_pw, method())
+
+
+def verify_password(password_hash: str, raw_pw: str) -> bool:
+    return _run(check_password_hash, password_hash, raw_pw)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return password_hash.split("$", 1)[0] != method()
+
+
+@atexit.register
+def _shutdown() -> None:
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
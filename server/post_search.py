@@ -0,0 +1,194 @@
+# server/post_search.py
+"""
+Full-text search over post titles and descriptions.
+
+SQLite keeps an FTS5 table (`posts_fts`) keyed by an UNINDEXED `post_id`
+column holding `posts.id`. The implicit rowid of `posts` isn't stable: VACUUM
+or a table copy may renumber it. index_post/unindex_post keep the table in
+step with create/delete. On Postgres a GIN
+expression index over to_tsvector(title || description) is maintained by the
+database itself, so those hooks are no-ops. Other backends, or SQLite builds
+without FTS5, fall back to a LIKE scan.
+
+Results are ranked by text relevance multiplied by a recency boost that
+decays from 2x for a brand-new post towards 1x over a few weeks.
+"""
+
+from __future__ import annotations
+
+import re
+
+from flask import current_app
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, Post
+
+RECENCY_HALF_LIFE_DAYS = 7
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_PG_DOCUMENT = (
+    "to_tsvector('english', coalesce(posts.title, '') || ' ' || coalesce(posts.description, ''))"
+)
+
+_INDEX_LIVE_POSTS = (
+    "INSERT INTO posts_fts (post_id, title, description) "
+    "SELECT id, title, coalesce(description, '') FROM posts WHERE is_deleted = 0"
+)
+
+_backend: str | None = None
+
+
+def _dialect() -> str:
+    return db.engine.dialect.name
+
+
+def ensure_index() -> None:
+    """Create the search index if missing; call once at startup."""
+    global _backend
+
+    dialect = _dialect()
+
+    if dialect == "postgresql":
+        db.session.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_posts_search ON posts USING GIN ({_PG_DOCUMENT})"
+        ))
+        db.session.commit()
+        _backend = "postgresql"
+        return
+
+    if dialect != "sqlite":
+        _backend = "like"
+        return
+
+    columns = {row.name for row in db.session.execute(text("PRAGMA table_info(posts_fts)"))}
+
+    if "post_id" in columns:
+        _backend = "fts5"
+        return
+
+    if columns:
+        # An older index keyed by posts.rowid.
+        db.session.execute(text("DROP TABLE posts_fts"))
+
+    try:
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE posts_fts USING fts5("
+            "post_id UNINDEXED, title, description, tokenize = 'porter unicode61')"
+        ))
+    except OperationalError:
+        db.session.rollback()
+        current_app.logger.warning("SQLite FTS5 unavailable; post search will use LIKE scans")
+        _backend = "like"
+        return
+
+    db.session.execute(text(_INDEX_LIVE_POSTS))
+    db.session.commit()
+    _backend = "fts5"
+
+
+def rebuild_index() -> None:
+    """Re-index every live post, e.g. after posts were copied in with plain INSERTs."""
+    if _backend != "fts5":
+        return
+
+    db.session.execute(text("DELETE FROM posts_fts"))
+    db.session.execute(text(_INDEX_LIVE_POSTS))
+    db.session.commit()
+
+
+def index_post(post: Post) -> None:
+    """Add a flushed post to the search index inside the caller's transaction."""
+    if _backend != "fts5" or post.is_deleted:
+        return
+
+    db.session.execute(
+        text(
+            "INSERT INTO posts_fts (post_id, title, description) "
+            "SELECT id, title, coalesce(description, '') FROM posts WHERE id = :post_id"
+        ).bindparams(bindparam("post_id", type_=Post.id.type)),
+        {"post_id": post.id},
+    )
+
+
+def unindex_post(post_id: str) -> None:
+    if _backend != "fts5":
+        return
+
+    # post_id is unindexed, so this scans posts_fts; deletes are rare.
+    db.session.execute(
+        text("DELETE FROM posts_fts WHERE post_id = :post_id")
+        .bindparams(bindparam("post_id", type_=Post.id.type)),
+        {"post_id": post_id},
+    )
+
+
+def _fts5_query(terms: list[str]) -> str:
+    # Quote every term so user input can't use FTS5 syntax; prefix-match the
+    # last one so results update while the user is still typing.
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_post_ids(query: str, *, limit: int = 20) -> list[str]:
+    """Return up to `limit` live post ids matching `query`, best first."""
+    terms = _TOKEN_RE.findall(query.lower())
+
+    if not terms:
+        return []
+
+    if _backend == "fts5":
+        rows = db.session.execute(
+            text(
+                "SELECT posts.id FROM posts_fts "
+                "JOIN posts ON posts.id = posts_fts.post_id "
+                "WHERE posts_fts MATCH :match AND posts.is_deleted = 0 "
+                "ORDER BY -bm25(posts_fts, 4.0, 1.0) * "
+                "(1.0 + 1.0 / (1.0 + (julianday('now') - julianday(posts.created_at)) / :half_life)) DESC "
+                "LIMIT :limit"
+            ).columns(id=Post.id.type),
+            {
+                "match": _fts5_query(terms),
+                "half_life": RECENCY_HALF_LIFE_DAYS,
+                "limit": limit,
+            },
+        )
+        return [row.id for row in rows]
+
+    if _backend == "postgresql":
+        rows = db.session.execute(
+            text(
+                "SELECT posts.id FROM posts, websearch_to_tsquery('english', :query) AS q "
+                f"WHERE {_PG_DOCUMENT} @@ q AND posts.is_deleted = false "
+                f"ORDER BY ts_rank_cd({_PG_DOCUMENT}, q) * "
+                "(1.0 + 1.0 / (1.0 + extract(epoch FROM now() - posts.created_at) / 86400.0 / :half_life)) DESC "
+                "LIMIT :limit"
+            ).columns(id=Post.id.type),
+            {
+                "query": " ".join(terms),
+                "half_life": RECENCY_HALF_LIFE_DAYS,
+                "limit": limit,
+            },
+        )
+        return [row.id for row in rows]
+
+    like_filters = [
+        db.or_(
+            db.func.lower(Post.title).contains(term),
+            db.func.lower(Post.description).contains(term),
+        )
+        for term in terms
+    ]
+
+    rows = (
+        Post.query
+        .with_entities(Post.id)
+        .filter(Post.is_deleted.is_(False), *like_filters)
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+    return [row.id for row in rows]
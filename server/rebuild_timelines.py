@@ -0,0 +1,15 @@
+# server/rebuild_timelines.py
+from __future__ import annotations
+
+# Needs a database on the current schema; one from before compact ids is
+# upgraded with migrate_ids.py, which rebuilds timelines itself.
+
+from app import app
+import timeline
+
+
+with app.app_context():
+    entry_count = timeline.rebuild_all()
+
+    print("Fan-out limit:", timeline.fanout_max_followers())
+    print("Timeline entries written:", entry_count)
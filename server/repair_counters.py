@@ -0,0 +1,12 @@
+# server/repair_counters.py
+from __future__ import annotations
+
+from app import app
+import counters
+
+
+with app.app_context():
+    drift = counters.repair_all()
+
+    for counter, drifted_rows in drift.items():
+        print(f"{counter}: {drifted_rows} row(s) repaired")
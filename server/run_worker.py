@@ -0,0 +1,27 @@
+# server/run_worker.py
+"""
+Run background jobs and the email sender in a dedicated process.
+
+Start the web app with JOB_WORKER_THREADS=0 and run this alongside it.
+"""
+
+from __future__ import annotations
+
+import time
+
+from app import app
+import jobs
+import mailer
+
+
+if __name__ == "__main__":
+    poll_interval = app.config["JOB_POLL_INTERVAL_SECONDS"]
+
+    print("Job worker started; polling every", poll_interval, "seconds")
+
+    while True:
+        with app.app_context():
+            ran = jobs.run_pending() + mailer.send_batch()
+
+        if not ran:
+            time.sleep(poll_interval)
@@ -0,0 +1,370 @@
+# server/serializers.py
+"""
+Batch JSON serializers that read plain columns instead of ORM objects.
+
+Serializing a page costs a fixed number of queries no matter how many rows it
+holds: one joined row per post carries author, media and counter columns, and
+one more query fetches audio renditions and image variants for the whole page.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from audio_pipeline import RENDITIONS
+from cursors import encode_cursor
+from image_pipeline import CARD_VARIANTS
+from models import db, Comment, Like, Media, MediaRendition, Post, User
+
+ImageMedia = aliased(Media)
+AudioMedia = aliased(Media)
+PostAuthor = aliased(User)
+
+
+def _ids(items: Iterable[str | Post | Comment]) -> list[str]:
+    return [item if isinstance(item, str) else item.id for item in items]
+
+
+def renditions_by_media(media_ids: list[str]) -> dict[str, list[dict]]:
+    """Ready renditions per media id, in RENDITIONS / CARD_VARIANTS preference order."""
+    if not media_ids:
+        return {}
+
+    labels = [label for label, *_rest in RENDITIONS + CARD_VARIANTS]
+    preference = {label: position for position, label in enumerate(labels)}
+
+    rows = db.session.execute(
+        select(
+            MediaRendition.media_id,
+            MediaRendition.label,
+            MediaRendition.url,
+            MediaRendition.mime_type,
+            MediaRendition.bitrate_kbps,
+            MediaRendition.width,
+            MediaRendition.height,
+        ).where(MediaRendition.media_id.in_(media_ids))
+    ).all()
+
+    by_media = {}
+
+    for row in sorted(rows, key=lambda row: preference.get(row.label, len(preference))):
+        if row.label not in preference:
+            continue
+
+        rendition = {"label": row.label, "url": row.url, "mime_type": row.mime_type}
+
+        if row.bitrate_kbps is not None:
+            rendition["bitrate_kbps"] = row.bitrate_kbps
+        else:
+            rendition["width"] = row.width
+            rendition["height"] = row.height
+
+        by_media.setdefault(row.media_id, []).append(rendition)
+
+    return by_media
+
+
+def serialize_posts(
+    posts: Iterable[str | Post],
+    *,
+    with_counts: bool = False,
+) -> list[dict]:
+    """Serialize posts (ids or rows) in the given order, skipping unknown ids."""
+    post_ids = _ids(posts)
+
+    if not post_ids:
+        return []
+
+    rows = db.session.execute(
+        select(
+            Post.id,
+            Post.user_id,
+            Post.title,
+            Post.description,
+            Post.created_at,
+            Post.like_count,
+            Post.comment_count,
+            Post.audio_media_id,
+            Post.image_media_id,
+            User.username,
+            User.display_name,
+            User.profile_image_url,
+            ImageMedia.url.label("image_url"),
+            ImageMedia.width.label("image_width"),
+            ImageMedia.height.label("image_height"),
+            AudioMedia.url.label("audio_url"),
+            AudioMedia.duration.label("audio_duration"),
+            AudioMedia.waveform.label("audio_waveform"),
+        )
+        .join(User, User.id == Post.user_id)
+        .outerjoin(ImageMedia, ImageMedia.id == Post.image_media_id)
+        .outerjoin(AudioMedia, AudioMedia.id == Post.audio_media_id)
+        .where(Post.id.in_(post_ids))
+    ).all()
+
+    renditions = renditions_by_media(
+        [media_id for row in rows for media_id in (row.audio_media_id, row.image_media_id) if media_id]
+    )
+
+    by_id = {}
+
+    for row in rows:
+        audio_renditions = renditions.get(row.audio_media_id, [])
+        image_variants = renditions.get(row.image_media_id, [])
+        card = image_variants[0] if image_variants else None
+
+        author = {
+            "id": row.user_id,
+            "username": row.username,
+            "display_name": row.display_name or row.username,
+            "profile_image_url": row.profile_image_url,
+        }
+
+        payload = {
+            "id": row.id,
+            "user_id": row.user_id,
+            "username": row.username,
+            "title": row.title,
+            "description": row.description,
+            "created_at": row.created_at.isoformat(),
+            "image_url": card["url"] if card else row.image_url,
+            "image_width": card["width"] if card else row.image_width,
+            "image_height": card["height"] if card else row.image_height,
+            "original_image_url": row.image_url,
+            "image_variants": image_variants,
+            "audio_url": audio_renditions[0]["url"] if audio_renditions else row.audio_url,
+            "original_audio_url": row.audio_url,
+            "audio_renditions": audio_renditions,
+            "audio_duration": row.audio_duration,
+            "audio_waveform": row.audio_waveform,
+            "author": author,
+            "cursor": encode_cursor(row.created_at, row.id),
+        }
+
+        if with_counts:
+            payload["like_count"] = row.like_count
+            payload["comment_count"] = row.comment_count
+
+        by_id[row.id] = payload
+
+    return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+
+
+def posts_version(post_ids: list[str]) -> list[tuple]:
+    """The row versions serialize_posts(post_ids) reads, for building ETags."""
+    if not post_ids:
+        return []
+
+    rows = db.session.execute(
+        select(Post.id, Post.version, User.version, ImageMedia.version, AudioMedia.version)
+        .join(User, User.id == Post.user_id)
+        .outerjoin(ImageMedia, ImageMedia.id == Post.image_media_id)
+        .outerjoin(AudioMedia, AudioMedia.id == Post.audio_media_id)
+        .where(Post.id.in_(post_ids))
+    ).all()
+
+    return sorted(tuple(row) for row in rows)
+
+
+def liked_comment_ids(viewer_id: str, comment_ids: list[str]) -> set[str]:
+    if not comment_ids:
+        return set()
+
+    return set(
+        db.session.scalars(
+            select(Like.comment_id).where(
+                Like.user_id == viewer_id,
+                Like.comment_id.in_(comment_ids),
+            )
+        )
+    )
+
+
+def serialize_comments(
+    comments: Iterable[str | Comment],
+    *,
+    viewer_id: str,
+    with_post: bool = False,
+) -> list[dict]:
+    """Serialize comments in the given order with two queries in total.
+
+    One joined query reads comment, author (and with_post, the post and its
+    author) columns; a second IN-list query finds which of them the viewer
+    has liked.
+    """
+    comment_ids = _ids(comments)
+
+    if not comment_ids:
+        return []
+
+    columns = [
+        Comment.id,
+        Comment.post_id,
+        Comment.user_id,
+        Comment.parent_id,
+        Comment.body,
+        Comment.created_at,
+        Comment.like_count,
+        Comment.reply_count,
+        User.username,
+        User.display_name,
+        User.profile_image_url,
+    ]
+
+    if with_post:
+        columns += [
+            Post.title.label("post_title"),
+            Post.description.label("post_description"),
+            Post.user_id.label("post_author_id"),
+            PostAuthor.username.label("post_author_username"),
+            PostAuthor.display_name.label("post_author_display_name"),
+            PostAuthor.profile_image_url.label("post_author_profile_image_url"),
+        ]
+
+    query = (
+        select(*columns)
+        .join(User, User.id == Comment.user_id)
+        .where(Comment.id.in_(comment_ids))
+    )
+
+    if with_post:
+        query = (
+            query
+            .join(Post, Post.id == Comment.post_id)
+            .join(PostAuthor, PostAuthor.id == Post.user_id)
+        )
+
+    rows = db.session.execute(query).all()
+    liked_ids = liked_comment_ids(viewer_id, comment_ids)
+
+    by_id = {}
+
+    for row in rows:
+        payload = {
+            "id": row.id,
+            "post_id": row.post_id,
+            "user_id": row.user_id,
+            "parent_id": row.parent_id,
+            "username": row.username,
+            "display_name": row.display_name or row.username,
+            "profile_image_url": row.profile_image_url,
+            "body": row.body,
+            "created_at": row.created_at.isoformat(),
+            "like_count": row.like_count,
+            "reply_count": row.reply_count,
+            "liked_by_current_user": row.id in liked_ids,
+            "cursor": encode_cursor(row.created_at, row.id),
+        }
+
+        if with_post:
+            payload["post"] = {
+                "id": row.post_id,
+                "title": row.post_title,
+                "description": row.post_description,
+                "author": {
+                    "id": row.post_author_id,
+                    "username": row.post_author_username,
+                    "display_name": row.post_author_display_name or row.post_author_username,
+                    "profile_image_url": row.post_author_profile_image_url,
+                },
+            }
+
+        by_id[row.id] = payload
+
+    return [by_id[comment_id] for comment_id in comment_ids if comment_id in by_id]
+
+
+def comment_threads_version(comment_ids: list[str]) -> tuple:
+    """Row count and summed versions of the comments, all their replies and authors.
+
+    Any edit, like, reply or deletion in the threads changes the result.
+    """
+    if not comment_ids:
+        return ()
+
+    return tuple(
+        db.session.execute(
+            select(
+                db.func.count(Comment.id),
+                db.func.coalesce(db.func.sum(Comment.version), 0),
+                db.func.coalesce(db.func.sum(User.version), 0),
+            )
+            .join(User, User.id == Comment.user_id)
+            .where(db.or_(Comment.id.in_(comment_ids), Comment.parent_id.in_(comment_ids)))
+        ).one()
+    )
+
+
+def serialize_comment_threads(
+    comment_ids: list[str],
+    *,
+    viewer_id: str,
+    reply_preview: int,
+) -> list[dict]:
+    """Serialize top-level comments, each with its first `reply_preview` replies.
+
+    Replies are picked with one windowed query across all threads on the page;
+    threads with more replies carry a `replies_cursor` for
+    /api/comments/<id>/replies.
+    """
+    if not comment_ids:
+        return []
+
+    ranked = (
+        select(
+            Comment.id,
+            Comment.parent_id,
+            Comment.created_at,
+            db.func.row_number()
+            .over(
+                partition_by=Comment.parent_id,
+                order_by=(Comment.created_at, Comment.id),
+            )
+            .label("position"),
+        )
+        .where(Comment.parent_id.in_(comment_ids))
+        .subquery()
+    )
+
+    reply_rows = db.session.execute(
+        select(ranked.c.id, ranked.c.parent_id, ranked.c.created_at)
+        .where(ranked.c.position <= reply_preview)
+        .order_by(ranked.c.parent_id, ranked.c.position)
+    ).all()
+
+    replies_by_parent = {}
+
+    for row in reply_rows:
+        replies_by_parent.setdefault(row.parent_id, []).append(row)
+
+    serialized = {
+        comment["id"]: comment
+        for comment in serialize_comments(
+            [*comment_ids, *(row.id for row in reply_rows)],
+            viewer_id=viewer_id,
+        )
+    }
+
+    threads = []
+
+    for comment_id in comment_ids:
+        if comment_id not in serialized:
+            continue
+
+        comment = serialized[comment_id]
+        replies = replies_by_parent.get(comment_id, [])
+        replies_cursor = None
+
+        if replies and comment["reply_count"] > len(replies):
+            replies_cursor = encode_cursor(replies[-1].created_at, replies[-1].id)
+
+        threads.append({
+            **comment,
+            "replies": [serialized[row.id] for row in replies if row.id in serialized],
+            "replies_cursor": replies_cursor,
+        })
+
+    return threads
@@ -0,0 +1,253 @@
+# server/timeline.py
+"""
+Materialized home timelines (fan-out-on-write) for /api/feed.
+
+Each follower gets one `timeline_entries` row per post from the accounts they
+follow, so reading a feed is a single range scan on (user_id, created_at).
+Posts by authors with more than TIMELINE_FANOUT_MAX_FOLLOWERS followers are
+not fanned out; they are marked `fanned_out = False` and merged into the feed
+at read time instead. The mark is per post, so a post stays where it was put
+when its author's follower count later crosses the limit either way.
+rebuild_timelines.py re-decides every post against the current limit.
+"""
+
+from __future__ import annotations
+
+from flask import current_app
+from sqlalchemy import delete, insert, literal, or_, select, update
+
+import counters
+import cursors
+import feed_cache
+from models import db, Follow, Post, TimelineEntry, User
+
+DEFAULT_FANOUT_MAX_FOLLOWERS = 10000
+
+
+def fanout_max_followers() -> int:
+    return current_app.config.get(
+        "TIMELINE_FANOUT_MAX_FOLLOWERS",
+        DEFAULT_FANOUT_MAX_FOLLOWERS,
+    )
+
+
+def is_high_fanout(author_id: str) -> bool:
+    follower_count = db.session.scalar(
+        select(User.follower_count).where(User.id == author_id)
+    )
+
+    return (follower_count or 0) > fanout_max_followers()
+
+
+def push_post(post: Post) -> None:
+    """Copy a freshly flushed post into every follower's timeline."""
+    if post.is_deleted:
+        return
+
+    if is_high_fanout(post.user_id):
+        post.fanned_out = False
+        feed_cache.invalidate_pulled()
+        return
+
+    followers = select(
+        Follow.follower_id,
+        literal(post.id, type_=TimelineEntry.post_id.type),
+        literal(post.user_id, type_=TimelineEntry.author_id.type),
+        literal(post.created_at, type_=TimelineEntry.created_at.type),
+    ).where(Follow.followee_id == post.user_id)
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "author_id", "created_at"],
+            followers,
+        )
+    )
+
+    if feed_cache.enabled():
+        feed_cache.invalidate_users(
+            db.session.scalars(select(Follow.follower_id).where(Follow.followee_id == post.user_id))
+        )
+
+
+def retract_post(post_id: str) -> None:
+    if feed_cache.enabled():
+        fanned_out = db.session.scalar(select(Post.fanned_out).where(Post.id == post_id))
+
+        if fanned_out is False:
+            feed_cache.invalidate_pulled()
+        else:
+            feed_cache.invalidate_users(
+                db.session.scalars(select(TimelineEntry.user_id).where(TimelineEntry.post_id == post_id))
+            )
+
+    db.session.execute(
+        delete(TimelineEntry).where(TimelineEntry.post_id == post_id)
+    )
+
+
+def _invalidate_holders(post_ids) -> None:
+    """Drop the cached feed pages of everyone whose feed shows one of `post_ids`.
+
+    `post_ids` is a select of post ids.
+    """
+    if not feed_cache.enabled():
+        return
+
+    feed_cache.invalidate_users(
+        db.session.scalars(
+            select(TimelineEntry.user_id)
+            .where(TimelineEntry.post_id.in_(post_ids))
+            .distinct()
+        )
+    )
+
+    pulled = db.session.scalar(
+        select(Post.id)
+        .where(Post.id.in_(post_ids), Post.fanned_out.is_(False))
+        .limit(1)
+    )
+
+    if pulled is not None:
+        feed_cache.invalidate_pulled()
+
+
+def media_changed(media_id: str) -> None:
+    """A background job changed what the posts using this media serialize to."""
+    _invalidate_holders(
+        select(Post.id).where(
+            or_(Post.image_media_id == media_id, Post.audio_media_id == media_id)
+        )
+    )
+
+
+def author_changed(user_id: str) -> None:
+    """The author fields embedded in this user's posts changed."""
+    if not feed_cache.enabled():
+        return
+
+    if is_high_fanout(user_id):
+        feed_cache.invalidate_pulled()
+
+    feed_cache.invalidate_users(
+        db.session.scalars(select(Follow.follower_id).where(Follow.followee_id == user_id))
+    )
+
+
+def backfill_follow(follower_id: str, followee_id: str) -> None:
+    """Copy the followee's live, fanned-out posts into the new follower's timeline."""
+    feed_cache.invalidate_users([follower_id])
+
+    posts = select(
+        literal(follower_id, type_=TimelineEntry.user_id.type),
+        Post.id,
+        Post.user_id,
+        Post.created_at,
+    ).where(
+        Post.user_id == followee_id,
+        Post.is_deleted.is_(False),
+        Post.fanned_out.is_(True),
+    )
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "author_id", "created_at"],
+            posts,
+        )
+    )
+
+
+def prune_follow(follower_id: str, followee_id: str) -> None:
+    feed_cache.invalidate_users([follower_id])
+
+    db.session.execute(
+        delete(TimelineEntry).where(
+            TimelineEntry.user_id == follower_id,
+            TimelineEntry.author_id == followee_id,
+        )
+    )
+
+
+def read_feed(
+    user_id: str,
+    *,
+    limit: int = 20,
+    cursor: str | None = None,
+) -> list[str]:
+    """Return the post ids for one page of the user's home feed, newest first.
+
+    Raises cursors.InvalidCursor for a tampered or malformed cursor.
+    """
+    pushed = cursors.paginate(
+        select(TimelineEntry.post_id, TimelineEntry.created_at).where(
+            TimelineEntry.user_id == user_id
+        ),
+        TimelineEntry.created_at,
+        TimelineEntry.post_id,
+        cursor=cursor,
+        limit=limit,
+    )
+
+    # Fan-out-on-read for the posts push_post skipped.
+    pulled = (
+        select(Post.id, Post.created_at)
+        .join(Follow, Follow.followee_id == Post.user_id)
+        .where(
+            Follow.follower_id == user_id,
+            Post.fanned_out.is_(False),
+            Post.is_deleted.is_(False),
+        )
+    )
+
+    pulled = cursors.paginate(
+        pulled,
+        Post.created_at,
+        Post.id,
+        cursor=cursor,
+        limit=limit,
+    )
+
+    positions = {}
+
+    for post_id, created_at in [*db.session.execute(pushed), *db.session.execute(pulled)]:
+        positions[post_id] = (created_at, post_id)
+
+    return sorted(positions, key=positions.get, reverse=True)[:limit]
+
+
+def rebuild_all() -> int:
+    """Recompute follower counts and every timeline from follows and posts."""
+    counters.repair_follower_counts()
+
+    below_limit = (
+        select(User.follower_count)
+        .where(User.id == Post.user_id)
+        .scalar_subquery()
+        <= fanout_max_followers()
+    )
+    db.session.execute(
+        update(Post)
+        .values(fanned_out=below_limit)
+        .execution_options(synchronize_session=False)
+    )
+
+    db.session.execute(delete(TimelineEntry))
+
+    entries = (
+        select(Follow.follower_id, Post.id, Post.user_id, Post.created_at)
+        .join(Post, Post.user_id == Follow.followee_id)
+        .where(
+            Post.is_deleted.is_(False),
+            Post.fanned_out.is_(True),
+        )
+    )
+
+    db.session.execute(
+        insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "author_id", "created_at"],
+            entries,
+        )
+    )
+
+    db.session.commit()
+
+    return db.session.query(TimelineEntry).count()
@@ -0,0 +1,95 @@
+# server/user_cache.py
+"""
+In-process cache of the signed-in user's identity for Flask-Login.
+
+load_user runs on every authenticated request, and nearly all of them only
+need `current_user.id` (plus the name, email and picture for
+/api/get_current_user). load() keeps those columns in an LRU of at most
+USER_CACHE_SIZE users, each entry good for USER_CACHE_TTL_SECONDS, shared by
+all request threads. On a hit it rebuilds the User without a query and
+attaches it to the session with merge(load=False); every other column is
+left expired, so reading one (or a relationship) still loads it from the
+database as before.
+
+Code that changes a cached column calls invalidate() after committing. The
+TTL bounds how stale another process's copy (another web worker, or a job
+in run_worker.py) can get.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import db, User
+
+CACHED_COLUMNS = ("id", "username", "display_name", "email", "profile_image_url")
+
+# user id -> (expires_at on the monotonic clock, column values)
+_entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _get(user_id: str) -> dict | None:
+    with _lock:
+        entry = _entries.get(user_id)
+
+        if entry is None:
+            return None
+
+        if entry[0] <= time.monotonic():
+            del _entries[user_id]
+            return None
+
+        _entries.move_to_end(user_id)
+        return entry[1]
+
+
+def _put(user: User) -> None:
+    config = current_app.config
+    max_size = config["USER_CACHE_SIZE"]
+
+    if max_size <= 0:
+        return
+
+    values = {column: getattr(user, column) for column in CACHED_COLUMNS}
+    expires_at = time.monotonic() + config["USER_CACHE_TTL_SECONDS"]
+
+    with _lock:
+        _entries[user.id] = (expires_at, values)
+        _entries.move_to_end(user.id)
+
+        while len(_entries) > max_size:
+            _entries.popitem(last=False)
+
+
+def load(user_id: str) -> User | None:
+    values = _get(user_id)
+
+    if values is None:
+        user = db.session.get(User, user_id)
+
+        if user is not None:
+            _put(user)
+
+        return user
+
+    user = User(**values)
+    make_transient_to_detached(user)
+
+    # Returns the session's own instance if this request already loaded the user.
+    return db.session.merge(user, load=False)
+
+
+def invalidate(user_id: str) -> None:
+    with _lock:
+        _entries.pop(user_id, None)
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
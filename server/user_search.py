@@ -0,0 +1,212 @@
+# server/user_search.py
+"""
+Typeahead user search over normalized usernames and display names.
+
+Exact and prefix matches come from B-tree range scans on the casefolded
+`username_lower` / `display_name_lower` columns. Substring matches for queries
+of three or more characters come from a trigram index: an FTS5 `trigram` table
+on SQLite (`users_trgm`, keyed by an UNINDEXED `user_id` column, since VACUUM
+may renumber the implicit `users.rowid`) or pg_trgm GIN indexes on Postgres. The SQLite table is kept in sync by triggers rather than app
+hooks because the seed scripts insert users directly. Trigrams can't serve
+shorter queries, so those look for substrings with a LIKE scan that stops
+after SHORT_QUERY_SCAN_ROWS matching rows.
+
+Ranking (exact > prefix > substring, then username length) is done in SQL so
+the top results are always the best ones.
+"""
+
+from __future__ import annotations
+
+from flask import current_app
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.exc import DBAPIError
+
+from models import db, User
+
+SHORT_QUERY_SCAN_ROWS = 500
+
+_backend: str | None = None
+
+# user_id is unindexed, so the update and delete triggers scan users_trgm;
+# renames and account deletions are rare.
+_SQLITE_TRIGGERS = {
+    "users_trgm_insert": (
+        "CREATE TRIGGER users_trgm_insert AFTER INSERT ON users BEGIN "
+        "INSERT INTO users_trgm (user_id, username_lower, display_name_lower) "
+        "VALUES (new.id, new.username_lower, coalesce(new.display_name_lower, '')); "
+        "END"
+    ),
+    "users_trgm_update": (
+        "CREATE TRIGGER users_trgm_update AFTER UPDATE OF username_lower, display_name_lower ON users BEGIN "
+        "UPDATE users_trgm SET username_lower = new.username_lower, "
+        "display_name_lower = coalesce(new.display_name_lower, '') WHERE user_id = new.id; "
+        "END"
+    ),
+    "users_trgm_delete": (
+        "CREATE TRIGGER users_trgm_delete AFTER DELETE ON users BEGIN "
+        "DELETE FROM users_trgm WHERE user_id = old.id; "
+        "END"
+    ),
+}
+
+
+def normalize(value: str) -> str:
+    return value.strip().casefold()
+
+
+def ensure_index() -> None:
+    """Create the trigram index if missing; call once at startup."""
+    global _backend
+
+    dialect = db.engine.dialect.name
+
+    if dialect == "postgresql":
+        try:
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for column in ("username_lower", "display_name_lower"):
+                db.session.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_users_{column}_trgm "
+                    f"ON users USING GIN ({column} gin_trgm_ops)"
+                ))
+            db.session.commit()
+        except DBAPIError:
+            db.session.rollback()
+            current_app.logger.warning("pg_trgm unavailable; user substring search will scan")
+
+        _backend = "like"
+        return
+
+    if dialect != "sqlite":
+        _backend = "like"
+        return
+
+    columns = {row.name for row in db.session.execute(text("PRAGMA table_info(users_trgm)"))}
+
+    if "user_id" in columns:
+        _backend = "trigram"
+        return
+
+    if columns:
+        # An older index keyed by users.rowid, with triggers to match.
+        for name in _SQLITE_TRIGGERS:
+            db.session.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+        db.session.execute(text("DROP TABLE users_trgm"))
+
+    try:
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE users_trgm USING fts5("
+            "user_id UNINDEXED, username_lower, display_name_lower, tokenize = 'trigram')"
+        ))
+    except DBAPIError:
+        db.session.rollback()
+        current_app.logger.warning("SQLite trigram tokenizer unavailable; user substring search will scan")
+        _backend = "like"
+        return
+
+    for statement in _SQLITE_TRIGGERS.values():
+        db.session.execute(text(statement))
+
+    db.session.execute(text(
+        "INSERT INTO users_trgm (user_id, username_lower, display_name_lower) "
+        "SELECT id, username_lower, coalesce(display_name_lower, '') FROM users"
+    ))
+    db.session.commit()
+    _backend = "trigram"
+
+
+def _starts_with(column, prefix: str):
+    # A range instead of LIKE 'x%' so the plain B-tree index is usable on
+    # every backend regardless of LIKE case rules or collation.
+    return db.and_(column >= prefix, column < prefix + "\U0010ffff")
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _substring_ids(q: str, *, exclude_ids: list[str], limit: int) -> list[str]:
+    if _backend == "trigram" and len(q) >= 3:
+        quoted = q.replace('"', '""')
+        rows = db.session.execute(
+            text(
+                "SELECT users.id FROM users_trgm "
+                "JOIN users ON users.id = users_trgm.user_id "
+                "WHERE users_trgm MATCH :match AND users.id NOT IN :exclude_ids "
+                "ORDER BY length(users.username), users.username_lower "
+                "LIMIT :limit"
+            )
+            .bindparams(bindparam("exclude_ids", expanding=True, type_=User.id.type))
+            .columns(id=User.id.type),
+            {
+                "match": f'"{quoted}"',
+                "limit": limit,
+                "exclude_ids": exclude_ids,
+            },
+        )
+        return [row.id for row in rows]
+
+    pattern = f"%{_escape_like(q)}%"
+
+    candidates = select(User.id, User.username, User.username_lower).where(
+        User.id.not_in(exclude_ids),
+        db.or_(
+            User.username_lower.like(pattern, escape="\\"),
+            User.display_name_lower.like(pattern, escape="\\"),
+        ),
+    )
+
+    if len(q) < 3:
+        # No index helps here, so rank only the first matches the scan finds.
+        candidates = candidates.limit(SHORT_QUERY_SCAN_ROWS)
+
+    candidates = candidates.subquery()
+
+    return list(
+        db.session.scalars(
+            select(candidates.c.id)
+            .order_by(db.func.length(candidates.c.username), candidates.c.username_lower)
+            .limit(limit)
+        )
+    )
+
+
+def search_user_ids(query: str, *, exclude_user_id: str, limit: int = 7) -> list[str]:
+    """Return up to `limit` user ids matching `query`, best match first."""
+    q = normalize(query)
+
+    if not q:
+        return []
+
+    exact_or_prefix = list(
+        db.session.scalars(
+            select(User.id)
+            .where(
+                User.id != exclude_user_id,
+                db.or_(
+                    _starts_with(User.username_lower, q),
+                    _starts_with(User.display_name_lower, q),
+                ),
+            )
+            .order_by(
+                db.case(
+                    (User.username_lower == q, 0),
+                    (User.display_name_lower == q, 1),
+                    (_starts_with(User.username_lower, q), 2),
+                    else_=3,
+                ),
+                db.func.length(User.username),
+                User.username_lower,
+            )
+            .limit(limit)
+        )
+    )
+
+    if len(exact_or_prefix) >= limit:
+        return exact_or_prefix
+
+    return exact_or_prefix + _substring_ids(
+        q,
+        exclude_ids=[exclude_user_id, *exact_or_prefix],
+        limit=limit - len(exact_or_prefix),
+    )